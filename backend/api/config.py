@@ -3,3 +3,14 @@ import os
 TITLE = "WEISS Backend API"
 VERSION = "0.1.0"
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
+
+# git subprocesses run by the API at the same time (all repositories), and their timeouts (s)
+GIT_MAX_CONCURRENCY = int(os.getenv("GIT_MAX_CONCURRENCY", "8"))
+GIT_TIMEOUT = float(os.getenv("GIT_TIMEOUT", "30"))
+GIT_NETWORK_TIMEOUT = float(os.getenv("GIT_NETWORK_TIMEOUT", "300"))
+# staging repositories whose tree and status are computed at the same time by the aggregate tree
+STAGING_TREE_WORKERS = int(os.getenv("STAGING_TREE_WORKERS", "8"))
+# how changes made to staging working trees outside the API are noticed: "auto" (inotify, else
+# polling), "inotify", "poll" or "off", and the polling interval (s)
+STAGING_WATCH = os.getenv("STAGING_WATCH", "auto")
+STAGING_WATCH_POLL_INTERVAL = float(os.getenv("STAGING_WATCH_POLL_INTERVAL", "2"))
@@ -1,7 +1,13 @@
 import os
+import re
 import json
-from pydantic import BaseModel
-from typing import List, Optional, Literal, Tuple
+import gzip
+import time
+import hashlib
+import threading
+from urllib.parse import urlsplit
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from typing import Any, Callable, Dict, Iterator, List, Optional, Literal, Tuple, TypeVar
 from datetime import datetime
 
 REPOS_BASE_PATH = "/app/storage/repos"  # Abs path inside container - adjust if running locally
@@ -10,7 +16,13 @@ DEPLOYMENTS_REL_FOLDER = "deployments"
 SNAPSHOT_REL_FOLDER = "snapshot"
 CURRENT_SYMLINK = "current"
 DEPLOYMENT_META = "deployment.json"
+DEPLOYMENT_TREE = "deployment-tree.json"  # cached tree of the (immutable) snapshot
+DEPLOYMENT_FILES = "deployment-files.json"  # path -> git blob id of every file in the snapshot
+DEPLOYMENT_PVS = "deployment-pvs.json"  # macro-expanded PVs of every screen of the snapshot
+BLOBS_REL_FOLDER = ".blobs"  # pre-compressed (gzip) copies of the snapshot files, by blob id
 REPO_META = "repo.json"
+METADATA_FILES = [REPO_META, DEPLOYMENT_META, DEPLOYMENT_TREE, DEPLOYMENT_FILES, DEPLOYMENT_PVS]
+IGNORE_DIRS = {".git", ".hg", ".svn", "__pycache__", BLOBS_REL_FOLDER}
 NEW_FILE_CONTENT = [
     {
         "id": "__grid__",
@@ -62,11 +74,33 @@ class TreeNode(BaseModel):
     path: str  # path relative to repo/snapshot root
     type: Literal["file", "directory"]
     children: Optional[List["TreeNode"]] = None
+    # number of children of a directory listed without them (below the requested depth)
+    child_count: Optional[int] = None
+
+
+class TreeDelta(BaseModel):
+    base_version: str  # tree version the changes apply to
+    added: List[TreeNode] = []  # new or changed nodes, directories without children, parents first
+    removed: List[str] = []  # paths of removed nodes
+    status: List[GitFileStatus] = []  # new or changed working tree status entries
+    status_removed: List[str] = []  # paths no longer in the working tree status
+    dirty: bool
 
 
 class RepoTreeInfo(RepoInfo):
     tree: List[TreeNode]
     working_tree_status: Optional[GitWorkingTreeStatus] = None
+    tree_version: Optional[str] = None
+    # set (and tree left empty) when the changes since the client's tree version are sent instead
+    delta: Optional[TreeDelta] = None
+    # set when a paged listing has more entries: the cursor of the next page
+    next_cursor: Optional[str] = None
+
+
+class ScreenPVs(BaseModel):
+    pvs: List[str] = []  # macro-expanded
+    unresolved: List[str] = []  # PVs using macros the screen does not define
+    error: Optional[str] = None  # set if the screen could not be parsed
 
 
 class DeploymentInfo(BaseModel):
@@ -77,97 +111,508 @@ class DeploymentInfo(BaseModel):
     deployed_at: Optional[datetime]
 
 
-def build_path_tree(root_path: str, rel_path: str = "") -> List[TreeNode]:
-    """
-    Recursively build a directory tree starting at root_path/rel_path.
+T = TypeVar("T")
 
-    - Skips metadata directories (e.g. .git)
-    - Includes only .json files
-    - Paths are returned relative to root_path
+
+def _tree_key(is_dir: bool, name: str) -> Tuple[bool, str]:
+    """Order of the nodes of a directory: sub-directories first, then by name"""
+    return (not is_dir, name)
+
+
+def tree_entries(abs_path: str) -> List[os.DirEntry]:
+    """
+    Entries of a directory shown in trees: sub-directories (except metadata ones) first, then
+    .json files, by name. Empty if the directory does not exist.
     """
-    abs_path = os.path.join(root_path, rel_path)
-    nodes: List[TreeNode] = []
-    IGNORE_DIRS = {".git", ".hg", ".svn", "__pycache__"}
     try:
         entries = sorted(
             os.scandir(abs_path),
-            key=lambda e: (not e.is_dir(follow_symlinks=False), e.name),
+            key=lambda e: _tree_key(e.is_dir(follow_symlinks=False), e.name),
         )
     except FileNotFoundError:
         return []
 
+    shown: List[os.DirEntry] = []
     for entry in entries:
-        if entry.is_dir(follow_symlinks=False) and entry.name in IGNORE_DIRS:
-            continue
+        if entry.is_dir(follow_symlinks=False):
+            if entry.name not in IGNORE_DIRS:
+                shown.append(entry)
+        elif entry.name not in METADATA_FILES and entry.name.lower().endswith(".json"):
+            shown.append(entry)
+    return shown
 
-        entry_rel_path = os.path.join(rel_path, entry.name)
 
-        if entry.is_dir(follow_symlinks=False):
-            children = build_path_tree(root_path, entry_rel_path)
-            nodes.append(
-                TreeNode(
-                    name=entry.name,
-                    path=entry_rel_path,
-                    type="directory",
-                    children=children,
-                )
-            )
-        else:
-            if entry.name in [REPO_META, DEPLOYMENT_META] or not entry.name.lower().endswith(
-                ".json"
-            ):
-                continue
-
-            nodes.append(
-                TreeNode(
-                    name=entry.name,
-                    path=entry_rel_path,
-                    type="file",
-                )
-            )
+def _entry_node(
+    root_path: str, rel_path: str, entry: os.DirEntry, depth: Optional[int]
+) -> TreeNode:
+    if not entry.is_dir(follow_symlinks=False):
+        return TreeNode(name=entry.name, path=rel_path, type="file")
+    if depth is not None and depth <= 1:
+        return TreeNode(
+            name=entry.name,
+            path=rel_path,
+            type="directory",
+            child_count=len(tree_entries(entry.path)),
+        )
+    return TreeNode(
+        name=entry.name,
+        path=rel_path,
+        type="directory",
+        children=build_path_tree(root_path, rel_path, None if depth is None else depth - 1),
+    )
+
+
+def build_path_tree(
+    root_path: str, rel_path: str = "", depth: Optional[int] = None
+) -> List[TreeNode]:
+    """
+    Recursively build a directory tree starting at root_path/rel_path.
+
+    - Skips metadata directories (e.g. .git)
+    - Includes only .json files
+    - Paths are returned relative to root_path
+    - With a depth, directories `depth` levels down are not scanned: they are returned without
+      children but with their child_count
+    """
+    abs_path = os.path.join(root_path, rel_path)
+    return [
+        _entry_node(root_path, os.path.join(rel_path, entry.name), entry, depth)
+        for entry in tree_entries(abs_path)
+    ]
+
 
+def page_tree_level(
+    items: List[T],
+    key: Callable[[T], Tuple[bool, str]],
+    cursor: Optional[str],
+    limit: Optional[int],
+) -> Tuple[List[T], Optional[str]]:
+    """
+    Page of the entries of one directory, sorted by key: at most limit of them, after cursor.
+    Also returns the cursor of the next page, None on the last one.
+    Cursors are the key of the last entry of a page, so they stay valid when entries come and go.
+    """
+    if cursor is not None:
+        kind, sep, name = cursor.partition("/")
+        if not sep or kind not in ("0", "1"):
+            raise ValueError(f"Invalid cursor: {cursor}")
+        after = (kind == "1", name)
+        items = [item for item in items if key(item) > after]
+    if limit is None or len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    is_file, name = key(items[-1])
+    return items, f"{int(is_file)}/{name}"
+
+
+def list_path_tree(
+    root_path: str,
+    rel_path: str = "",
+    depth: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> Tuple[List[TreeNode], Optional[str]]:
+    """
+    Like build_path_tree, but only the directory root_path/rel_path can be paged (see
+    page_tree_level), and only the entries of the page are scanned.
+    Raises FileNotFoundError if rel_path is not a directory.
+    """
+    abs_path = os.path.join(root_path, rel_path)
+    if not os.path.isdir(abs_path):
+        raise FileNotFoundError(rel_path)
+
+    entries, next_cursor = page_tree_level(
+        tree_entries(abs_path),
+        lambda e: _tree_key(e.is_dir(follow_symlinks=False), e.name),
+        cursor,
+        limit,
+    )
+    nodes = [
+        _entry_node(root_path, os.path.join(rel_path, entry.name), entry, depth)
+        for entry in entries
+    ]
+    return nodes, next_cursor
+
+
+def limit_tree_depth(tree: List[TreeNode], depth: Optional[int]) -> List[TreeNode]:
+    """Copy of an in-memory tree cut like build_path_tree(depth=depth) would"""
+    if depth is None:
+        return tree
+    nodes: List[TreeNode] = []
+    for node in tree:
+        if node.type != "directory":
+            nodes.append(node)
+        elif depth <= 1:
+            count = len(node.children or [])
+            nodes.append(node.model_copy(update={"children": None, "child_count": count}))
+        else:
+            children = limit_tree_depth(node.children or [], depth - 1)
+            nodes.append(node.model_copy(update={"children": children}))
     return nodes
 
 
+def slice_tree(
+    tree: List[TreeNode],
+    rel_path: str = "",
+    depth: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> Tuple[List[TreeNode], Optional[str]]:
+    """
+    list_path_tree for an in-memory tree (e.g. a deployment tree).
+    Raises FileNotFoundError if rel_path is not a directory of the tree.
+    """
+    nodes = tree
+    for name in [part for part in rel_path.split("/") if part]:
+        node = next((n for n in nodes if n.name == name and n.type == "directory"), None)
+        if node is None:
+            raise FileNotFoundError(rel_path)
+        nodes = node.children or []
+
+    page, next_cursor = page_tree_level(
+        nodes, lambda n: _tree_key(n.type == "directory", n.name), cursor, limit
+    )
+    return limit_tree_depth(page, depth), next_cursor
+
+
+TREE_ADAPTER = TypeAdapter(List[TreeNode])
+
+
+def store_deployment_tree(snapshot_path: str) -> List[TreeNode]:
+    """
+    Build the tree of a deployment snapshot and persist it next to deployment.json.
+    Snapshots never change, so this only has to be done once per deployment.
+    """
+    tree = build_path_tree(snapshot_path)
+    tree_file = os.path.join(snapshot_path, DEPLOYMENT_TREE)
+    tmp_file = f"{tree_file}.tmp"
+    try:
+        with open(tmp_file, "wb") as f:
+            f.write(TREE_ADAPTER.dump_json(tree))
+        os.replace(tmp_file, tree_file)
+    except OSError:
+        # the tree is still returned, it will be rebuilt next time
+        pass
+    return tree
+
+
+def load_deployment_tree(snapshot_path: str) -> List[TreeNode]:
+    """Tree of a deployment snapshot, from the persisted copy if available"""
+    tree_file = os.path.join(snapshot_path, DEPLOYMENT_TREE)
+    try:
+        with open(tree_file, "rb") as f:
+            return TREE_ADAPTER.validate_json(f.read())
+    except (OSError, ValidationError):
+        return store_deployment_tree(snapshot_path)
+
+
+def iter_tree_files(tree: List[TreeNode]) -> Iterator[TreeNode]:
+    """All file nodes of a tree, depth first"""
+    for node in tree:
+        if node.type == "file":
+            yield node
+        elif node.children:
+            yield from iter_tree_files(node.children)
+
+
+def git_blob_id(content: bytes) -> str:
+    """Object id git gives to a file with this content (so ids match `git hash-object`)"""
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+def store_deployment_files(snapshot_path: str, tree: List[TreeNode]) -> Dict[str, str]:
+    """
+    Compute the blob id of every file of a deployment snapshot, write a gzip copy of each into
+    the .blobs folder and persist the path -> blob id map next to deployment.json.
+    """
+    files: Dict[str, str] = {}
+    blobs_path = os.path.join(snapshot_path, BLOBS_REL_FOLDER)
+    os.makedirs(blobs_path, exist_ok=True)
+    for node in iter_tree_files(tree):
+        with open(os.path.join(snapshot_path, node.path), "rb") as f:
+            content = f.read()
+        blob_id = git_blob_id(content)
+        files[node.path] = blob_id
+        gz_file = os.path.join(blobs_path, f"{blob_id}.gz")
+        if not os.path.exists(gz_file):
+            # written aside then renamed, so an existing blob is always complete; the name is
+            # unique to the writer as the same snapshot may be processed by concurrent requests
+            tmp_file = f"{gz_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_file, "wb") as f:
+                f.write(gzip.compress(content, compresslevel=9, mtime=0))
+            os.replace(tmp_file, gz_file)
+
+    files_file = os.path.join(snapshot_path, DEPLOYMENT_FILES)
+    tmp_file = f"{files_file}.tmp"
+    try:
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(files, f, indent=2)
+        os.replace(tmp_file, files_file)
+    except OSError:
+        pass
+    return files
+
+
+def load_deployment_files(snapshot_path: str) -> Dict[str, str]:
+    """path -> blob id map of a deployment snapshot, from the persisted copy if available"""
+    try:
+        with open(os.path.join(snapshot_path, DEPLOYMENT_FILES), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return store_deployment_files(snapshot_path, load_deployment_tree(snapshot_path))
+
+
+_MACRO_RE = re.compile(r"\$\(([^)]+)\)")
+SCREEN_PVS_ADAPTER = TypeAdapter(Dict[str, ScreenPVs])
+
+
+def substitute_macros(pv: str, macros: Dict[str, str]) -> str:
+    """Same substitution as the frontend: keys are the full macro text, e.g. "$(P)"."""
+    return _MACRO_RE.sub(lambda m: macros.get(m.group(0), m.group(0)), pv)
+
+
+def iter_widget_pvs(widgets: List[dict]) -> Iterator[Tuple[str, str]]:
+    """(widget id, PV name before macro substitution) of every PV of a widget tree"""
+    for widget in widgets:
+        properties = widget.get("properties") or {}
+        pv_name = properties.get("pvName")
+        if isinstance(pv_name, str) and pv_name:
+            yield widget.get("id", ""), pv_name
+        pv_names = properties.get("pvNames")
+        if isinstance(pv_names, dict):
+            pv_names = list(pv_names.values())
+        if isinstance(pv_names, list):
+            for pv in pv_names:
+                if isinstance(pv, str) and pv:
+                    yield widget.get("id", ""), pv
+        yield from iter_widget_pvs(widget.get("children") or [])
+
+
+def screen_macros(widgets: List[dict]) -> Dict[str, str]:
+    """Macros of a screen, defined on its GridZone"""
+    macros: Dict[str, str] = {}
+    for widget in widgets:
+        if widget.get("widgetName") == "GridZone":
+            macros = (widget.get("properties") or {}).get("macros") or {}
+    return macros
+
+
+def is_opi(content: Any) -> bool:
+    return isinstance(content, list) and all(isinstance(w, dict) for w in content)
+
+
+def screen_pv_usages(content: Any) -> Dict[str, List[str]]:
+    """Macro-expanded PV -> ids of the widgets using it, for an OPI document (list of widgets)"""
+    usages: Dict[str, List[str]] = {}
+    if not is_opi(content):
+        return usages
+    macros = screen_macros(content)
+    for widget_id, pv in iter_widget_pvs(content):
+        widgets = usages.setdefault(substitute_macros(pv, macros), [])
+        if widget_id not in widgets:
+            widgets.append(widget_id)
+    return usages
+
+
+def compile_screen(content: Any) -> ScreenPVs:
+    """Macro-expanded PV list of an OPI document (list of widgets)"""
+    if not is_opi(content):
+        return ScreenPVs(error="Not an OPI: expected a list of widgets")
+    pvs = screen_pv_usages(content).keys()
+    return ScreenPVs(
+        pvs=sorted(pv for pv in pvs if not _MACRO_RE.search(pv)),
+        unresolved=sorted(pv for pv in pvs if _MACRO_RE.search(pv)),
+    )
+
+
+def store_deployment_pvs(snapshot_path: str, tree: List[TreeNode]) -> Dict[str, ScreenPVs]:
+    """
+    Compile every screen of a deployment snapshot into its PV list and persist the index next to
+    deployment.json, so clients can subscribe to all PVs of a screen before rendering it.
+    """
+    screens: Dict[str, ScreenPVs] = {}
+    for node in iter_tree_files(tree):
+        try:
+            with open(os.path.join(snapshot_path, node.path), "r", encoding="utf-8") as f:
+                screens[node.path] = compile_screen(json.load(f))
+        except (OSError, ValueError) as e:
+            screens[node.path] = ScreenPVs(error=str(e))
+
+    pvs_file = os.path.join(snapshot_path, DEPLOYMENT_PVS)
+    tmp_file = f"{pvs_file}.tmp"
+    try:
+        with open(tmp_file, "wb") as f:
+            f.write(SCREEN_PVS_ADAPTER.dump_json(screens, exclude_defaults=True))
+        os.replace(tmp_file, pvs_file)
+    except OSError:
+        pass
+    return screens
+
+
+def load_deployment_pvs(snapshot_path: str) -> Dict[str, ScreenPVs]:
+    """PV index of a deployment snapshot, from the persisted copy if available"""
+    try:
+        with open(os.path.join(snapshot_path, DEPLOYMENT_PVS), "rb") as f:
+            return SCREEN_PVS_ADAPTER.validate_json(f.read())
+    except (OSError, ValidationError):
+        return store_deployment_pvs(snapshot_path, load_deployment_tree(snapshot_path))
+
+
+def normalize_git_url(git_url: str) -> str:
+    """
+    Canonical form of a git URL, so that the ssh and https URLs of a repository compare equal:
+    git@host:group/repo.git, ssh://git@host:22/group/repo and https://host/group/repo/ all give
+    host/group/repo. Local paths are only normalized.
+    """
+    url = git_url.strip()
+    if "://" in url:
+        parts = urlsplit(url)
+        if parts.scheme == "file":
+            return os.path.normpath(parts.path)
+        host, path = (parts.hostname or "").lower(), parts.path
+    elif re.match(r"^[^/]+:", url):
+        # scp-like syntax: [user@]host:path
+        host, _, path = url.partition(":")
+        host = host.rpartition("@")[2].lower()
+    else:
+        return os.path.normpath(url)
+    path = path.strip("/")
+    if path.endswith(".git"):
+        path = path[: -len(".git")]
+    return f"{host}/{path}"
+
+
+class RepoRegistry:
+    """
+    Registered repositories, loaded from the repo.json files once and then served from memory.
+    save() writes repo.json and updates the registry. Changes made to repo.json outside the API
+    are picked up by comparing mtimes: on every get() for that repo, on every find_by_url(), and
+    in a background thread for the whole listing, at most every REVALIDATE_INTERVAL seconds.
+    """
+
+    REVALIDATE_INTERVAL = 2.0
+
+    def __init__(self, base_path: str):
+        self.base_path = base_path
+        self._lock = threading.Lock()
+        # repo_id -> ((mtime, size) of repo.json, info)
+        self._repos: Dict[str, Tuple[Tuple[int, int], RepoInfo]] = {}
+        # normalized git URL -> repo_id
+        self._urls: Dict[str, str] = {}
+        # infos by creation date, replaced (never modified) whenever an entry changes
+        self._sorted: List[RepoInfo] = []
+        self._revalidated = 0.0
+        self._refreshing = False
+        self._refresh()
+
+    def _meta_file(self, repo_id: str) -> str:
+        return os.path.join(self.base_path, repo_id, REPO_META)
+
+    def _set(self, repo_id: str, entry: Optional[Tuple[Tuple[int, int], RepoInfo]]):
+        with self._lock:
+            old = self._repos.pop(repo_id, None)
+            if old and self._urls.get(normalize_git_url(old[1].git_url)) == repo_id:
+                del self._urls[normalize_git_url(old[1].git_url)]
+            if entry:
+                self._repos[repo_id] = entry
+                self._urls[normalize_git_url(entry[1].git_url)] = repo_id
+            if old or entry:
+                infos = (info for _, info in self._repos.values())
+                self._sorted = sorted(infos, key=lambda r: r.created_at)
+
+    def _revalidate(self, repo_id: str) -> Optional[RepoInfo]:
+        """Entry of a repo, re-read if its repo.json changed since it was loaded"""
+        meta_file = self._meta_file(repo_id)
+        try:
+            st = os.stat(meta_file)
+        except OSError:
+            self._set(repo_id, None)
+            return None
+        signature = (st.st_mtime_ns, st.st_size)
+        cached = self._repos.get(repo_id)
+        if cached and cached[0] == signature:
+            return cached[1]
+        try:
+            with open(meta_file, "r", encoding="utf-8") as f:
+                info = RepoInfo(**json.load(f))
+        except (OSError, ValueError, ValidationError) as e:
+            print(f"[RepoRegistry]: Cannot read {meta_file}: {e}")
+            return cached[1] if cached else None
+        self._set(repo_id, (signature, info))
+        return info
+
+    def _refresh(self):
+        """Pick up repositories added, changed or removed outside the API"""
+        self._revalidated = time.monotonic()
+        try:
+            repo_ids = set(os.listdir(self.base_path))
+        except FileNotFoundError:
+            repo_ids = set()
+        for repo_id in repo_ids | set(self._repos):
+            self._revalidate(repo_id)
+
+    def _refresh_in_background(self):
+        """_refresh() in a thread (it stats every repo.json), unless one is running already"""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self._refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def get(self, repo_id: str) -> RepoInfo:
+        """Copy of the info of a repo (safe to modify, then save()). Raises FileNotFoundError"""
+        info = self._revalidate(repo_id)
+        if info is None:
+            raise FileNotFoundError
+        return info.model_copy(deep=True)
+
+    def list(self) -> List[RepoInfo]:
+        """
+        Info of every repo, oldest first. The list and its entries are shared and must not be
+        modified (get() returns a copy to modify). Does not block: changes made outside the API
+        are picked up by a background refresh.
+        """
+        if time.monotonic() - self._revalidated > self.REVALIDATE_INTERVAL:
+            self._refresh_in_background()
+        return self._sorted
+
+    def find_by_url(self, git_url: str) -> Optional[str]:
+        """Id of the repo registered with this git URL (in any of its forms). Blocking"""
+        self._refresh()
+        with self._lock:
+            return self._urls.get(normalize_git_url(git_url))
+
+    def save(self, repo_info: RepoInfo):
+        """Write repo.json of a repo (atomically) and update the registry"""
+        meta_file = self._meta_file(repo_info.id)
+        tmp_file = f"{meta_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(repo_info.model_dump_json(indent=2))
+        os.replace(tmp_file, meta_file)
+        st = os.stat(meta_file)
+        self._set(repo_info.id, ((st.st_mtime_ns, st.st_size), repo_info.model_copy(deep=True)))
+
+
+REPO_REGISTRY = RepoRegistry(REPOS_BASE_PATH)
+
+
 def get_repo_info(repo_id: str) -> Tuple[(str, RepoInfo)]:
     """Get content of repository metadata file (repo.json)"""
-    meta_file_path = os.path.join(REPOS_BASE_PATH, repo_id, REPO_META)
-    if not os.path.exists(meta_file_path):
-        raise FileNotFoundError
-    with open(meta_file_path) as f:
-        repo_meta = json.load(f)
-    return meta_file_path, RepoInfo(**repo_meta)
+    return os.path.join(REPOS_BASE_PATH, repo_id, REPO_META), REPO_REGISTRY.get(repo_id)
+
+
+def save_repo_info(repo_info: RepoInfo):
+    """Write repository metadata file (repo.json)"""
+    REPO_REGISTRY.save(repo_info)
 
 
 def list_all_repositories() -> List[RepoInfo]:
     """List all registered repositories"""
-    repos = []
-    repos_base = os.path.join(REPOS_BASE_PATH)
-    if not os.path.exists(repos_base):
-        return repos
-
-    for repo_id in os.listdir(repos_base):
-        meta_file = os.path.join(repos_base, repo_id, REPO_META)
-        if os.path.exists(meta_file):
-            with open(meta_file, "r", encoding="utf-8") as f:
-                meta = json.load(f)
-                repos.append(
-                    RepoInfo(
-                        id=meta["id"],
-                        alias=meta["alias"],
-                        git_url=meta["git_url"],
-                        created_at=meta["created_at"],
-                        refs=meta["refs"],
-                        checked_out_ref=meta["checked_out_ref"],
-                        deployed_ref=meta.get("deployed_ref"),
-                        deployed_at=meta.get("deployed_at"),
-                        current_deployment=meta.get("current_deployment"),
-                    )
-                )
-    return repos
-
-
-REGISTERED_REPO_URLS = []
-# initialize registered repos on startup
-for repo in list_all_repositories():
-    REGISTERED_REPO_URLS.append(repo.git_url)
+    return REPO_REGISTRY.list()
@@ -1,27 +1,82 @@
 import os
 import json
-from fastapi import APIRouter, HTTPException, Query
-from typing import List
+import zlib
+import asyncio
+import hashlib
+import threading
+from collections import deque
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple
 from datetime import datetime
 from api.repos.common import (
     FileResponse,
     RepoInfo,
     RepoTreeInfo,
     DeploymentInfo,
-    build_path_tree,
+    TreeNode,
+    ScreenPVs,
     get_repo_info,
+    load_deployment_files,
+    load_deployment_pvs,
+    load_deployment_tree,
     list_all_repositories,
+    limit_tree_depth,
+    slice_tree,
     REPOS_BASE_PATH,
     DEPLOYMENTS_REL_FOLDER,
     CURRENT_SYMLINK,
     DEPLOYMENT_META,
+    BLOBS_REL_FOLDER,
 )
 
+from api.repos.pv_index import PVSearchResult, DEPLOYED_PV_INDEX
+
 router = APIRouter(
     prefix="/api/v1/repos/runtime",
     tags=["OPI Repositories"],
 )
 
+# repo_id -> (deployment snapshot path, {key: value derived from the snapshot}). Snapshots are
+# immutable, so an entry is only replaced when the current symlink points to another deployment.
+_deployment_cache: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+_deployment_cache_lock = threading.Lock()
+
+# files of a deployment may change on the next deploy: clients must revalidate (cheap, see ETag)
+FILE_CACHE_CONTROL = "no-cache"
+# blobs are addressed by their content and never change
+BLOB_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+# files read in parallel by a bulk request
+BULK_READ_CONCURRENCY = 8
+
+TREE_PATH = Query(None, description="Only list this directory (relative to snapshot root)")
+TREE_DEPTH = Query(
+    None, ge=1, description="Levels listed; deeper directories come with their child_count only"
+)
+TREE_CURSOR = Query(None, description="next_cursor of the previous page")
+TREE_LIMIT = Query(None, ge=1, le=10000, description="Maximum entries of the listed directory")
+
+
+class DeploymentFiles(BaseModel):
+    deployment_id: str
+    commit_hash: str
+    files: Dict[str, str]  # path -> blob id, see /{repo_id}/blob/{blob_id}
+
+
+class DeploymentPVIndex(BaseModel):
+    deployment_id: str
+    screens: Dict[str, ScreenPVs]  # screen path -> PVs
+
+
+class BulkFileRequest(BaseModel):
+    paths: List[str] = Field([], description="Paths of files to return")
+    prefix: Optional[str] = Field(
+        None, description="Also return every file under this directory ('' for all files)"
+    )
+
 
 # ---------------------------------------------------------------------------
 # Helpers
@@ -36,6 +91,70 @@ def get_current_snapshot_path(repo_id: str) -> str:
     return current_link
 
 
+def deployment_cached(repo_id: str, key: str, compute: Callable[[str], Any]) -> Any:
+    """
+    Value derived from the currently deployed snapshot of a repo, computed once per deployment
+    by compute(snapshot_path).
+    """
+    snapshot_path = os.path.realpath(get_current_snapshot_path(repo_id))
+    with _deployment_cache_lock:
+        entry = _deployment_cache.get(repo_id)
+        if entry is None or entry[0] != snapshot_path:
+            entry = (snapshot_path, {})
+            _deployment_cache[repo_id] = entry
+        if key in entry[1]:
+            return entry[1][key]
+
+    value = compute(snapshot_path)
+    with _deployment_cache_lock:
+        entry[1][key] = value
+    return value
+
+
+def get_current_tree(repo_id: str) -> List[TreeNode]:
+    """Tree of the currently deployed snapshot of a repo"""
+    return deployment_cached(repo_id, "tree", load_deployment_tree)
+
+
+def get_current_files(repo_id: str) -> Dict[str, str]:
+    """path -> blob id of every file of the currently deployed snapshot"""
+    return deployment_cached(repo_id, "files", load_deployment_files)
+
+
+def get_current_blobs(repo_id: str) -> Dict[str, str]:
+    """blob id -> path, reverse of get_current_files"""
+    return deployment_cached(
+        repo_id, "blobs", lambda _: {v: k for k, v in get_current_files(repo_id).items()}
+    )
+
+
+def get_current_pvs(repo_id: str) -> Dict[str, ScreenPVs]:
+    """screen path -> PVs of the currently deployed snapshot"""
+    return deployment_cached(repo_id, "pvs", load_deployment_pvs)
+
+
+def get_current_commit(repo_id: str) -> str:
+    return deployment_cached(
+        repo_id, "commit_hash", lambda _: get_current_deployment_meta(repo_id)["commit_hash"]
+    )
+
+
+def file_etag(commit_hash: str, path: str) -> str:
+    """Strong ETag of a deployed file: the content is fully determined by commit and path"""
+    return '"%s"' % hashlib.sha1(f"{commit_hash}:{os.path.normpath(path)}".encode()).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, as required for GET)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag for candidate in if_none_match.split(",")
+    )
+
+
 def get_current_deployment_meta(repo_id: str) -> dict:
     """
     Return the metadata from deployment.json for the current deployment.
@@ -64,27 +183,54 @@ def list_repositories():
 
 
 @router.get("/tree", response_model=List[RepoTreeInfo], operation_id="getAllDeployedReposTree")
-def get_all_repos_tree():
+def get_all_repos_tree(depth: Optional[int] = TREE_DEPTH):
     all_trees = []
     for repo in list_all_repositories():
         if repo.current_deployment is not None:
-            snapshot_path = get_current_snapshot_path(repo.id)
-            tree = build_path_tree(snapshot_path)
+            tree = limit_tree_depth(get_current_tree(repo.id), depth)
             all_trees.append(RepoTreeInfo(**repo.model_dump(), tree=tree))
     return all_trees
 
 
+@router.get("/pvs", response_model=List[PVSearchResult], operation_id="searchDeployedPVs")
+def search_deployed_pvs(
+    q: str = Query(..., min_length=1, description="PV name prefix or substring"),
+    mode: Literal["prefix", "substring"] = Query("prefix"),
+    repo_id: Optional[str] = Query(None, description="Only search this repository"),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of PVs returned"),
+):
+    """
+    Find the PVs (macro-expanded) used by the currently deployed OPIs, with the screens and
+    widgets using them.
+    """
+    for repo in list_all_repositories():
+        if repo.current_deployment is not None and repo_id in (None, repo.id):
+            snapshot_path = os.path.realpath(get_current_snapshot_path(repo.id))
+            DEPLOYED_PV_INDEX.ensure_repo(repo.id, snapshot_path)
+    return DEPLOYED_PV_INDEX.search(q, mode, repo_id, limit)
+
+
 @router.get(
     "/{repo_id}/tree",
     response_model=RepoTreeInfo,
     operation_id="getDeployedRepoTree",
 )
-def get_deployed_repo_tree(repo_id: str):
+def get_deployed_repo_tree(
+    repo_id: str,
+    path: Optional[str] = TREE_PATH,
+    depth: Optional[int] = TREE_DEPTH,
+    cursor: Optional[str] = TREE_CURSOR,
+    limit: Optional[int] = TREE_LIMIT,
+):
     """
     Return the full tree of the currently deployed snapshot
     for a single repository, wrapped in RepoTreeInfo.
+    path, depth, cursor and limit select a part of it (see slice_tree).
     """
-    repo = get_repo_info(repo_id)
+    try:
+        _, repo = get_repo_info(repo_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Repository not found")
 
     if repo.current_deployment is None:
         raise HTTPException(
@@ -92,22 +238,43 @@ def get_deployed_repo_tree(repo_id: str):
             detail="Repository has no active deployment",
         )
 
-    snapshot_path = get_current_snapshot_path(repo_id)
-    tree = build_path_tree(snapshot_path)
+    rel_path = os.path.normpath(path).lstrip(os.sep) if path else ""
+    try:
+        tree, next_cursor = slice_tree(
+            get_current_tree(repo_id), "" if rel_path == "." else rel_path, depth, cursor, limit
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Directory not found in snapshot")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     return RepoTreeInfo(
         **repo.model_dump(),
         tree=tree,
+        next_cursor=next_cursor,
     )
 
 
 @router.get("/{repo_id}/file", response_model=FileResponse, operation_id="getDeployedRepoFile")
 def runtime_get_repo_file(
-    repo_id: str, path: str = Query(..., description="Path to file inside repository")
+    response: Response,
+    repo_id: str,
+    path: str = Query(..., description="Path to file inside repository"),
+    if_none_match: Optional[str] = Header(None),
 ):
     """
     Return the content of a file from the currently deployed snapshot.
+    Responses carry an ETag; a matching If-None-Match is answered with 304 without reading the file.
+    The X-Blob-Id header names the immutable copy of the content, see /{repo_id}/blob/{blob_id}.
     """
+    etag = file_etag(get_current_commit(repo_id), path)
+    blob_id = get_current_files(repo_id).get(os.path.normpath(path))
+    headers = {"ETag": etag, "Cache-Control": FILE_CACHE_CONTROL}
+    if blob_id:
+        headers["X-Blob-Id"] = blob_id
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+
     snapshot_path = get_current_snapshot_path(repo_id)
     full_path = os.path.join(snapshot_path, path)
     if not os.path.exists(full_path) or not os.path.isfile(full_path):
@@ -116,9 +283,148 @@ def runtime_get_repo_file(
     with open(full_path, "r", encoding="utf-8") as f:
         content = f.read()
 
+    response.headers.update(headers)
     return FileResponse(path=path, content=content)
 
 
+@router.get(
+    "/{repo_id}/files", response_model=DeploymentFiles, operation_id="getDeployedRepoFiles"
+)
+def get_deployed_repo_files(repo_id: str):
+    """
+    Return the blob id of every file of the currently deployed snapshot.
+    """
+    meta = get_current_deployment_meta(repo_id)
+    return DeploymentFiles(
+        deployment_id=meta["deployment_id"],
+        commit_hash=meta["commit_hash"],
+        files=get_current_files(repo_id),
+    )
+
+
+@router.get("/{repo_id}/pvs", response_model=DeploymentPVIndex, operation_id="getDeployedRepoPVs")
+def get_deployed_repo_pvs(
+    repo_id: str,
+    path: Optional[str] = Query(None, description="Only return the PVs of this screen"),
+):
+    """
+    Return the macro-expanded PVs of every screen of the currently deployed snapshot (compiled at
+    deploy time), so a client can subscribe to all PVs of a screen as soon as it is requested.
+    """
+    meta = get_current_deployment_meta(repo_id)
+    screens = get_current_pvs(repo_id)
+    if path is not None:
+        path = os.path.normpath(path)
+        if path not in screens:
+            raise HTTPException(status_code=404, detail="File not found in snapshot")
+        screens = {path: screens[path]}
+    return DeploymentPVIndex(deployment_id=meta["deployment_id"], screens=screens)
+
+
+def select_files(files: Dict[str, str], request: BulkFileRequest) -> List[str]:
+    """Requested paths followed by the files under the prefix, without duplicates"""
+    selected = [os.path.normpath(path).lstrip(os.sep) for path in request.paths]
+    if request.prefix is not None:
+        prefix = request.prefix.strip("/") and os.path.normpath(request.prefix).lstrip(os.sep)
+        selected += sorted(p for p in files if not prefix or p.startswith(prefix + "/"))
+    return list(dict.fromkeys(selected))
+
+
+def read_bulk_line(snapshot_path: str, files: Dict[str, str], path: str) -> bytes:
+    """One NDJSON line of a bulk response: the file (as FileResponse) or an error"""
+    if path not in files:
+        line = {"path": path, "error": "File not found in snapshot"}
+    else:
+        try:
+            with open(os.path.join(snapshot_path, path), "r", encoding="utf-8") as f:
+                line = FileResponse(path=path, content=f.read()).model_dump()
+        except (OSError, UnicodeDecodeError) as e:
+            line = {"path": path, "error": str(e)}
+    return json.dumps(line).encode("utf-8") + b"\n"
+
+
+@router.post("/{repo_id}/files/bulk", operation_id="getDeployedRepoFilesBulk")
+def get_deployed_repo_files_bulk(
+    repo_id: str, request: BulkFileRequest, accept_encoding: Optional[str] = Header(None)
+):
+    """
+    Return many files of the currently deployed snapshot in one response, as newline delimited
+    JSON: one FileResponse object per line, in the requested order, or {"path", "error"} for a
+    path that cannot be read. Gzip compressed when the client accepts it.
+    """
+    snapshot_path = os.path.realpath(get_current_snapshot_path(repo_id))
+    files = get_current_files(repo_id)
+    paths = select_files(files, request)
+    compress = "gzip" in (accept_encoding or "")
+
+    async def stream():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        reads: deque = deque()
+        remaining = iter(paths)
+        while True:
+            # keep up to BULK_READ_CONCURRENCY reads in flight, send them in order
+            for path in remaining:
+                read = asyncio.to_thread(read_bulk_line, snapshot_path, files, path)
+                reads.append(asyncio.create_task(read))
+                if len(reads) >= BULK_READ_CONCURRENCY:
+                    break
+            if not reads:
+                break
+            line = await reads.popleft()
+            chunk = compressor.compress(line) if compressor else line
+            if chunk:
+                yield chunk
+        if compressor:
+            yield compressor.flush()
+
+    headers = {"Vary": "Accept-Encoding", "X-File-Count": str(len(paths))}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(stream(), media_type="application/x-ndjson", headers=headers)
+
+
+@router.get(
+    "/{repo_id}/blob/{blob_id}",
+    response_class=Response,
+    responses={200: {"content": {"application/json": {}}}, 304: {}},
+    operation_id="getDeployedRepoBlob",
+)
+def get_deployed_repo_blob(
+    repo_id: str,
+    blob_id: str,
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Return the raw content of a file of the currently deployed snapshot by its blob id (git
+    object id). The content behind a blob id never changes, so responses may be cached forever;
+    unchanged files keep their blob id across deployments.
+    The gzip copy made at deploy time is sent when the client accepts it.
+    """
+    path = get_current_blobs(repo_id).get(blob_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Blob not found in current deployment")
+
+    headers = {
+        "ETag": f'"{blob_id}"',
+        "Cache-Control": BLOB_CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    snapshot_path = get_current_snapshot_path(repo_id)
+    gz_file = os.path.join(snapshot_path, BLOBS_REL_FOLDER, f"{blob_id}.gz")
+    if "gzip" in (accept_encoding or "") and os.path.isfile(gz_file):
+        with open(gz_file, "rb") as f:
+            content = f.read()
+        headers["Content-Encoding"] = "gzip"
+    else:
+        with open(os.path.join(snapshot_path, path), "rb") as f:
+            content = f.read()
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
 @router.get(
     "/{repo_id}/info", response_model=DeploymentInfo, operation_id="getCurrentDeploymentInfo"
 )
@@ -0,0 +1,153 @@
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from pydantic import BaseModel
+from typing import AsyncIterator, Dict, List, Optional
+from api.config import GIT_MAX_CONCURRENCY, GIT_TIMEOUT, GIT_NETWORK_TIMEOUT
+
+# subcommands talking to a remote get the longer timeout
+NETWORK_COMMANDS = {"clone", "fetch", "pull", "push", "ls-remote"}
+# queries (e.g. status) run under a shared lock and must not rewrite the index
+GIT_ENV = {**os.environ, "GIT_OPTIONAL_LOCKS": "0"}
+
+
+class GitCommandStats(BaseModel):
+    command: str
+    calls: int = 0
+    failures: int = 0
+    timeouts: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    waiting: int = 0  # calls currently queued for a worker slot
+
+
+class RWLock:
+    """
+    Readers-writer lock for asyncio: any number of readers or a single writer.
+    Waiting writers block new readers, so mutations are not starved by a stream of reads.
+    `generation` counts the writers admitted: state read under an older generation may be stale.
+    """
+
+    def __init__(self):
+        self.generation = 0
+        self._cond = asyncio.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @asynccontextmanager
+    async def read(self) -> AsyncIterator[None]:
+        async with self._cond:
+            await self._cond.wait_for(lambda: not self._writer and not self._writers_waiting)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._readers -= 1
+                self._cond.notify_all()
+
+    @asynccontextmanager
+    async def write(self) -> AsyncIterator[None]:
+        async with self._cond:
+            self._writers_waiting += 1
+            try:
+                await self._cond.wait_for(lambda: not self._writer and not self._readers)
+            finally:
+                self._writers_waiting -= 1
+            self._writer = True
+            self.generation += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class GitExecutor:
+    """
+    Runs git as asyncio subprocesses: at most `max_concurrency` at a time over all repositories,
+    each with a timeout, timed per subcommand. Endpoints hold the lock of the repository they work
+    on (read() for queries, write() for anything changing the working tree, index or refs).
+    """
+
+    def __init__(self, max_concurrency: int, timeout: float, network_timeout: float):
+        self.timeout = timeout
+        self.network_timeout = network_timeout
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._locks: Dict[str, RWLock] = {}
+        self._stats: Dict[str, GitCommandStats] = {}
+
+    def lock(self, repo_id: str) -> RWLock:
+        if repo_id not in self._locks:
+            self._locks[repo_id] = RWLock()
+        return self._locks[repo_id]
+
+    def generation(self, repo_id: str) -> int:
+        """Changes whenever a writer of the repo starts"""
+        return self.lock(repo_id).generation
+
+    def read(self, repo_id: str):
+        return self.lock(repo_id).read()
+
+    def write(self, repo_id: str):
+        return self.lock(repo_id).write()
+
+    async def run(self, cmd: List[str], cwd: Optional[str] = None, strip: bool = True) -> str:
+        """Run git command and raise exception on failure"""
+        output = (await self.run_bytes(cmd, cwd)).decode("utf-8", errors="replace")
+        return output.strip() if strip else output
+
+    async def run_bytes(self, cmd: List[str], cwd: Optional[str] = None) -> bytes:
+        """Run git command, return its raw output and raise exception on failure"""
+        subcommand = cmd[0] if cmd else ""
+        stats = self._stats.setdefault(subcommand, GitCommandStats(command=subcommand))
+        timeout = self.network_timeout if subcommand in NETWORK_COMMANDS else self.timeout
+
+        stats.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            stats.waiting -= 1
+        started = time.perf_counter()
+        try:
+            process = await asyncio.create_subprocess_exec(
+                "git",
+                *cmd,
+                cwd=cwd,
+                env=GIT_ENV,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                stats.timeouts += 1
+                raise HTTPException(
+                    status_code=504, detail=f"Git command timed out after {timeout}s: {subcommand}"
+                )
+        finally:
+            self._slots.release()
+            elapsed = time.perf_counter() - started
+            stats.calls += 1
+            stats.total_seconds += elapsed
+            stats.max_seconds = max(stats.max_seconds, elapsed)
+
+        if process.returncode != 0:
+            stats.failures += 1
+            raise HTTPException(
+                status_code=500, detail=f"Git command failed: {stderr.decode(errors='replace')}"
+            )
+        return stdout
+
+    def stats(self) -> List[GitCommandStats]:
+        return sorted(self._stats.values(), key=lambda s: s.total_seconds, reverse=True)
+
+
+GIT = GitExecutor(GIT_MAX_CONCURRENCY, GIT_TIMEOUT, GIT_NETWORK_TIMEOUT)
@@ -0,0 +1,355 @@
+import os
+import heapq
+import asyncio
+import itertools
+import threading
+import subprocess
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from pydantic import BaseModel
+from typing import Dict, List, Literal, Optional, Tuple
+from api.repos.git_executor import GIT, GIT_ENV
+
+# refs names are tried in this order, like git rev-parse does
+DWIM_RULES = [
+    "{}",
+    "refs/{}",
+    "refs/tags/{}",
+    "refs/heads/{}",
+    "refs/remotes/{}",
+    "refs/remotes/{}/HEAD",
+]
+HEX_DIGITS = set("0123456789abcdef")
+# latest commits of the default branch listed with the tags
+LISTED_COMMITS = 20
+# for-each-ref fields of a tag, describing the commit it points to (through annotated tags)
+TAG_FORMAT = "%00".join(
+    ["%(refname:short)"]
+    + [
+        f"%(if)%(*objectname)%(then)%(*{field})%(else)%({field})%(end)"
+        for field in ("objectname", "authorname", "authordate:iso-strict", "subject")
+    ]
+)
+
+
+class GitRef(BaseModel):
+    name: str  # tag name, or commit id of an untagged commit
+    type: Literal["tag", "commit"]
+    commit: str
+    author: str
+    date: str  # author date, ISO 8601
+    subject: str
+
+
+class GitReaderError(Exception):
+    """The reader cannot answer (unsupported repository format, dead cat-file...)"""
+
+
+def is_object_id(value: str) -> bool:
+    return len(value) == 40 and set(value) <= HEX_DIGITS
+
+
+def parse_commit(content: bytes) -> Tuple[List[str], int]:
+    """Parents and committer timestamp of a commit object"""
+    parents: List[str] = []
+    timestamp = 0
+    for line in content.split(b"\n"):
+        if not line:
+            break
+        if line.startswith(b"parent "):
+            parents.append(line[7:].decode())
+        elif line.startswith(b"committer "):
+            timestamp = int(line.rsplit(b" ", 2)[1])
+    return parents, timestamp
+
+
+class CatFile:
+    """A `git cat-file --batch` process of a repository, started on first use"""
+
+    def __init__(self, repo_path: str):
+        self.repo_path = repo_path
+        self._lock = threading.Lock()
+        self._process: Optional[subprocess.Popen] = None
+
+    def _start(self) -> subprocess.Popen:
+        if self._process is None or self._process.poll() is not None:
+            self._process = subprocess.Popen(
+                ["git", "cat-file", "--batch"],
+                cwd=self.repo_path,
+                env=GIT_ENV,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        return self._process
+
+    def read(self, object_id: str) -> Optional[Tuple[str, bytes]]:
+        """(type, content) of an object, None if it does not exist. Blocking."""
+        with self._lock:
+            try:
+                process = self._start()
+                process.stdin.write(object_id.encode() + b"\n")
+                process.stdin.flush()
+                header = process.stdout.readline().split()
+                if len(header) == 2 and header[1] == b"missing":
+                    return None
+                if len(header) != 3:
+                    raise GitReaderError(f"Unexpected cat-file output: {header}")
+                size = int(header[2])
+                content = process.stdout.read(size + 1)
+                if len(content) != size + 1:
+                    raise GitReaderError("cat-file exited")
+                return header[1].decode(), content[:-1]
+            except (OSError, ValueError, GitReaderError):
+                self.close()
+                raise GitReaderError(f"cat-file of {self.repo_path} failed")
+
+    def close(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+
+
+class GitReader:
+    """
+    Read-only queries on a repository without forking git for each: refs are read from the files
+    of the git directory (loose refs and packed-refs), objects from a long-running
+    `git cat-file --batch`. Queries it cannot answer (reftable refs, revision expressions, a dead
+    cat-file process...) fall back to one-shot git commands.
+    """
+
+    def __init__(self, repo_path: str):
+        self.repo_path = repo_path
+        self.git_dir = os.path.join(repo_path, ".git")
+        self._cat_file = CatFile(repo_path)
+        # (refs signature, listing) of the last ref listing
+        self._listing: Optional[Tuple[tuple, List[GitRef]]] = None
+
+    # refs
+
+    def _packed_refs(self) -> Dict[str, str]:
+        refs: Dict[str, str] = {}
+        try:
+            with open(os.path.join(self.git_dir, "packed-refs"), "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.startswith(("#", "^")):
+                        continue  # header, peeled tag
+                    object_id, _, name = line.rstrip("\n").partition(" ")
+                    refs[name] = object_id
+        except FileNotFoundError:
+            pass
+        return refs
+
+    def _read_ref(self, name: str) -> Optional[str]:
+        """Content of a ref: object id, or "ref: <target>" for symbolic refs. None if missing"""
+        if not os.path.isdir(self.git_dir) or os.path.isdir(os.path.join(self.git_dir, "reftable")):
+            # worktree/submodule (.git file) or reftable repositories
+            raise GitReaderError("Unsupported repository layout")
+        try:
+            with open(os.path.join(self.git_dir, name), "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            if name.startswith("refs/"):
+                return self._packed_refs().get(name)
+            return None
+
+    def _resolve_ref(self, name: str) -> Optional[str]:
+        """Object id a ref points to, following symbolic refs"""
+        for _ in range(5):
+            value = self._read_ref(name)
+            if value is None or not value.startswith("ref: "):
+                return value
+            name = value[5:]
+        raise GitReaderError(f"Symbolic ref loop at {name}")
+
+    async def head(self) -> str:
+        """Commit checked out, like `git rev-parse HEAD`"""
+        try:
+            object_id = self._resolve_ref("HEAD")
+            if object_id and is_object_id(object_id):
+                return object_id
+        except GitReaderError:
+            pass
+        return await GIT.run(["rev-parse", "HEAD"], cwd=self.repo_path)
+
+    async def symbolic_ref(self, name: str) -> str:
+        """Target of a symbolic ref, like `git symbolic-ref <name>`"""
+        try:
+            value = self._read_ref(name)
+            if value and value.startswith("ref: "):
+                return value[5:]
+        except GitReaderError:
+            pass
+        return await GIT.run(["symbolic-ref", name], cwd=self.repo_path)
+
+    def _refs_signature(self) -> tuple:
+        """
+        Changes whenever a ref is created, updated or deleted: refs are written by renaming a lock
+        file into their directory, which updates its mtime, or by rewriting packed-refs
+        """
+        values = []
+        for name in ("packed-refs", "HEAD"):
+            try:
+                values.append(os.stat(os.path.join(self.git_dir, name)).st_mtime_ns)
+            except OSError:
+                values.append(None)
+        for dirpath, _, _ in os.walk(os.path.join(self.git_dir, "refs")):
+            values.append((dirpath, os.stat(dirpath).st_mtime_ns))
+        return tuple(values)
+
+    async def ref_listing(self) -> List[GitRef]:
+        """
+        Tags (by name) and the latest untagged commits of the default branch, with the author,
+        date and subject of their commit. Computed again only when refs changed.
+        """
+        try:
+            signature = self._refs_signature()
+        except OSError:
+            signature = None
+        if signature is not None and self._listing and self._listing[0] == signature:
+            return self._listing[1]
+
+        tag_output = await GIT.run(
+            ["for-each-ref", "--sort=refname", f"--format={TAG_FORMAT}", "refs/tags"],
+            cwd=self.repo_path,
+        )
+        listing = [
+            GitRef(name=name, type="tag", commit=commit, author=author, date=date, subject=subject)
+            for name, commit, author, date, subject in (
+                # one line per tag (splitlines() would also split on e.g. \f in a subject)
+                line.split("\0", 4)
+                for line in tag_output.split("\n")
+                if line
+            )
+        ]
+
+        default_branch = await self.symbolic_ref("refs/remotes/origin/HEAD")
+        # the walk stops where tagged history starts, instead of listing all of it
+        untagged_cmd = ["rev-list", f"--max-count={LISTED_COMMITS}", default_branch, "--not"]
+        untagged = set((await GIT.run(untagged_cmd + ["--tags"], cwd=self.repo_path)).split())
+        for commit in await self.rev_list(default_branch, LISTED_COMMITS):
+            if commit in untagged:
+                listing.append(GitRef(name=commit, type="commit", **await self.commit_info(commit)))
+
+        if signature is not None:
+            self._listing = (signature, listing)
+        return listing
+
+    # objects
+
+    async def read_object(self, object_id: str) -> Optional[Tuple[str, bytes]]:
+        """(type, content) of an object, None if it does not exist"""
+        try:
+            return await asyncio.to_thread(self._cat_file.read, object_id)
+        except GitReaderError as e:
+            print(f"[GitReader]: {e}, falling back to one-shot git")
+        try:
+            object_type = await GIT.run(["cat-file", "-t", object_id], cwd=self.repo_path)
+        except HTTPException as e:
+            if e.status_code != 500:  # e.g. timed out
+                raise
+            return None  # not a valid object name
+        content = await GIT.run_bytes(["cat-file", object_type, object_id], cwd=self.repo_path)
+        return object_type, content
+
+    async def commit_info(self, object_id: str) -> Dict[str, str]:
+        """commit, author, date (ISO 8601) and subject of a commit"""
+        found = await self.read_object(object_id)
+        if found is None or found[0] != "commit":
+            raise GitReaderError(f"Not a commit: {object_id}")
+        headers, _, message = found[1].partition(b"\n\n")
+        author, date = "", ""
+        for line in headers.split(b"\n"):
+            if line.startswith(b"author "):
+                # author <name> <<email>> <timestamp> <+hhmm>
+                ident, timestamp, offset = line[7:].decode(errors="replace").rsplit(" ", 2)
+                author = ident.rsplit(" <", 1)[0]
+                minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+                tz = timezone(timedelta(minutes=-minutes if offset[0] == "-" else minutes))
+                date = datetime.fromtimestamp(int(timestamp), tz).isoformat()
+        paragraph = message.decode(errors="replace").strip().split("\n\n", 1)[0]
+        subject = " ".join(line.strip() for line in paragraph.split("\n"))
+        return {"commit": object_id, "author": author, "date": date, "subject": subject}
+
+    async def peel(self, object_id: str) -> str:
+        """Commit an object id (of a commit or annotated tag) points to"""
+        for _ in range(10):
+            found = await self.read_object(object_id)
+            if found is None:
+                raise GitReaderError(f"Object not found: {object_id}")
+            if found[0] != "tag":
+                return object_id
+            object_id = found[1].split(b"\n", 1)[0].split(b" ", 1)[1].decode()
+        raise GitReaderError(f"Tag chain too long at {object_id}")
+
+    async def rev_parse(self, rev: str) -> str:
+        """Commit of a ref name or object id, like `git rev-parse <rev>^{commit}`"""
+        try:
+            if is_object_id(rev):
+                return await self.peel(rev)
+            if ".." in rev or rev.startswith("/") or "\\" in rev:
+                raise GitReaderError(f"Not a ref name: {rev}")
+            for rule in DWIM_RULES:
+                object_id = self._resolve_ref(rule.format(rev))
+                if object_id and is_object_id(object_id):
+                    return await self.peel(object_id)
+        except GitReaderError:
+            pass
+        return await GIT.run(["rev-parse", rev + "^{commit}"], cwd=self.repo_path)
+
+    async def rev_list(self, rev: str, max_count: int) -> List[str]:
+        """Latest commits reachable from rev, like `git rev-list --max-count=<n> <rev>`"""
+        start = await self.rev_parse(rev)
+        try:
+            return await self._walk(start, max_count)
+        except GitReaderError:
+            # e.g. shallow history
+            output = await GIT.run(
+                ["rev-list", f"--max-count={max_count}", start], cwd=self.repo_path
+            )
+            return output.splitlines() if output else []
+
+    async def _walk(self, start: str, max_count: int) -> List[str]:
+        """Commits by decreasing committer date from start, the order of git's default walk"""
+        order = itertools.count()
+        queue: List[Tuple[int, int, str]] = []
+        parents_of: Dict[str, List[str]] = {}
+
+        async def push(object_id: str):
+            found = await self.read_object(object_id)
+            if found is None or found[0] != "commit":
+                raise GitReaderError(f"Not a commit: {object_id}")
+            parents_of[object_id], timestamp = parse_commit(found[1])
+            # commits with equal dates stay in the order they were reached
+            heapq.heappush(queue, (-timestamp, next(order), object_id))
+
+        await push(start)
+        commits: List[str] = []
+        while queue and len(commits) < max_count:
+            _, _, object_id = heapq.heappop(queue)
+            commits.append(object_id)
+            for parent in parents_of[object_id]:
+                if parent not in parents_of:
+                    await push(parent)
+        return commits
+
+    def close(self):
+        self._cat_file.close()
+
+
+class GitReaders:
+    """One GitReader per repository path"""
+
+    def __init__(self):
+        self._readers: Dict[str, GitReader] = {}
+        self._lock = threading.Lock()
+
+    def get(self, repo_path: str) -> GitReader:
+        with self._lock:
+            if repo_path not in self._readers:
+                self._readers[repo_path] = GitReader(repo_path)
+            return self._readers[repo_path]
+
+
+GIT_READERS = GitReaders()
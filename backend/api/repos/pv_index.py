@@ -0,0 +1,155 @@
+import os
+import json
+import bisect
+import itertools
+import threading
+from pydantic import BaseModel
+from typing import Dict, List, Literal, Optional, Set, Tuple
+from api.repos.common import TreeNode, build_path_tree, iter_tree_files, screen_pv_usages
+
+
+class PVUsage(BaseModel):
+    repo_id: str
+    path: str
+    widget_id: str
+
+
+class PVSearchResult(BaseModel):
+    pv: str
+    usages: List[PVUsage]
+
+
+def file_pv_usages(root_path: str, rel_path: str) -> Dict[str, List[str]]:
+    """PV -> widget ids of one OPI file, empty if it cannot be read"""
+    try:
+        with open(os.path.join(root_path, rel_path), "r", encoding="utf-8") as f:
+            return screen_pv_usages(json.load(f))
+    except (OSError, ValueError):
+        return {}
+
+
+def tree_pv_usages(
+    root_path: str, tree: Optional[List[TreeNode]] = None
+) -> Dict[str, Dict[str, List[str]]]:
+    """path -> (PV -> widget ids) of every OPI file under root_path (or of the given tree)"""
+    if tree is None:
+        tree = build_path_tree(root_path)
+    return {node.path: file_pv_usages(root_path, node.path) for node in iter_tree_files(tree)}
+
+
+class PVIndex:
+    """
+    Inverted index of PV usage: macro-expanded PV name -> (repo, path, widget id).
+    A repo is indexed in full the first time it is queried, then kept up to date file by file;
+    invalidate() drops it when many files may have changed (checkout, reset...).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (repo_id, path) -> {pv: [widget ids]}
+        self._files: Dict[Tuple[str, str], Dict[str, List[str]]] = {}
+        # pv -> files referencing it
+        self._pvs: Dict[str, Set[Tuple[str, str]]] = {}
+        # sorted PV names, for prefix queries
+        self._names: List[str] = []
+        # repo_id -> root path it was indexed from
+        self._repos: Dict[str, str] = {}
+
+    def _add(self, key: Tuple[str, str], usages: Dict[str, List[str]], sort: bool):
+        self._files[key] = usages
+        for pv in usages:
+            files = self._pvs.setdefault(pv, set())
+            if not files and sort:
+                bisect.insort(self._names, pv)
+            files.add(key)
+
+    def _remove(self, key: Tuple[str, str], sort: bool):
+        for pv in self._files.pop(key, {}):
+            files = self._pvs[pv]
+            files.discard(key)
+            if not files:
+                del self._pvs[pv]
+                if sort:
+                    self._names.pop(bisect.bisect_left(self._names, pv))
+
+    def replace_repo(self, repo_id: str, root_path: str, files: Dict[str, Dict[str, List[str]]]):
+        """Replace everything indexed for a repo by files (path -> PV -> widget ids) of root_path"""
+        with self._lock:
+            for key in [key for key in self._files if key[0] == repo_id]:
+                self._remove(key, sort=False)
+            for path, usages in files.items():
+                self._add((repo_id, path), usages, sort=False)
+            self._names = sorted(self._pvs)
+            self._repos[repo_id] = root_path
+
+    def ensure_repo(self, repo_id: str, root_path: str):
+        """Index a repo (the OPIs under root_path) in full unless it already is, from root_path"""
+        with self._lock:
+            if self._repos.get(repo_id) == root_path:
+                return
+        self.replace_repo(repo_id, root_path, tree_pv_usages(root_path))
+
+    def invalidate(self, repo_id: str):
+        """Forget a repo; it is indexed again on the next query"""
+        with self._lock:
+            for key in [key for key in self._files if key[0] == repo_id]:
+                self._remove(key, sort=True)
+            self._repos.pop(repo_id, None)
+
+    def update_file(self, repo_id: str, root_path: str, rel_path: str):
+        """Re-index one file after it was saved or created"""
+        with self._lock:
+            if repo_id not in self._repos:
+                return
+        usages = file_pv_usages(root_path, rel_path)
+        with self._lock:
+            if repo_id in self._repos:
+                self._remove((repo_id, rel_path), sort=True)
+                self._add((repo_id, rel_path), usages, sort=True)
+
+    def remove_path(self, repo_id: str, rel_path: str):
+        """Drop a deleted file, or every file of a deleted directory"""
+        with self._lock:
+            for key in [
+                key
+                for key in self._files
+                if key[0] == repo_id and (key[1] == rel_path or key[1].startswith(rel_path + "/"))
+            ]:
+                self._remove(key, sort=True)
+
+    def search(
+        self,
+        query: str,
+        mode: Literal["prefix", "substring"] = "prefix",
+        repo_id: Optional[str] = None,
+        limit: int = 100,
+    ) -> List[PVSearchResult]:
+        """PVs starting with (or containing) query, in name order, with their usages"""
+        results: List[PVSearchResult] = []
+        with self._lock:
+            if mode == "prefix":
+                start = bisect.bisect_left(self._names, query)
+                names = itertools.takewhile(
+                    lambda pv: pv.startswith(query),
+                    (self._names[i] for i in range(start, len(self._names))),
+                )
+            else:
+                names = (pv for pv in self._names if query in pv)
+            for pv in names:
+                files = sorted(f for f in self._pvs[pv] if repo_id is None or f[0] == repo_id)
+                if not files:
+                    continue
+                usages = [
+                    PVUsage(repo_id=repo, path=path, widget_id=widget_id)
+                    for repo, path in files
+                    for widget_id in self._files[(repo, path)][pv]
+                ]
+                results.append(PVSearchResult(pv=pv, usages=usages))
+                if len(results) >= limit:
+                    break
+        return results
+
+
+# staging working trees and current deployments are indexed separately
+STAGING_PV_INDEX = PVIndex()
+DEPLOYED_PV_INDEX = PVIndex()
@@ -1,30 +1,42 @@
 import os
 import uuid
-import subprocess
 import json
+import asyncio
+from contextlib import asynccontextmanager
 from .common import REPOS_BASE_PATH
 from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, Field
-from typing import List
+from typing import AsyncIterator, List, Literal, Optional
 from datetime import datetime, timezone
 from api.repos.common import (
     FileResponse,
     RepoInfo,
     RepoTreeInfo,
     DeploymentInfo,
-    GitFileStatus,
-    GitWorkingTreeStatus,
     get_repo_info,
-    build_path_tree,
+    save_repo_info,
     list_all_repositories,
+    list_path_tree,
+    store_deployment_files,
+    store_deployment_pvs,
+    store_deployment_tree,
     DEPLOYMENTS_REL_FOLDER,
     STAGING_REL_FOLDER,
     CURRENT_SYMLINK,
-    REPO_META,
     DEPLOYMENT_META,
-    REGISTERED_REPO_URLS,
+    REPO_REGISTRY,
     NEW_FILE_CONTENT,
 )
+from api.config import STAGING_TREE_WORKERS
+from api.repos.git_executor import GIT, GitCommandStats
+from api.repos.git_reader import GIT_READERS, GitRef
+from api.repos.staging_tree import STAGING_TREES, read_status, status_model
+from api.repos.pv_index import (
+    PVSearchResult,
+    STAGING_PV_INDEX,
+    DEPLOYED_PV_INDEX,
+    tree_pv_usages,
+)
 
 router = APIRouter(
     prefix="/api/v1/repos/staging",
@@ -71,24 +83,33 @@ class PathCreateRequest(BaseModel):
     )
 
 
+TREE_VERSION = Query(
+    None,
+    description="Tree version the client has. If it is known, only the changes since that version "
+    "are returned (in delta), otherwise the full tree.",
+)
+TREE_PATH = Query(None, description="Only list this directory (relative to repo root)")
+TREE_DEPTH = Query(
+    None, ge=1, description="Levels listed; deeper directories come with their child_count only"
+)
+TREE_CURSOR = Query(None, description="next_cursor of the previous page")
+TREE_LIMIT = Query(None, ge=1, le=10000, description="Maximum entries of the listed directory")
+
+
 # -----------------------------------------------------------------------------
 # Helper functions
 # -----------------------------------------------------------------------------
-def run_git(cmd: list, cwd: str = None):
+async def run_git(cmd: list, cwd: str = None):
     """Run git command and raise exception on failure"""
-    try:
-        result = subprocess.run(["git"] + cmd, cwd=cwd, check=True, capture_output=True, text=True)
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=500, detail=f"Git command failed: {e.stderr}")
+    return await GIT.run(cmd, cwd)
 
 
-def clone(git_url: str, repo_id: str) -> str:
-    if git_url in REGISTERED_REPO_URLS:
+async def clone(git_url: str, repo_id: str) -> str:
+    if await asyncio.to_thread(REPO_REGISTRY.find_by_url, git_url) is not None:
         raise HTTPException(status_code=403, detail="Repository already registered")
     repo_path = os.path.join(REPOS_BASE_PATH, repo_id, STAGING_REL_FOLDER)
     os.makedirs(os.path.dirname(repo_path), exist_ok=True)
-    run_git(["clone", "--recursive", git_url, repo_path])
+    await run_git(["clone", "--recursive", git_url, repo_path])
     return repo_path
 
 
@@ -99,36 +120,15 @@ def get_staging_path(repo_id: str) -> str:
     return repo_path
 
 
-def get_working_tree_status(repo_path: str) -> GitWorkingTreeStatus:
-    raw = run_git(
-        ["status", "--porcelain"],
-        cwd=repo_path,
-    )
-
-    files: list[GitFileStatus] = []
-
-    for line in raw.splitlines():
-        code = line[:2]
-        path = line[3:]
+@asynccontextmanager
+async def staging_write(repo_id: str) -> AsyncIterator[None]:
+    """Write lock of a staging repo, for endpoints that modify it"""
+    async with GIT.write(repo_id):
+        STAGING_TREES.begin_write(repo_id, get_staging_path(repo_id))
+        yield
 
-        if code == "??":
-            status = "untracked"
-        elif "D" in code:
-            status = "deleted"
-        elif "A" in code:
-            status = "added"
-        else:
-            status = "modified"
-
-        files.append(GitFileStatus(path=path, status=status))
 
-    return GitWorkingTreeStatus(
-        dirty=bool(files),
-        files=files,
-    )
-
-
-def create_snapshot(repo_id: str, ref: str) -> str:
+async def create_snapshot(repo_id: str, ref: str) -> str:
     """
     Create a read-only snapshot of the repo at a given ref.
 
@@ -140,8 +140,8 @@ def create_snapshot(repo_id: str, ref: str) -> str:
     deployments_root = os.path.join(REPOS_BASE_PATH, repo_id, DEPLOYMENTS_REL_FOLDER)
     os.makedirs(deployments_root, exist_ok=True)
     deployment_path = os.path.join(deployments_root, deployment_id)
-    run_git(["clone", "--recursive", repo_path, deployment_path])
-    run_git(["checkout", ref], cwd=deployment_path)
+    await run_git(["clone", "--recursive", repo_path, deployment_path])
+    await run_git(["checkout", ref], cwd=deployment_path)
 
     return deployment_id, deployment_path
 
@@ -158,84 +158,104 @@ def list_repositories():
 
 
 @router.get("/tree", response_model=List[RepoTreeInfo], operation_id="getAllReposTree")
-def get_all_repos_tree():
-    all_trees = []
+async def get_all_repos_tree(depth: Optional[int] = TREE_DEPTH):
+    workers = asyncio.Semaphore(STAGING_TREE_WORKERS)
+
+    async def repo_tree(repo_id: str) -> RepoTreeInfo:
+        async with workers, GIT.read(repo_id):
+            if depth is None:
+                return await staging_repo_tree(repo_id)
+            return await staging_repo_listing(repo_id, None, depth, None, None)
+
+    return await asyncio.gather(*(repo_tree(repo.id) for repo in list_all_repositories()))
+
+
+@router.get("/pvs", response_model=List[PVSearchResult], operation_id="searchStagingPVs")
+def search_staging_pvs(
+    q: str = Query(..., min_length=1, description="PV name prefix or substring"),
+    mode: Literal["prefix", "substring"] = Query("prefix"),
+    repo_id: Optional[str] = Query(None, description="Only search this repository"),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of PVs returned"),
+):
+    """
+    Find the PVs (macro-expanded) used by the OPIs of the staging repositories, with the screens
+    and widgets using them.
+    """
     for repo in list_all_repositories():
-        repo_path = get_staging_path(repo.id)
-        tree = build_path_tree(repo_path)
-        wts = get_working_tree_status(repo_path)
-        all_trees.append(RepoTreeInfo(**repo.model_dump(), tree=tree, working_tree_status=wts))
-    return all_trees
+        if repo_id is None or repo.id == repo_id:
+            STAGING_PV_INDEX.ensure_repo(repo.id, get_staging_path(repo.id))
+    return STAGING_PV_INDEX.search(q, mode, repo_id, limit)
 
 
 @router.post("/register", response_model=RepoInfo, operation_id="registerRepo")
-def register_repository(payload: RepoCreateRequest):
+async def register_repository(payload: RepoCreateRequest):
     """Register a Git repository and create a clone"""
     repo_id = str(uuid.uuid4())
     created_at = datetime.now(timezone.utc).isoformat()
-    repo_path = clone(payload.git_url, repo_id)
-    # @TODO: sanitize git_url to prevent duplicates between ssh/https clones
-    REGISTERED_REPO_URLS.append(payload.git_url)
-
-    checked_out_ref = run_git(["rev-parse", "HEAD"], cwd=repo_path)
-    refs = list_repository_refs(repo_id)
-
-    repo_info = RepoInfo(
-        id=repo_id,
-        alias=payload.alias,
-        git_url=payload.git_url,
-        created_at=created_at,
-        refs=refs,
-        checked_out_ref=checked_out_ref,
-    )
 
-    meta_file = os.path.join(REPOS_BASE_PATH, repo_info.id, REPO_META)
-    with open(meta_file, "w", encoding="utf-8") as f:
-        f.write(repo_info.model_dump_json(indent=2))
+    async with GIT.write(repo_id):
+        repo_path = await clone(payload.git_url, repo_id)
+
+        checked_out_ref = await GIT_READERS.get(repo_path).head()
+        refs = await read_refs(repo_path)
+
+        repo_info = RepoInfo(
+            id=repo_id,
+            alias=payload.alias,
+            git_url=payload.git_url,
+            created_at=created_at,
+            refs=refs,
+            checked_out_ref=checked_out_ref,
+        )
+
+        save_repo_info(repo_info)
 
     return repo_info
 
 
+async def read_refs(repo_path: str) -> list[str]:
+    """Tags and the 20 latest untagged commits of the default branch"""
+    return [ref.name for ref in await GIT_READERS.get(repo_path).ref_listing()]
+
+
 @router.get("/{repo_id}/refs", response_model=list[str], operation_id="listRepoRefs")
-def list_repository_refs(repo_id: str) -> list[str]:
+async def list_repository_refs(repo_id: str) -> list[str]:
     """List 20 latest repository refs available in default branch"""
     repo_path = get_staging_path(repo_id)
-    tag_output = run_git(["tag"], cwd=repo_path)
-    tags = tag_output.splitlines() if tag_output else []
-    default_branch = run_git(
-        ["symbolic-ref", "refs/remotes/origin/HEAD"],
-        cwd=repo_path,
-    ).replace("refs/remotes/", "")
-    commit_output = run_git(
-        ["rev-list", "--max-count=20", default_branch],
-        cwd=repo_path,
-    )
-    commits = commit_output.splitlines() if commit_output else []
-    refs: list[str] = []
-    refs.extend(tags)
-    tagged_commits = set(run_git(["rev-list", "--tags"], cwd=repo_path).splitlines())
-    for commit in commits:
-        if commit not in tagged_commits:
-            refs.append(commit)
 
-    return refs
+    async with GIT.read(repo_id):
+        return await read_refs(repo_path)
+
+
+@router.get(
+    "/{repo_id}/refs/details",
+    response_model=List[GitRef],
+    operation_id="listRepoRefDetails",
+)
+async def list_repository_ref_details(repo_id: str):
+    """Same refs as /{repo_id}/refs, with the author, date and subject of their commit"""
+    repo_path = get_staging_path(repo_id)
+
+    async with GIT.read(repo_id):
+        return await GIT_READERS.get(repo_path).ref_listing()
 
 
 @router.post("/{repo_id}/fetch", response_model=RepoTreeInfo, operation_id="fetchRepo")
-def update_repo(repo_id: str):
+async def update_repo(repo_id: str, tree_version: Optional[str] = TREE_VERSION):
     """Fetch new tags/commits from remote"""
     repo_path = get_staging_path(repo_id)
-    run_git(["fetch", "--all", "--tags", "--prune"], cwd=repo_path)
-    info_path, repo_info = get_repo_info(repo_id)
-    refs = list_repository_refs(repo_id)
-    repo_info.refs = refs
-    with open(info_path, "w") as f:
-        f.write(repo_info.model_dump_json(indent=2))
-    return get_staging_repo_tree(repo_id)
+
+    async with staging_write(repo_id):
+        await run_git(["fetch", "--all", "--tags", "--prune"], cwd=repo_path)
+        _, repo_info = get_repo_info(repo_id)
+        refs = await read_refs(repo_path)
+        repo_info.refs = refs
+        save_repo_info(repo_info)
+        return await staging_repo_tree(repo_id, tree_version)
 
 
 @router.get("/{repo_id}/file", response_model=FileResponse, operation_id="getStagingRepoFile")
-def staging_get_repo_file(
+async def staging_get_repo_file(
     repo_id: str, path: str = Query(..., description="Path to file inside repository")
 ):
     """
@@ -243,13 +263,15 @@ def staging_get_repo_file(
     """
     file_path = get_staging_path(repo_id)
     full_path = os.path.join(file_path, path)
-    if not os.path.exists(full_path) or not os.path.isfile(full_path):
-        raise HTTPException(status_code=404, detail="File not found")
 
-    with open(full_path, "r", encoding="utf-8") as f:
-        content = f.read()
+    async with GIT.read(repo_id):
+        if not os.path.exists(full_path) or not os.path.isfile(full_path):
+            raise HTTPException(status_code=404, detail="File not found")
+
+        with open(full_path, "r", encoding="utf-8") as f:
+            content = f.read()
 
-    return FileResponse(path=path, content=content)
+        return FileResponse(path=path, content=content)
 
 
 @router.put(
@@ -257,12 +279,13 @@ def staging_get_repo_file(
     operation_id="updateStagingRepoFile",
     response_model=RepoTreeInfo,
 )
-def staging_update_repo_file(
+async def staging_update_repo_file(
     repo_id: str,
     path: str = Query(
         ..., description="Path to existing file inside repository (relative to root)"
     ),
     payload: FileUpdateRequest = ...,
+    tree_version: Optional[str] = TREE_VERSION,
 ):
     """
     Overwrite the contents of an existing file in the staging repository.
@@ -278,25 +301,28 @@ def staging_update_repo_file(
 
     full_path = os.path.join(repo_path, rel_path)
 
-    # Must exist and be a regular file
-    if not os.path.exists(full_path):
-        raise HTTPException(status_code=404, detail="File not found")
-    if not os.path.isfile(full_path):
-        raise HTTPException(
-            status_code=400,
-            detail="Target path is not a file",
-        )
-
-    try:
-        with open(full_path, "w", encoding="utf-8", newline="\n") as f:
-            f.write(payload.content.rstrip() + "\n")
-        run_git(["add", "."], cwd=repo_path)
-    except OSError as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to update file: {str(e)}",
-        )
-    return get_staging_repo_tree(repo_id)
+    async with staging_write(repo_id):
+        # Must exist and be a regular file
+        if not os.path.exists(full_path):
+            raise HTTPException(status_code=404, detail="File not found")
+        if not os.path.isfile(full_path):
+            raise HTTPException(
+                status_code=400,
+                detail="Target path is not a file",
+            )
+
+        try:
+            with open(full_path, "w", encoding="utf-8", newline="\n") as f:
+                f.write(payload.content.rstrip() + "\n")
+            # only the saved file: it is the only path rescanned below
+            await run_git(["add", "--", rel_path], cwd=repo_path)
+        except OSError as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to update file: {str(e)}",
+            )
+        STAGING_PV_INDEX.update_file(repo_id, repo_path, rel_path)
+        return await staging_repo_tree(repo_id, tree_version, [rel_path])
 
 
 @router.post(
@@ -304,9 +330,10 @@ def staging_update_repo_file(
     response_model=RepoTreeInfo,
     operation_id="resetStagingRepoFile",
 )
-def reset_staging_repo_file(
+async def reset_staging_repo_file(
     repo_id: str,
     path: str = Query(..., description="Path to file inside repository (relative to root)"),
+    tree_version: Optional[str] = TREE_VERSION,
 ):
     """
     Reset changes of a single file in the staging repository.
@@ -319,13 +346,16 @@ def reset_staging_repo_file(
         raise HTTPException(status_code=400, detail="Invalid file path")
 
     full_path = os.path.join(repo_path, rel_path)
-    if not os.path.exists(full_path):
-        raise HTTPException(status_code=404, detail="File not found")
 
-    run_git(["restore", "--staged", rel_path], cwd=repo_path)
-    run_git(["restore", rel_path], cwd=repo_path)
+    async with staging_write(repo_id):
+        if not os.path.exists(full_path):
+            raise HTTPException(status_code=404, detail="File not found")
 
-    return get_staging_repo_tree(repo_id)
+        await run_git(["restore", "--staged", rel_path], cwd=repo_path)
+        await run_git(["restore", rel_path], cwd=repo_path)
+        STAGING_PV_INDEX.update_file(repo_id, repo_path, rel_path)
+
+        return await staging_repo_tree(repo_id, tree_version, [rel_path])
 
 
 @router.post(
@@ -333,19 +363,21 @@ def reset_staging_repo_file(
     response_model=RepoTreeInfo,
     operation_id="resetStagingRepo",
 )
-def reset_staging_repo(repo_id: str):
+async def reset_staging_repo(repo_id: str, tree_version: Optional[str] = TREE_VERSION):
     """
     Return the staging repository to the checked-out ref.
     This discards all local changes, including untracked files and directories.
     """
     repo_path = get_staging_path(repo_id)
 
-    # Unstage everything, then restore working tree
-    run_git(["restore", "--staged", "."], cwd=repo_path)
-    run_git(["restore", "."], cwd=repo_path)
-    run_git(["clean", "-fd"], cwd=repo_path)
+    async with staging_write(repo_id):
+        # Unstage everything, then restore working tree
+        await run_git(["restore", "--staged", "."], cwd=repo_path)
+        await run_git(["restore", "."], cwd=repo_path)
+        await run_git(["clean", "-fd"], cwd=repo_path)
+        STAGING_PV_INDEX.invalidate(repo_id)
 
-    return get_staging_repo_tree(repo_id)
+        return await staging_repo_tree(repo_id, tree_version)
 
 
 @router.post(
@@ -353,7 +385,9 @@ def reset_staging_repo(repo_id: str):
     response_model=RepoTreeInfo,
     operation_id="createStagingRepoPath",
 )
-def create_staging_repo_path(repo_id: str, payload: PathCreateRequest):
+async def create_staging_repo_path(
+    repo_id: str, payload: PathCreateRequest, tree_version: Optional[str] = TREE_VERSION
+):
     """
     Create a file or directory in the staging repository.
     - Intermediate directories will be created if necessary.
@@ -366,32 +400,38 @@ def create_staging_repo_path(repo_id: str, payload: PathCreateRequest):
         raise HTTPException(status_code=400, detail="Invalid path")
 
     full_path = os.path.join(repo_path, rel_path)
-    parent_dir = os.path.dirname(full_path)
 
-    if os.path.exists(full_path):
-        raise HTTPException(status_code=400, detail="File or directory already exists")
-
-    try:
-        os.makedirs(parent_dir, exist_ok=True)
-
-        if payload.type == "file":
-            # Create empty file
-            if not full_path.endswith(".json"):
-                full_path += ".json"
-            with open(full_path, "w", encoding="utf-8") as f:
-                json.dump(NEW_FILE_CONTENT, f, indent=2)
-                f.write("\n")
-            run_git(["add", full_path], cwd=repo_path)
-        elif payload.type == "directory":
-            # Create directory and .gitkeep
-            os.makedirs(full_path, exist_ok=True)
-            gitkeep = os.path.join(full_path, ".gitkeep")
-            open(gitkeep, "w").close()
-            run_git(["add", full_path], cwd=repo_path)
-    except OSError as e:
-        raise HTTPException(status_code=500, detail=f"Failed to create {payload.type}: {str(e)}")
-
-    return get_staging_repo_tree(repo_id)
+    async with staging_write(repo_id):
+        parent_dir = os.path.dirname(full_path)
+
+        if os.path.exists(full_path):
+            raise HTTPException(status_code=400, detail="File or directory already exists")
+
+        try:
+            os.makedirs(parent_dir, exist_ok=True)
+
+            if payload.type == "file":
+                # Create empty file
+                if not full_path.endswith(".json"):
+                    full_path += ".json"
+                with open(full_path, "w", encoding="utf-8") as f:
+                    json.dump(NEW_FILE_CONTENT, f, indent=2)
+                    f.write("\n")
+                await run_git(["add", full_path], cwd=repo_path)
+                rel_path = os.path.relpath(full_path, repo_path)
+                STAGING_PV_INDEX.update_file(repo_id, repo_path, rel_path)
+            elif payload.type == "directory":
+                # Create directory and .gitkeep
+                os.makedirs(full_path, exist_ok=True)
+                gitkeep = os.path.join(full_path, ".gitkeep")
+                open(gitkeep, "w").close()
+                await run_git(["add", full_path], cwd=repo_path)
+        except OSError as e:
+            raise HTTPException(
+                status_code=500, detail=f"Failed to create {payload.type}: {str(e)}"
+            )
+
+        return await staging_repo_tree(repo_id, tree_version, [rel_path])
 
 
 @router.delete(
@@ -399,12 +439,13 @@ def create_staging_repo_path(repo_id: str, payload: PathCreateRequest):
     response_model=RepoTreeInfo,
     operation_id="deleteStagingRepoPath",
 )
-def delete_staging_repo_path(
+async def delete_staging_repo_path(
     repo_id: str,
     path: str = Query(
         ...,
         description="FIle or directory path inside repository, relative to root.",
     ),
+    tree_version: Optional[str] = TREE_VERSION,
 ):
     """
     Delete a file or directory from the staging repository.
@@ -418,15 +459,17 @@ def delete_staging_repo_path(
 
     full_path = os.path.join(repo_path, rel_path)
 
-    if not os.path.exists(full_path):
-        raise HTTPException(status_code=404, detail="Path not found")
+    async with staging_write(repo_id):
+        if not os.path.exists(full_path):
+            raise HTTPException(status_code=404, detail="Path not found")
 
-    if os.path.isdir(full_path):
-        run_git(["rm", "-r", "-f", "--", rel_path], cwd=repo_path)
-    else:
-        run_git(["rm", "-f", "--", rel_path], cwd=repo_path)
+        if os.path.isdir(full_path):
+            await run_git(["rm", "-r", "-f", "--", rel_path], cwd=repo_path)
+        else:
+            await run_git(["rm", "-f", "--", rel_path], cwd=repo_path)
+        STAGING_PV_INDEX.remove_path(repo_id, rel_path)
 
-    return get_staging_repo_tree(repo_id)
+        return await staging_repo_tree(repo_id, tree_version, [rel_path])
 
 
 @router.post(
@@ -434,81 +477,96 @@ def delete_staging_repo_path(
     response_model=RepoTreeInfo,
     operation_id="commitStagingRepo",
 )
-def commit_staging_repo(repo_id: str, payload: CommitRequest):
+async def commit_staging_repo(
+    repo_id: str, payload: CommitRequest, tree_version: Optional[str] = TREE_VERSION
+):
     """
     Commit staged changes in the staging repository.
     Fails if there is nothing to commit.
     """
     repo_path = get_staging_path(repo_id)
 
-    # Ensure there is something staged
-    staged = run_git(["diff", "--cached", "--name-only"], cwd=repo_path)
-    if not staged.strip():
-        raise HTTPException(status_code=400, detail="No staged changes to commit")
-
-    try:
-        run_git(
-            [
-                "commit",
-                "-m",
-                payload.message,
-                "-m",
-                "Commited by WEISS API on behalf of $USER (#TODO)",
-            ],
-            cwd=repo_path,
-        )
-        commit_hash = run_git(["rev-parse", "HEAD"], cwd=repo_path)
-        if payload.tag:
-            run_git(["tag", payload.tag, commit_hash], cwd=repo_path)
-    except HTTPException as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to commit changes: {e.detail}",
-        )
-
-    # Update repo metadata
-    repo_info_path, repo_info = get_repo_info(repo_id)
-    repo_info.checked_out_ref = run_git(["rev-parse", "HEAD"], cwd=repo_path)
-
-    with open(repo_info_path, "w") as f:
-        f.write(repo_info.model_dump_json(indent=2))
-
-    return get_staging_repo_tree(repo_id)
+    async with staging_write(repo_id):
+        # Ensure there is something staged
+        staged = await run_git(["diff", "--cached", "--name-only"], cwd=repo_path)
+        if not staged.strip():
+            raise HTTPException(status_code=400, detail="No staged changes to commit")
+
+        try:
+            await run_git(
+                [
+                    "commit",
+                    "-m",
+                    payload.message,
+                    "-m",
+                    "Commited by WEISS API on behalf of $USER (#TODO)",
+                ],
+                cwd=repo_path,
+            )
+            commit_hash = await GIT_READERS.get(repo_path).head()
+            if payload.tag:
+                await run_git(["tag", payload.tag, commit_hash], cwd=repo_path)
+        except HTTPException as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to commit changes: {e.detail}",
+            )
+
+        # Update repo metadata
+        _, repo_info = get_repo_info(repo_id)
+        repo_info.checked_out_ref = await GIT_READERS.get(repo_path).head()
+
+        save_repo_info(repo_info)
+
+        return await staging_repo_tree(repo_id, tree_version)
+
+
+def compile_deployment(repo_id: str, snapshot_path: str):
+    """Deploy-time derived data of a snapshot: tree, blob map, PV index"""
+    tree = store_deployment_tree(snapshot_path)
+    store_deployment_files(snapshot_path, tree)
+    store_deployment_pvs(snapshot_path, tree)
+    DEPLOYED_PV_INDEX.replace_repo(
+        repo_id, os.path.realpath(snapshot_path), tree_pv_usages(snapshot_path, tree)
+    )
 
 
 @router.post("/{repo_id}/deploy", response_model=DeploymentInfo, operation_id="deployRepo")
-def deploy_repo(repo_id: str, payload: DeployRequest):
+async def deploy_repo(repo_id: str, payload: DeployRequest):
     """Deploy a selected tag or commit to make it available for users"""
     ref_to_deploy = payload.deployment_version
-    try:
-        deployment_id, snapshot_path = create_snapshot(repo_id, ref_to_deploy)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to create snapshot: {str(e)}")
-    commit_hash = run_git(["rev-parse", ref_to_deploy], cwd=snapshot_path)
-    deployment_meta = {
-        "deployment_id": deployment_id,
-        "repo_id": repo_id,
-        "ref": ref_to_deploy,
-        "commit_hash": commit_hash,
-        "deployed_at": datetime.now(timezone.utc).isoformat(),
-    }
-    deployment_meta_path = os.path.join(
-        REPOS_BASE_PATH, repo_id, DEPLOYMENTS_REL_FOLDER, deployment_id, DEPLOYMENT_META
-    )
-    with open(deployment_meta_path, "w") as f:
-        json.dump(deployment_meta, f, indent=2)
-
-    repo_info_path, repo_info = get_repo_info(repo_id)
-    repo_info.current_deployment = deployment_id
-    repo_info.deployed_ref = ref_to_deploy
-    repo_info.deployed_at = deployment_meta["deployed_at"]
-
-    with open(repo_info_path, "w") as f:
-        f.write(repo_info.model_dump_json(indent=2))
-    current_link = os.path.join(REPOS_BASE_PATH, repo_id, DEPLOYMENTS_REL_FOLDER, CURRENT_SYMLINK)
-    if os.path.islink(current_link) or os.path.exists(current_link):
-        os.remove(current_link)
-    os.symlink(snapshot_path, current_link)
+    async with GIT.write(repo_id):
+        try:
+            deployment_id, snapshot_path = await create_snapshot(repo_id, ref_to_deploy)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to create snapshot: {str(e)}")
+        commit_hash = await run_git(["rev-parse", ref_to_deploy], cwd=snapshot_path)
+        deployment_meta = {
+            "deployment_id": deployment_id,
+            "repo_id": repo_id,
+            "ref": ref_to_deploy,
+            "commit_hash": commit_hash,
+            "deployed_at": datetime.now(timezone.utc).isoformat(),
+        }
+        deployment_meta_path = os.path.join(
+            REPOS_BASE_PATH, repo_id, DEPLOYMENTS_REL_FOLDER, deployment_id, DEPLOYMENT_META
+        )
+        with open(deployment_meta_path, "w") as f:
+            json.dump(deployment_meta, f, indent=2)
+        await asyncio.to_thread(compile_deployment, repo_id, snapshot_path)
+
+        _, repo_info = get_repo_info(repo_id)
+        repo_info.current_deployment = deployment_id
+        repo_info.deployed_ref = ref_to_deploy
+        repo_info.deployed_at = deployment_meta["deployed_at"]
+
+        save_repo_info(repo_info)
+        current_link = os.path.join(
+            REPOS_BASE_PATH, repo_id, DEPLOYMENTS_REL_FOLDER, CURRENT_SYMLINK
+        )
+        if os.path.islink(current_link) or os.path.exists(current_link):
+            os.remove(current_link)
+        os.symlink(snapshot_path, current_link)
     return DeploymentInfo(
         id=deployment_id,
         repo_id=repo_id,
@@ -519,27 +577,107 @@ def deploy_repo(repo_id: str, payload: DeployRequest):
 
 
 @router.post("/{repo_id}/checkout", response_model=RepoTreeInfo, operation_id="checkoutRepoRef")
-def checkout_repo_ref(repo_id: str, ref: str):
+async def checkout_repo_ref(
+    repo_id: str, ref: str, tree_version: Optional[str] = TREE_VERSION
+):
     """Checkout a specific ref in the staging repo"""
     repo_path = get_staging_path(repo_id)
-    run_git(["checkout", ref], cwd=repo_path)
-    repo_info_path, repo_info = get_repo_info(repo_id)
-    # get actual hash to avoid tags
-    checked_out_ref = run_git(["rev-parse", "HEAD"], cwd=repo_path)
-    repo_info.checked_out_ref = checked_out_ref
-    with open(repo_info_path, "w") as f:
-        f.write(repo_info.model_dump_json(indent=2))
-    return get_staging_repo_tree(repo_id)
 
+    async with staging_write(repo_id):
+        await run_git(["checkout", ref], cwd=repo_path)
+        STAGING_PV_INDEX.invalidate(repo_id)
+        _, repo_info = get_repo_info(repo_id)
+        # get actual hash to avoid tags
+        checked_out_ref = await GIT_READERS.get(repo_path).head()
+        repo_info.checked_out_ref = checked_out_ref
+        save_repo_info(repo_info)
+        return await staging_repo_tree(repo_id, tree_version)
 
-@router.get("/{repo_id}/tree", response_model=RepoTreeInfo, operation_id="getStagingRepoTree")
-def get_staging_repo_tree(repo_id: str):
+
+async def staging_repo_tree(
+    repo_id: str, tree_version: Optional[str] = None, changed: Optional[List[str]] = None
+) -> RepoTreeInfo:
+    """
+    Tree and status of a staging repo, or only the changes since tree_version if the client's
+    version is known. changed: paths modified by the calling writer, rescanned instead of the whole
+    repo when possible. The caller holds the repo lock.
+    """
     repo_path = get_staging_path(repo_id)
-    tree = build_path_tree(repo_path)
+    state = await STAGING_TREES.get(repo_id, repo_path, changed)
+    _, repo_info = get_repo_info(repo_id)
+    delta = STAGING_TREES.delta(repo_id, tree_version, state) if tree_version else None
+    if delta is not None:
+        return RepoTreeInfo(
+            **repo_info.model_dump(), tree=[], tree_version=state.version, delta=delta
+        )
+    return RepoTreeInfo(
+        **repo_info.model_dump(),
+        tree=state.tree,
+        working_tree_status=status_model(state.status),
+        tree_version=state.version,
+    )
+
+
+async def staging_repo_listing(
+    repo_id: str,
+    path: Optional[str],
+    depth: Optional[int],
+    cursor: Optional[str],
+    limit: Optional[int],
+) -> RepoTreeInfo:
+    """
+    Part of the tree of a staging repo: the directory at path, depth levels deep, paged by cursor
+    and limit. Only that part is scanned (it is not cached), and git status only covers path.
+    The caller holds the repo lock.
+    """
+    repo_path = get_staging_path(repo_id)
+
+    rel_path = os.path.normpath(path).lstrip(os.sep) if path else ""
+    if rel_path == ".":
+        rel_path = ""
+    if rel_path.startswith(".."):
+        raise HTTPException(status_code=400, detail="Invalid path")
+
+    try:
+        tree, next_cursor = await asyncio.to_thread(
+            list_path_tree, repo_path, rel_path, depth, cursor, limit
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Directory not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    status = await read_status(repo_path, [rel_path] if rel_path else None)
     _, repo_info = get_repo_info(repo_id)
-    working_tree_status = get_working_tree_status(repo_path)
     return RepoTreeInfo(
         **repo_info.model_dump(),
         tree=tree,
-        working_tree_status=working_tree_status,
+        working_tree_status=status_model(status),
+        next_cursor=next_cursor,
     )
+
+
+@router.get("/{repo_id}/tree", response_model=RepoTreeInfo, operation_id="getStagingRepoTree")
+async def get_staging_repo_tree(
+    repo_id: str,
+    tree_version: Optional[str] = TREE_VERSION,
+    path: Optional[str] = TREE_PATH,
+    depth: Optional[int] = TREE_DEPTH,
+    cursor: Optional[str] = TREE_CURSOR,
+    limit: Optional[int] = TREE_LIMIT,
+):
+    """
+    Tree and working tree status of a staging repo.
+    With path, depth, cursor or limit, only that part is listed and tree_version is ignored.
+    """
+    get_staging_path(repo_id)
+    async with GIT.read(repo_id):
+        if path is None and depth is None and cursor is None and limit is None:
+            return await staging_repo_tree(repo_id, tree_version)
+        return await staging_repo_listing(repo_id, path, depth, cursor, limit)
+
+
+@router.get("/git-stats", response_model=List[GitCommandStats], operation_id="getGitStats")
+def get_git_stats():
+    """Timing of the git commands run by the API, per subcommand"""
+    return GIT.stats()
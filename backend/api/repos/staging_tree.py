@@ -0,0 +1,305 @@
+import os
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+from api.repos.common import (
+    GitFileStatus,
+    GitWorkingTreeStatus,
+    TreeDelta,
+    TreeNode,
+    build_path_tree,
+    iter_tree_files,
+    METADATA_FILES,
+)
+from api.repos.git_executor import GIT
+from api.repos.pv_index import STAGING_PV_INDEX
+from api.repos.staging_watch import STAGING_WATCHER
+
+# tree versions remembered per repo to compute deltas from
+HISTORY_SIZE = 32
+
+
+def flatten_tree(tree: List[TreeNode], nodes: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """path -> node type of every node of a tree"""
+    nodes = {} if nodes is None else nodes
+    for node in tree:
+        nodes[node.path] = node.type
+        if node.children:
+            flatten_tree(node.children, nodes)
+    return nodes
+
+
+def nest_tree(nodes: Dict[str, str]) -> List[TreeNode]:
+    """Inverse of flatten_tree, ordered like build_path_tree (directories first, then by name)"""
+    children: Dict[str, List[str]] = {}
+    for path in nodes:
+        children.setdefault(os.path.dirname(path), []).append(path)
+
+    def build(parent: str) -> List[TreeNode]:
+        paths = sorted(
+            children.get(parent, []),
+            key=lambda p: (nodes[p] != "directory", os.path.basename(p)),
+        )
+        return [
+            TreeNode(
+                name=os.path.basename(path),
+                path=path,
+                type=nodes[path],
+                children=build(path) if nodes[path] == "directory" else None,
+            )
+            for path in paths
+        ]
+
+    return build("")
+
+
+def refresh_nodes(repo_path: str, nodes: Dict[str, str], paths: List[str]):
+    """Update flattened nodes for paths created, changed or deleted, and for their parents"""
+
+    def remove(path: str):
+        for key in [k for k in nodes if k == path or k.startswith(path + "/")]:
+            del nodes[key]
+
+    for path in paths:
+        remove(path)
+        full_path = os.path.join(repo_path, path)
+        name = os.path.basename(path)
+        if os.path.isdir(full_path):
+            nodes[path] = "directory"
+            flatten_tree(build_path_tree(repo_path, path), nodes)
+        elif os.path.isfile(full_path) and name.lower().endswith(".json"):
+            if name not in METADATA_FILES:
+                nodes[path] = "file"
+
+        parent = os.path.dirname(path)
+        while parent:
+            if not os.path.isdir(os.path.join(repo_path, parent)):
+                remove(parent)
+            elif nodes.get(parent) == "directory":
+                break
+            else:
+                nodes[parent] = "directory"
+            parent = os.path.dirname(parent)
+
+
+def update_pv_index(repo_id: str, repo_path: str, paths: Optional[Set[str]]):
+    """Apply changes made outside the API to the PV index, None if they are not known"""
+    if paths is None:
+        STAGING_PV_INDEX.invalidate(repo_id)
+        return
+    for path in paths:
+        abs_path = os.path.join(repo_path, path)
+        if os.path.isfile(abs_path):
+            if path.lower().endswith(".json"):
+                STAGING_PV_INDEX.update_file(repo_id, repo_path, path)
+            continue
+        STAGING_PV_INDEX.remove_path(repo_id, path)
+        if os.path.isdir(abs_path):
+            # created or moved in: its files are not reported one by one
+            for node in iter_tree_files(build_path_tree(repo_path, path)):
+                STAGING_PV_INDEX.update_file(repo_id, repo_path, node.path)
+
+
+def status_pathspecs(repo_path: str, paths: Set[str]) -> List[str]:
+    """
+    Paths for git status to cover the given changed paths: the directory of each changed file
+    (an untracked directory is only reported as such when git status is run on it), and not those
+    inside another one.
+    """
+    specs = set()
+    for path in paths:
+        if os.path.isdir(os.path.join(repo_path, path)) or "/" not in path:
+            specs.add(path)
+        else:
+            specs.add(os.path.dirname(path))
+    return [
+        spec
+        for spec in sorted(specs)
+        if not any(spec.startswith(other + "/") for other in specs)
+    ]
+
+
+def parse_status(raw: str) -> Dict[str, str]:
+    """path -> status from `git status --porcelain`"""
+    files: Dict[str, str] = {}
+
+    for line in raw.splitlines():
+        code = line[:2]
+        path = line[3:]
+
+        if code == "??":
+            status = "untracked"
+        elif "D" in code:
+            status = "deleted"
+        elif "A" in code:
+            status = "added"
+        else:
+            status = "modified"
+
+        files[path] = status
+
+    return files
+
+
+async def read_status(repo_path: str, paths: Optional[List[str]] = None) -> Dict[str, str]:
+    cmd = ["status", "--porcelain"]
+    if paths:
+        cmd += ["--"] + paths
+    # porcelain lines may start with a space (unstaged changes)
+    return parse_status(await GIT.run(cmd, cwd=repo_path, strip=False))
+
+
+def status_model(status: Dict[str, str]) -> GitWorkingTreeStatus:
+    return GitWorkingTreeStatus(
+        dirty=bool(status),
+        files=[GitFileStatus(path=path, status=s) for path, s in sorted(status.items())],
+    )
+
+
+def signature(repo_id: str, repo_path: str) -> tuple:
+    """Changes when the API modifies the repo or git updates its index or HEAD"""
+    values = [GIT.generation(repo_id)]
+    for name in ("index", "HEAD"):
+        try:
+            values.append(os.stat(os.path.join(repo_path, ".git", name)).st_mtime_ns)
+        except OSError:
+            values.append(None)
+    return tuple(values)
+
+
+class TreeState:
+    """Tree and working tree status of a staging repo at one version"""
+
+    __slots__ = ("signature", "version", "nodes", "status", "_tree")
+
+    def __init__(self, signature: tuple, version: str, nodes: Dict[str, str], status: Dict):
+        self.signature = signature
+        self.version = version
+        self.nodes = nodes
+        self.status = status
+        self._tree: Optional[List[TreeNode]] = None
+
+    @property
+    def tree(self) -> List[TreeNode]:
+        if self._tree is None:
+            self._tree = nest_tree(self.nodes)
+        return self._tree
+
+
+class StagingTrees:
+    """
+    Tree and status of every staging repo, recomputed only when the repo changed, and the last
+    HISTORY_SIZE versions of each so that clients can be sent the changes since their version.
+    A mutation that names the paths it touched only rescans those paths (and runs git status on
+    them), provided the cached state was up to date when its write lock was taken. Changes made
+    outside the API are reported by STAGING_WATCHER and rescanned the same way.
+    """
+
+    def __init__(self):
+        self._states: Dict[str, TreeState] = {}
+        self._history: Dict[str, "OrderedDict[str, TreeState]"] = {}
+        # repo_id -> generation of the write that may patch the cached state
+        self._patchable: Dict[str, int] = {}
+        # serializes the updates of a repo's state by concurrent readers
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _lock(self, repo_id: str) -> asyncio.Lock:
+        if repo_id not in self._locks:
+            self._locks[repo_id] = asyncio.Lock()
+        return self._locks[repo_id]
+
+    def begin_write(self, repo_id: str, repo_path: str):
+        """Called by writers right after taking the repo lock, before changing anything"""
+        state = self._states.get(repo_id)
+        current = signature(repo_id, repo_path)
+        if state and state.signature[0] == current[0] - 1 and state.signature[1:] == current[1:]:
+            self._patchable[repo_id] = current[0]
+
+    async def get(
+        self, repo_id: str, repo_path: str, changed: Optional[List[str]] = None
+    ) -> TreeState:
+        """Current state; the caller holds the repo lock"""
+        async with self._lock(repo_id):
+            external = await asyncio.to_thread(STAGING_WATCHER.changes, repo_id, repo_path)
+            current = signature(repo_id, repo_path)
+            state = self._states.get(repo_id)
+            patchable = self._patchable.pop(repo_id, None) == current[0]
+            update_pv_index(repo_id, repo_path, external)
+
+            # paths to rescan, None for the whole repo
+            paths: Optional[Set[str]] = None
+            if state and external is not None:
+                if state.signature == current:
+                    if not external:
+                        return state
+                    paths = external
+                elif changed and patchable:
+                    paths = external | set(changed)
+
+            if paths and not any(p.endswith("/") for p in state.status):
+                nodes = dict(state.nodes)
+                await asyncio.to_thread(refresh_nodes, repo_path, nodes, sorted(paths))
+                specs = status_pathspecs(repo_path, paths)
+                rescanned = await read_status(repo_path, specs)
+                # untracked directories are listed as such by a full git status only
+                if not any(p.endswith("/") for p in rescanned):
+                    status = {
+                        path: s
+                        for path, s in state.status.items()
+                        if not any(path == c or path.startswith(c + "/") for c in specs)
+                    }
+                    status.update(rescanned)
+                    return self._store(repo_id, current, nodes, status)
+
+            tree = await asyncio.to_thread(build_path_tree, repo_path)
+            nodes = flatten_tree(tree)
+            status = await read_status(repo_path)
+            return self._store(repo_id, current, nodes, status)
+
+    def _store(self, repo_id: str, current: tuple, nodes: Dict, status: Dict) -> TreeState:
+        previous = self._states.get(repo_id)
+        if previous and previous.nodes == nodes and previous.status == status:
+            version = previous.version
+        else:
+            version = uuid.uuid4().hex[:16]
+        state = TreeState(current, version, nodes, status)
+        self._states[repo_id] = state
+        history = self._history.setdefault(repo_id, OrderedDict())
+        history[version] = state
+        history.move_to_end(version)
+        while len(history) > HISTORY_SIZE:
+            history.popitem(last=False)
+        return state
+
+    def delta(self, repo_id: str, base_version: str, state: TreeState) -> Optional[TreeDelta]:
+        """Changes from base_version to state, None if base_version is unknown"""
+        base = self._history.get(repo_id, {}).get(base_version)
+        if base is None:
+            return None
+        added = sorted(
+            path for path, kind in state.nodes.items() if base.nodes.get(path) != kind
+        )
+        return TreeDelta(
+            base_version=base_version,
+            added=[
+                TreeNode(
+                    name=os.path.basename(path),
+                    path=path,
+                    type=state.nodes[path],
+                    children=[] if state.nodes[path] == "directory" else None,
+                )
+                for path in added
+            ],
+            removed=sorted(path for path in base.nodes if path not in state.nodes),
+            status=[
+                GitFileStatus(path=path, status=s)
+                for path, s in sorted(state.status.items())
+                if base.status.get(path) != s
+            ],
+            status_removed=sorted(path for path in base.status if path not in state.status),
+            dirty=bool(state.status),
+        )
+
+
+STAGING_TREES = StagingTrees()
@@ -0,0 +1,272 @@
+import os
+import time
+import ctypes
+import ctypes.util
+import struct
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Set, Tuple
+from api.config import STAGING_WATCH, STAGING_WATCH_POLL_INTERVAL
+from api.repos.common import IGNORE_DIRS
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+    | IN_DONT_FOLLOW
+)
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+# seconds before watching a repo is tried again after it failed
+WATCH_RETRY_INTERVAL = 60.0
+
+
+def _load_libc():
+    """libc if it provides inotify (Linux), else None"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+_LIBC = _load_libc()
+
+
+class RepoWatch(ABC):
+    """Changes in the working tree of one staging repo (except in IGNORE_DIRS)"""
+
+    @abstractmethod
+    def changes(self) -> Optional[Set[str]]:
+        """Paths created, changed or deleted since the last call, None if changes were lost"""
+
+    def close(self):
+        pass
+
+
+class InotifyWatch(RepoWatch):
+    """
+    inotify watches on every directory of the working tree. Events queue up in the kernel and are
+    only read when changes() is called, so no thread is needed.
+    """
+
+    def __init__(self, repo_path: str):
+        self.repo_path = repo_path
+        self._fd = _LIBC.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # watch descriptor -> directory path relative to repo_path
+        self._dirs: Dict[int, str] = {}
+        try:
+            self._add_tree("")
+        except OSError:
+            self.close()
+            raise
+
+    def _add_tree(self, rel_dir: str):
+        """Watch rel_dir and the directories below it"""
+        wd = _LIBC.inotify_add_watch(
+            self._fd, os.path.join(self.repo_path, rel_dir).encode(), WATCH_MASK
+        )
+        if wd < 0:
+            errno = ctypes.get_errno()
+            if rel_dir and errno in (2, 20):  # ENOENT, ENOTDIR: gone, its deletion is reported
+                return
+            raise OSError(errno, f"inotify_add_watch failed: {os.strerror(errno)}")
+        self._dirs[wd] = rel_dir
+        try:
+            entries = list(os.scandir(os.path.join(self.repo_path, rel_dir)))
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False) and entry.name not in IGNORE_DIRS:
+                self._add_tree(os.path.join(rel_dir, entry.name))
+
+    def _read(self) -> List[Tuple[int, int, str]]:
+        """Queued events as (wd, mask, name)"""
+        events: List[Tuple[int, int, str]] = []
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset : offset + length].split(b"\0", 1)[0]
+                offset += length
+                events.append((wd, mask, os.fsdecode(name)))
+
+    def changes(self) -> Optional[Set[str]]:
+        paths: Set[str] = set()
+        for wd, mask, name in self._read():
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            rel_dir = self._dirs.get(wd)
+            if rel_dir is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if not rel_dir:
+                    return None  # the checkout itself went away
+                continue
+            if name in IGNORE_DIRS:
+                continue
+            path = os.path.join(rel_dir, name)
+            if mask & IN_ISDIR and mask & IN_MOVED_FROM:
+                # the watches below a moved directory would report under its old path
+                return None
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self._add_tree(path)
+            paths.add(path)
+        return paths
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def scan_stats(repo_path: str) -> Dict[str, tuple]:
+    """path -> (mode, size, mtime) of every file, and directory entries, of the working tree"""
+    stats: Dict[str, tuple] = {}
+    pending = [""]
+    while pending:
+        rel_dir = pending.pop()
+        try:
+            entries = list(os.scandir(os.path.join(repo_path, rel_dir)))
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        for entry in entries:
+            path = os.path.join(rel_dir, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in IGNORE_DIRS:
+                    stats[path] = ("directory",)
+                    pending.append(path)
+                continue
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            stats[path] = (st.st_mode, st.st_size, st.st_mtime_ns)
+    return stats
+
+
+class PollingWatch(RepoWatch):
+    """Compares the stats of the working tree files, at most every `interval` seconds"""
+
+    def __init__(self, repo_path: str, interval: float):
+        self.repo_path = repo_path
+        self.interval = interval
+        self._stats = scan_stats(repo_path)
+        self._polled = time.monotonic()
+
+    def changes(self) -> Optional[Set[str]]:
+        if time.monotonic() - self._polled < self.interval:
+            return set()
+        stats = scan_stats(self.repo_path)
+        self._polled = time.monotonic()
+        paths = {
+            path
+            for path in stats.keys() | self._stats.keys()
+            if stats.get(path) != self._stats.get(path)
+        }
+        self._stats = stats
+        return paths
+
+
+class StagingWatcher:
+    """
+    Watches the working trees of the staging repos for changes made outside the API (editors,
+    git on the command line...), with inotify when available and by polling otherwise.
+    A repo is watched from the first time its changes are asked for.
+    """
+
+    def __init__(self, mode: str, poll_interval: float):
+        """
+        mode: "auto" (inotify, else polling), "inotify", "poll" or "off" (nothing is watched, every
+        read rescans the repo)
+        """
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._watches: Dict[str, RepoWatch] = {}
+        # repo_id -> when to try again to watch it, after it failed
+        self._retry_at: Dict[str, float] = {}
+
+    def _watch(self, repo_path: str) -> Optional[RepoWatch]:
+        if self.mode in ("auto", "inotify") and _LIBC is not None:
+            try:
+                return InotifyWatch(repo_path)
+            except OSError as e:
+                # e.g. out of inotify instances or watches (fs.inotify.max_user_*)
+                if self.mode == "inotify":
+                    print(f"[StagingWatcher]: Not watching {repo_path}: {e}")
+                    return None
+                print(f"[StagingWatcher]: Polling {repo_path}, inotify failed: {e}")
+        if self.mode in ("auto", "poll"):
+            return PollingWatch(repo_path, self.poll_interval)
+        return None
+
+    def changes(self, repo_id: str, repo_path: str) -> Optional[Set[str]]:
+        """
+        Paths of the repo created, changed or deleted since the last call. None when they are not
+        known: on the first call, when changes were lost, or when the repo is not watched (mode
+        "off", or watching failed; it is retried every WATCH_RETRY_INTERVAL); the caller must then
+        rescan everything. Blocking, may scan the working tree.
+        """
+        if self.mode == "off":
+            return None
+        with self._lock:
+            watch = self._watches.pop(repo_id, None)
+            if watch is not None:
+                try:
+                    paths = watch.changes()
+                except OSError as e:
+                    print(f"[StagingWatcher]: Watch of {repo_path} failed: {e}")
+                    paths = None
+                if paths is not None:
+                    self._watches[repo_id] = watch
+                    return paths
+                watch.close()
+            elif time.monotonic() < self._retry_at.get(repo_id, 0):
+                return None
+            # (re)start watching before the caller rescans, so that no change is missed
+            watch = self._watch(repo_path)
+            if watch is None:
+                self._retry_at[repo_id] = time.monotonic() + WATCH_RETRY_INTERVAL
+            else:
+                self._watches[repo_id] = watch
+                self._retry_at.pop(repo_id, None)
+            return None
+
+
+STAGING_WATCHER = StagingWatcher(STAGING_WATCH, STAGING_WATCH_POLL_INTERVAL)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the API modules are imported as the `api` package, from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -0,0 +1,47 @@
+import os
+import time
+
+from api.repos.common import REPO_META, RepoInfo, RepoRegistry
+
+
+def write_repo(base_path, repo_id: str, created_at: str, git_url: str):
+    """repo.json of a repo, as written outside the API"""
+    os.makedirs(base_path / repo_id, exist_ok=True)
+    info = RepoInfo(
+        id=repo_id,
+        alias=repo_id,
+        git_url=git_url,
+        created_at=created_at,
+        refs=[],
+        checked_out_ref="0" * 40,
+    )
+    (base_path / repo_id / REPO_META).write_text(info.model_dump_json())
+
+
+def test_list_is_sorted_and_shared(tmp_path):
+    write_repo(tmp_path, "b", "2024-02-01", "https://example.com/b.git")
+    write_repo(tmp_path, "a", "2024-01-01", "https://example.com/a.git")
+    registry = RepoRegistry(str(tmp_path))
+    listing = registry.list()
+    assert [repo.id for repo in listing] == ["a", "b"]
+    assert registry.list() is listing
+
+    info = registry.get("b")
+    info.alias = "renamed"
+    registry.save(info)
+    assert [repo.alias for repo in registry.list()] == ["a", "renamed"]
+    assert listing[1].alias == "b"
+
+
+def test_repos_added_outside_the_api(tmp_path):
+    registry = RepoRegistry(str(tmp_path))
+    write_repo(tmp_path, "a", "2024-01-01", "https://example.com/a.git")
+    assert registry.find_by_url("https://example.com/a") == "a"
+
+    write_repo(tmp_path, "b", "2024-02-01", "https://example.com/b.git")
+    registry._revalidated = 0.0
+    registry.list()
+    deadline = time.monotonic() + 5
+    while len(registry.list()) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [repo.id for repo in registry.list()] == ["a", "b"]
@@ -0,0 +1,71 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.repos.common import REPOS_BASE_PATH
+
+STAGING = "/api/v1/repos/staging"
+
+
+def git(cwd, *args):
+    return subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def repo(client, tmp_path):
+    """Staging repo registered from a source repo with screens/a.json, removed afterwards"""
+    source = tmp_path / "source"
+    os.makedirs(source / "screens")
+    (source / "screens" / "a.json").write_text("[]\n")
+    git(source, "init", "-q")
+    git(source, "add", ".")
+    git(source, "commit", "-q", "-m", "initial")
+
+    response = client.post(f"{STAGING}/register", json={"alias": "test", "git_url": str(source)})
+    assert response.status_code == 200
+    repo_id = response.json()["id"]
+    yield repo_id, os.path.join(REPOS_BASE_PATH, repo_id, "staging")
+    shutil.rmtree(os.path.join(REPOS_BASE_PATH, repo_id), ignore_errors=True)
+
+
+def tree_status(tree_info):
+    return {f["path"]: f["status"] for f in tree_info["working_tree_status"]["files"]}
+
+
+def test_save_keeps_status_of_other_changes(client, repo):
+    repo_id, repo_path = repo
+    with open(os.path.join(repo_path, "screens", "ext.json"), "w") as f:
+        f.write("[]\n")
+    tree = client.get(f"{STAGING}/{repo_id}/tree").json()
+    assert tree_status(tree)["screens/ext.json"] == "untracked"
+
+    response = client.put(
+        f"{STAGING}/{repo_id}/file",
+        params={"path": "screens/a.json", "tree_version": tree["tree_version"]},
+        json={"content": '[{"id": "w1"}]'},
+    )
+    assert response.status_code == 200
+    delta = response.json()["delta"]
+    assert [entry["path"] for entry in delta["status"]] == ["screens/a.json"]
+    assert delta["status_removed"] == []
+
+    porcelain = git(repo_path, "status", "--porcelain", "--untracked-files=all")
+    assert "?? screens/ext.json" in porcelain.splitlines()
+    status = tree_status(client.get(f"{STAGING}/{repo_id}/tree").json())
+    assert status["screens/ext.json"] == "untracked"
+    assert status["screens/a.json"] == "modified"
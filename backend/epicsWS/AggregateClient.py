@@ -0,0 +1,265 @@
+from typing import Callable, Dict, Set, Any, List, Tuple, Optional, FrozenSet
+import json
+import re
+import threading
+import time
+
+from pvParser import PVData
+
+# alarm severities as defined by EPICS: NO_ALARM, MINOR, MAJOR, INVALID
+SEVERITY_LEVELS = 4
+AGGREGATE_FIELDS: FrozenSet[str] = frozenset({"alarm"})
+
+_BRACE_RE = re.compile(r"\{([^{}]*)\}")
+_RANGE_RE = re.compile(r"^(-?\d+)\.\.(-?\d+)$")
+# members of an aggregate given as a pattern by a client (agg://<pattern>), not in the definitions
+MAX_PATTERN_MEMBERS = 1000
+
+
+def _pattern_options(body: str, limit: Optional[int]) -> List[str]:
+    """Alternatives of one brace group"""
+    range_match = _RANGE_RE.match(body)
+    if not range_match:
+        return body.split(",")
+    lo, hi = range_match.groups()
+    if limit is not None and abs(int(hi) - int(lo)) + 1 > limit:
+        raise ValueError(f"Range {{{body}}} has more than {limit} values")
+    width = len(lo) if lo.startswith("0") and len(lo) > 1 else 0
+    step = 1 if int(hi) >= int(lo) else -1
+    return [str(i).zfill(width) for i in range(int(lo), int(hi) + step, step)]
+
+
+def expand_pattern(pattern: str, limit: Optional[int] = None) -> List[str]:
+    """
+    Expand shell-like brace patterns into PV names.
+    - "{a,b}" expands to alternatives
+    - "{1..10}" expands to a numeric range (zero padding of the bounds is kept)
+    Raises ValueError, before expanding anything, if a range or the result would have more than
+    limit names.
+    """
+    names = [pattern]
+    while True:
+        match = _BRACE_RE.search(names[0])
+        if not match:
+            return names
+        options = _pattern_options(match.group(1), limit)
+        if limit is not None and len(names) * len(options) > limit:
+            raise ValueError(f"Pattern {pattern} expands to more than {limit} names")
+        expanded: List[str] = []
+        for name in names:
+            # every name has its first brace group at the same place
+            match = _BRACE_RE.search(name)
+            head, tail = name[: match.start()], name[match.end() :]
+            expanded.extend(head + option + tail for option in options)
+        names = expanded
+
+
+def load_aggregate_definitions(path: Optional[str]) -> Dict[str, List[str]]:
+    """
+    Load aggregate definitions from a JSON file in the format:
+    {"<name>": {"pvs": ["pva://a", "b"], "patterns": ["demo:ai{1..100}"]}}
+    Returns aggregate name -> list of member PV names.
+    """
+    if not path:
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[AggregateClient]: Failed to load aggregates from {path}: {e}")
+        return {}
+
+    definitions: Dict[str, List[str]] = {}
+    for name, definition in raw.items():
+        members = list(definition.get("pvs", []))
+        for pattern in definition.get("patterns", []):
+            members.extend(expand_pattern(pattern))
+        definitions[name] = list(dict.fromkeys(members))
+    return definitions
+
+
+class AlarmAggregate:
+    """
+    Alarm summary over a set of member PVs, updated incrementally on each member update.
+    """
+
+    def __init__(self, name: str, members: List[str]):
+        self.name = name
+        self.members = members
+        self._severities: Dict[str, int] = {}
+        self._counts = [0] * SEVERITY_LEVELS
+        self._in_alarm: Set[str] = set()
+        self.timestamp = time.time()
+        # True while an update for this aggregate is queued, so bursts are published once
+        self.pending = False
+
+    @property
+    def max_severity(self) -> int:
+        for severity in range(SEVERITY_LEVELS - 1, -1, -1):
+            if self._counts[severity]:
+                return severity
+        return 0
+
+    def update(self, member: str, severity: int) -> bool:
+        """Account for a member severity. Returns True if the summary changed."""
+        severity = min(max(int(severity), 0), SEVERITY_LEVELS - 1)
+        previous = self._severities.get(member)
+        if previous == severity:
+            return False
+
+        if previous is not None:
+            self._counts[previous] -= 1
+        self._counts[severity] += 1
+        self._severities[member] = severity
+        if severity:
+            self._in_alarm.add(member)
+        else:
+            self._in_alarm.discard(member)
+        self.timestamp = time.time()
+        return True
+
+    def snapshot(self) -> dict:
+        """Current summary, clears the pending flag"""
+        self.pending = False
+        return {
+            "maxSeverity": self.max_severity,
+            "counts": list(self._counts),
+            "inAlarm": sorted(self._in_alarm),
+            "members": len(self.members),
+            "connected": len(self._severities),
+            "timestamp": self.timestamp,
+        }
+
+
+class AggregateClient:
+    """
+    Virtual provider for alarm aggregate channels (agg://<name>).
+    Members are watched through the regular providers, requesting only the alarm field. A client
+    subscribing to an aggregate receives a single summary instead of every member update.
+    """
+
+    def __init__(
+        self,
+        handle_update: Callable[[str, Any], None],
+        watch: Callable[[str, str, Callable[[str, PVData], None], FrozenSet[str]], None],
+        unwatch: Callable[[str, str], None],
+        definitions: Dict[str, List[str]],
+        max_pattern_members: int = MAX_PATTERN_MEMBERS,
+    ):
+        """
+        handle_update: callable(name: str, aggregate: AlarmAggregate)
+        watch: callable(watcher_id, pv, callback(pv_name, pv_data), fields)
+        unwatch: callable(watcher_id, pv)
+        definitions: aggregate name -> member PV names. Names not defined here are expanded as a
+        brace pattern, e.g. agg://demo:ai{1..10}.
+        max_pattern_members: maximum members of such a pattern (larger aggregates must be defined)
+        """
+        self._handle_update = handle_update
+        self._watch = watch
+        self._unwatch = unwatch
+        self._definitions = definitions
+        self._max_pattern_members = max_pattern_members
+        self._aggregates: Dict[str, AlarmAggregate] = {}
+        self._subscribers: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def _watcher_id(self, name: str) -> str:
+        return f"agg://{name}"
+
+    def _publish(self, aggregate: AlarmAggregate):
+        if not aggregate.pending:
+            aggregate.pending = True
+            self._handle_update(aggregate.name, aggregate)
+
+    def _on_member_update(self, aggregate: AlarmAggregate) -> Callable[[str, PVData], None]:
+        def callback(member: str, pv_data: PVData):
+            severity = pv_data.alarm.severity if pv_data.alarm else 0
+            with self._lock:
+                changed = aggregate.update(member, severity)
+            if changed:
+                self._publish(aggregate)
+
+        return callback
+
+    def subscribe(self, client_id: str, name: str, fields: Optional[FrozenSet[str]] = None):
+        """Subscribe a client to an aggregate, watching its members on first subscription."""
+        with self._lock:
+            aggregate = self._aggregates.get(name)
+            first_sub = aggregate is None
+            if first_sub:
+                members = self._definitions.get(name)
+                if members is None:
+                    try:
+                        members = expand_pattern(name, self._max_pattern_members)
+                    except ValueError as e:
+                        print(f"[AggregateClient]: Invalid aggregate {name}: {e}")
+                        return
+                aggregate = AlarmAggregate(name, members)
+                self._aggregates[name] = aggregate
+            self._subscribers.setdefault(name, set()).add(client_id)
+
+        if first_sub:
+            callback = self._on_member_update(aggregate)
+            for member in aggregate.members:
+                try:
+                    self._watch(self._watcher_id(name), member, callback, AGGREGATE_FIELDS)
+                except Exception as e:
+                    print(f"[AggregateClient]: Failed to watch {member} for {name}: {e}")
+        # late subscribers (and empty aggregates) get the current summary right away
+        self._handle_update(name, aggregate)
+
+    def _pop(self, name: str) -> Optional[AlarmAggregate]:
+        """Forget an aggregate. Must be called with the lock held."""
+        self._subscribers.pop(name, None)
+        return self._aggregates.pop(name, None)
+
+    def _release(self, aggregate: Optional[AlarmAggregate]):
+        """Stop watching the members of a forgotten aggregate"""
+        if aggregate:
+            for member in aggregate.members:
+                self._unwatch(self._watcher_id(aggregate.name), member)
+
+    def unsubscribe(self, client_id: str, name: str):
+        """Unsubscribe a client from an aggregate."""
+        with self._lock:
+            clients = self._subscribers.get(name)
+            if not clients:
+                return
+            clients.discard(client_id)
+            aggregate = self._pop(name) if not clients else None
+        self._release(aggregate)
+
+    def unsubscribe_all(self, client_id: str):
+        """Remove a client from all aggregates."""
+        with self._lock:
+            empty = []
+            for name, clients in self._subscribers.items():
+                clients.discard(client_id)
+                if not clients:
+                    empty.append(name)
+            released = [self._pop(name) for name in empty]
+        for aggregate in released:
+            self._release(aggregate)
+
+    def write_to_pv(self, name: str, value: Any):
+        print(f"[AggregateClient]: Aggregate {name} is read-only. Ignoring write.")
+
+    def write_many(self, items: List[Tuple[str, Any]]) -> List[Optional[str]]:
+        return ["Aggregates are read-only"] * len(items)
+
+    def get_many(self, names: List[str]) -> List[Tuple[Optional[Any], Optional[str]]]:
+        """Current summary of already subscribed aggregates."""
+        with self._lock:
+            return [
+                (self._aggregates[name], None)
+                if name in self._aggregates
+                else (None, "Aggregate not active")
+                for name in names
+            ]
+
+    def close(self):
+        with self._lock:
+            released = [self._pop(name) for name in list(self._aggregates)]
+        for aggregate in released:
+            self._release(aggregate)
+        print("[AggregateClient]: Closed all aggregates.")
@@ -1,6 +1,12 @@
-from typing import Callable, Dict, Set, Any
+from typing import Callable, Dict, Set, Any, List, Tuple, Optional, FrozenSet
 from threading import Lock
+import time
 import epics
+from epics import ca
+from pvParser import METADATA_FIELDS
+
+# timeout (in seconds) for connecting and completing batched get/put operations
+BATCH_TIMEOUT = 5.0
 
 
 class CAClient:
@@ -18,6 +24,9 @@ class CAClient:
         self._subscribers: Dict[str, Set[str]] = {}
         self._lock = Lock()
         self._latest_value: Dict[str, Any] = {}
+        self._with_ctrlvars: Set[str] = set()  # PVs whose callbacks carry control metadata
+        # PV -> get_many calls using a channel that get_many opened, cleared after the last one
+        self._get_channels: Dict[str, int] = {}
 
     def _callback(self, value, **kwargs):
         """Generic callback for all PVs — passes raw data upstream."""
@@ -31,26 +40,40 @@ class CAClient:
 
         self._handle_update(pvname, val)
 
-    def subscribe(self, client_id: str, pv_name: str):
+    def subscribe(self, client_id: str, pv_name: str, fields: Optional[FrozenSet[str]] = None):
         """
         Subscribe a client to a PV.
         On first subscription, creates the PV and attaches a callback.
+        Control variables are only fetched when metadata fields are requested.
         """
+        needs_ctrlvars = fields is None or bool(fields & METADATA_FIELDS)
         with self._lock:
             first_sub = pv_name not in self._pvs
+            pv = self._pvs.get(pv_name)
+            add_ctrlvars = needs_ctrlvars and not first_sub and pv_name not in self._with_ctrlvars
             self._subscribers.setdefault(pv_name, set()).add(client_id)
-            if not first_sub and pv_name in self._latest_value:
+            if not first_sub and not add_ctrlvars and pv_name in self._latest_value:
                 self._handle_update(pv_name, self._latest_value[pv_name])
 
         if first_sub:
             try:
                 pv = epics.get_pv(pv_name)
-                pv.get_ctrlvars()
-                cb = pv.add_callback(self._callback, with_ctrlvars=True)
+                if needs_ctrlvars:
+                    pv.get_ctrlvars()
+                    self._with_ctrlvars.add(pv_name)
+                cb = pv.add_callback(self._callback, with_ctrlvars=needs_ctrlvars)
                 pv.run_callback(cb)
                 self._pvs[pv_name] = pv
             except Exception as e:
                 print(f"[CAClient]: Failed to subscribe to {pv_name}: {e}")
+        elif add_ctrlvars and pv:
+            # ctrl values are kept by the PV and passed to every later callback
+            try:
+                pv.get_ctrlvars()
+                self._with_ctrlvars.add(pv_name)
+                pv.run_callbacks()
+            except Exception as e:
+                print(f"[CAClient]: Failed to get control variables for {pv_name}: {e}")
 
     def unsubscribe(self, client_id: str, pv_name: str):
         """Unsubscribe a client from a PV."""
@@ -64,6 +87,7 @@ class CAClient:
                 pv = self._pvs.pop(pv_name, None)
                 self._subscribers.pop(pv_name, None)
                 self._latest_value.pop(pv_name, None)
+                self._with_ctrlvars.discard(pv_name)
                 if pv:
                     try:
                         pv.clear_callbacks()
@@ -83,6 +107,7 @@ class CAClient:
                 pv = self._pvs.pop(pv_name, None)
                 self._subscribers.pop(pv_name, None)
                 self._latest_value.pop(pv_name, None)
+                self._with_ctrlvars.discard(pv_name)
                 if pv:
                     try:
                         pv.clear_callbacks()
@@ -102,6 +127,118 @@ class CAClient:
         except Exception as e:
             print(f"[CAClient]: Write to {pv_name} failed: {e}")
 
+    def write_many(
+        self, items: List[Tuple[str, Any]], timeout: float = BATCH_TIMEOUT
+    ) -> List[Optional[str]]:
+        """
+        Write to several PVs as one batch.
+        All channels are searched at once and puts are issued without waiting, then completion is
+        awaited for the whole batch. Like write_to_pv, only subscribed PVs can be written.
+        Returns one error message per item (None on success).
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            pvs = [self._pvs.get(pv_name) for pv_name, _ in items]
+        errors: List[Optional[str]] = [None] * len(items)
+
+        for i, pv in enumerate(pvs):
+            if not pv:
+                errors[i] = "Not subscribed"
+            elif not pv.wait_for_connection(timeout=max(deadline - time.monotonic(), 0.01)):
+                errors[i] = "Not connected"
+
+        pending = []
+        for i, (pv, (pv_name, value)) in enumerate(zip(pvs, items)):
+            if errors[i]:
+                continue
+            try:
+                pv.put(value, wait=False, use_complete=True)
+                pending.append(i)
+            except Exception as e:
+                print(f"[CAClient]: Write to {pv_name} failed: {e}")
+                errors[i] = str(e)
+
+        while pending and time.monotonic() < deadline:
+            ca.poll()
+            pending = [i for i in pending if not pvs[i].put_complete]
+        for i in pending:
+            errors[i] = "Put timed out"
+
+        return errors
+
+    def _open_get_channels(self, pv_names: List[str]) -> list:
+        """Channel ids for get_many: existing channels are reused, others opened for the get"""
+        chids = []
+        with self._lock:
+            for pv_name in pv_names:
+                if pv_name in self._get_channels:
+                    self._get_channels[pv_name] += 1
+                elif ca.get_cache(pv_name) is None:
+                    ca.create_channel(pv_name, connect=False, auto_cb=False)
+                    self._get_channels[pv_name] = 1
+                chids.append(ca.get_cache(pv_name).chid)
+        return chids
+
+    def _close_get_channels(self, pv_names: List[str]):
+        """Clear the channels opened by get_many, unless a PV started using them meanwhile"""
+        with self._lock:
+            for pv_name in pv_names:
+                if pv_name not in self._get_channels:
+                    continue
+                self._get_channels[pv_name] -= 1
+                if self._get_channels[pv_name]:
+                    continue
+                del self._get_channels[pv_name]
+                entry = ca.get_cache(pv_name)
+                if entry is not None and entry.chid is not None and not entry.callbacks:
+                    ca.clear_channel(entry.chid)
+
+    def get_many(
+        self, pv_names: List[str], timeout: float = BATCH_TIMEOUT
+    ) -> List[Tuple[Optional[dict], Optional[str]]]:
+        """
+        One-shot read of several PVs (with control metadata) as one batch, without subscribing.
+        Returns (raw_data, error) per PV, where raw_data has the same layout as callback data.
+        """
+        deadline = time.monotonic() + timeout
+        chids = self._open_get_channels(pv_names)
+        try:
+            return self._get_channels_data(pv_names, chids, deadline)
+        finally:
+            self._close_get_channels(pv_names)
+
+    def _get_channels_data(
+        self, pv_names: List[str], chids: list, deadline: float
+    ) -> List[Tuple[Optional[dict], Optional[str]]]:
+        results: List[Tuple[Optional[dict], Optional[str]]] = [(None, None)] * len(pv_names)
+
+        requested = []
+        for i, chid in enumerate(chids):
+            try:
+                if not ca.connect_channel(chid, timeout=max(deadline - time.monotonic(), 0.01)):
+                    results[i] = (None, "Not connected")
+                    continue
+                ftype = ca.promote_type(chid, use_ctrl=True)
+                ca.get_with_metadata(chid, ftype=ftype, wait=False)
+                requested.append((i, ftype))
+            except Exception as e:
+                results[i] = (None, str(e))
+
+        ca.poll()
+        for i, ftype in requested:
+            try:
+                data = ca.get_complete_with_metadata(
+                    chids[i], ftype=ftype, timeout=max(deadline - time.monotonic(), 0.01)
+                )
+                if data is None:
+                    results[i] = (None, "Get timed out")
+                else:
+                    results[i] = ({**data, "pvname": pv_names[i]}, None)
+            except Exception as e:
+                results[i] = (None, str(e))
+
+        return results
+
     def close(self):
         """Stop all subscriptions and clear resources."""
         with self._lock:
@@ -113,4 +250,5 @@ class CAClient:
             self._pvs.clear()
             self._subscribers.clear()
             self._latest_value.clear()
+            self._with_ctrlvars.clear()
         print("[CAClient]: Closed all subscriptions.")
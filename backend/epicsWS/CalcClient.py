@@ -0,0 +1,310 @@
+from typing import Callable, Dict, Set, Any, List, Tuple, Optional, FrozenSet
+import ast
+import re
+import threading
+import time
+import numpy as np
+
+from pvParser import PVData
+
+CALC_FIELDS: FrozenSet[str] = frozenset({"value", "alarm", "timeStamp"})
+INVALID_SEVERITY = 3
+
+# PV references inside an expression, e.g. "({demo:ai1} + {pva://demo:ai2}) / 2"
+_PV_REF_RE = re.compile(r"\{([^{}]+)\}")
+
+# functions available in expressions, all vectorized over array inputs
+FUNCTIONS: Dict[str, Callable] = {
+    "abs": np.abs,
+    "sqrt": np.sqrt,
+    "exp": np.exp,
+    "log": np.log,
+    "log10": np.log10,
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "asin": np.arcsin,
+    "acos": np.arccos,
+    "atan": np.arctan,
+    "atan2": np.arctan2,
+    "floor": np.floor,
+    "ceil": np.ceil,
+    "round": np.round,
+    "minimum": np.minimum,
+    "maximum": np.maximum,
+    "where": np.where,
+    "sum": np.sum,
+    "mean": np.mean,
+    "min": np.min,
+    "max": np.max,
+    "std": np.std,
+}
+CONSTANTS: Dict[str, float] = {"pi": np.pi, "e": np.e}
+
+_ALLOWED_NODES = (
+    ast.Expression,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.Compare,
+    ast.Call,
+    ast.Name,
+    ast.Load,
+    ast.Constant,
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.FloorDiv,
+    ast.Mod,
+    ast.Pow,
+    ast.unaryop,
+    ast.cmpop,
+)
+# integer constants must be exactly representable as float64 (all arithmetic is done in floats)
+MAX_INT_CONSTANT = 2**53
+# exponents must be constants no larger than this, so evaluation time stays bounded
+MAX_EXPONENT = 64
+
+
+def _constant_value(node: ast.AST) -> Optional[float]:
+    """Value of a numeric constant, optionally negated, None for anything else"""
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = _constant_value(node.operand)
+        return None if value is None else (-value if isinstance(node.op, ast.USub) else value)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return float(node.value)
+    return None
+
+
+def compile_expression(expression: str) -> Tuple[Any, List[str]]:
+    """
+    Compile a calc expression once.
+    PV references ({pv}) are replaced by variables; only arithmetic, comparisons, numeric
+    constants and the functions in FUNCTIONS are allowed. Constants are turned into floats and
+    exponents are bounded constants, so that no expression can take unbounded time.
+    Returns (code object, list of input PV names by variable index).
+    """
+    inputs: List[str] = []
+
+    def replace(match: re.Match) -> str:
+        pv = match.group(1).strip()
+        if pv not in inputs:
+            inputs.append(pv)
+        return f"_v{inputs.index(pv)}"
+
+    source = _PV_REF_RE.sub(replace, expression)
+    tree = ast.parse(source.strip(), mode="eval")
+    names = {f"_v{i}" for i in range(len(inputs))} | FUNCTIONS.keys() | CONSTANTS.keys()
+
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"Unsupported syntax in expression: {type(node).__name__}")
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                raise ValueError(f"Unsupported constant in expression: {node.value!r}")
+            if isinstance(node.value, int) and abs(node.value) > MAX_INT_CONSTANT:
+                raise ValueError(f"Constant too large in expression: {node.value}")
+            # never evaluate with Python's unbounded integers
+            node.value = float(node.value)
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+            exponent = _constant_value(node.right)
+            if exponent is None or abs(exponent) > MAX_EXPONENT:
+                raise ValueError(
+                    f"Exponents must be constants between -{MAX_EXPONENT} and {MAX_EXPONENT}"
+                )
+        if isinstance(node, ast.Name) and node.id not in names:
+            raise ValueError(f"Unknown name in expression: {node.id}")
+        if isinstance(node, ast.Call) and (
+            not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords
+        ):
+            raise ValueError("Only positional calls to known functions are allowed")
+
+    if not inputs:
+        raise ValueError("Expression does not reference any PV")
+    return compile(tree, "<calc>", "eval"), inputs
+
+
+class CalcChannel:
+    """
+    A computed PV: keeps the latest value of each input and evaluates the compiled expression
+    when the result is requested (once per burst of input updates).
+    """
+
+    def __init__(self, name: str, code: Any, inputs: List[str]):
+        self.name = name
+        self.inputs = inputs
+        self._code = code
+        self._index = {pv: i for i, pv in enumerate(inputs)}
+        self._values: List[Any] = [None] * len(inputs)
+        self._severities = [0] * len(inputs)
+        self._timestamps = [0.0] * len(inputs)
+        # True while an update for this channel is queued, so bursts are evaluated once
+        self.pending = False
+
+    @property
+    def ready(self) -> bool:
+        """True once every input has a value"""
+        return all(v is not None for v in self._values)
+
+    def update(self, pv: str, pv_data: PVData) -> bool:
+        """Store an input update. Returns True once every input has a value."""
+        i = self._index.get(pv)
+        if i is None:
+            return False
+        if pv_data.array is not None:
+            self._values[i] = pv_data.array
+        elif isinstance(pv_data.value, (list, tuple)):
+            self._values[i] = np.asarray(pv_data.value)
+        elif isinstance(pv_data.value, (bool, int, np.integer)):
+            # evaluate in float64, never with Python's unbounded integers
+            self._values[i] = float(pv_data.value)
+        else:
+            self._values[i] = pv_data.value
+        self._severities[i] = pv_data.alarm.severity if pv_data.alarm else 0
+        if pv_data.timeStamp:
+            ts = pv_data.timeStamp
+            self._timestamps[i] = ts.secondsPastEpoch + ts.nanoseconds * 1e-9
+        return self.ready
+
+    def evaluate(self) -> dict:
+        """Evaluate the expression, clears the pending flag"""
+        self.pending = False
+        namespace = {f"_v{i}": v for i, v in enumerate(self._values)}
+        namespace.update(FUNCTIONS)
+        namespace.update(CONSTANTS)
+        result = {
+            "severity": max(self._severities),
+            "timestamp": max(self._timestamps) or time.time(),
+            "value": None,
+            "error": None,
+        }
+        try:
+            with np.errstate(all="ignore"):
+                result["value"] = eval(self._code, {"__builtins__": {}}, namespace)
+        except Exception as e:
+            result["severity"] = INVALID_SEVERITY
+            result["error"] = str(e)
+        return result
+
+
+class CalcClient:
+    """
+    Virtual provider for computed PVs (calc://<expression>).
+    Expressions are compiled once per distinct expression and shared by all clients using it.
+    Inputs are watched through the regular providers.
+    """
+
+    def __init__(
+        self,
+        handle_update: Callable[[str, Any], None],
+        watch: Callable[[str, str, Callable[[str, PVData], None], FrozenSet[str]], None],
+        unwatch: Callable[[str, str], None],
+    ):
+        """
+        handle_update: callable(name: str, channel: CalcChannel)
+        watch: callable(watcher_id, pv, callback(pv_name, pv_data), fields)
+        unwatch: callable(watcher_id, pv)
+        """
+        self._handle_update = handle_update
+        self._watch = watch
+        self._unwatch = unwatch
+        self._channels: Dict[str, CalcChannel] = {}
+        self._subscribers: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def _watcher_id(self, name: str) -> str:
+        return f"calc://{name}"
+
+    def _on_input_update(self, channel: CalcChannel) -> Callable[[str, PVData], None]:
+        def callback(pv: str, pv_data: PVData):
+            with self._lock:
+                ready = channel.update(pv, pv_data)
+                publish = ready and not channel.pending
+                if publish:
+                    channel.pending = True
+            if publish:
+                self._handle_update(channel.name, channel)
+
+        return callback
+
+    def subscribe(self, client_id: str, name: str, fields: Optional[FrozenSet[str]] = None):
+        """Subscribe a client to a computed PV, compiling it on first subscription."""
+        with self._lock:
+            channel = self._channels.get(name)
+            first_sub = channel is None
+            if first_sub:
+                try:
+                    code, inputs = compile_expression(name)
+                except (SyntaxError, ValueError) as e:
+                    print(f"[CalcClient]: Invalid expression {name}: {e}")
+                    return
+                channel = CalcChannel(name, code, inputs)
+                self._channels[name] = channel
+            self._subscribers.setdefault(name, set()).add(client_id)
+            late = not first_sub and channel.ready
+
+        if first_sub:
+            callback = self._on_input_update(channel)
+            for pv in channel.inputs:
+                try:
+                    self._watch(self._watcher_id(name), pv, callback, CALC_FIELDS)
+                except Exception as e:
+                    print(f"[CalcClient]: Failed to watch {pv} for {name}: {e}")
+        elif late:
+            self._handle_update(name, channel)
+
+    def _pop(self, name: str) -> Optional[CalcChannel]:
+        """Forget a channel. Must be called with the lock held."""
+        self._subscribers.pop(name, None)
+        return self._channels.pop(name, None)
+
+    def _release(self, channel: Optional[CalcChannel]):
+        """Stop watching the inputs of a forgotten channel"""
+        if channel:
+            for pv in channel.inputs:
+                self._unwatch(self._watcher_id(channel.name), pv)
+
+    def unsubscribe(self, client_id: str, name: str):
+        """Unsubscribe a client from a computed PV."""
+        with self._lock:
+            clients = self._subscribers.get(name)
+            if not clients:
+                return
+            clients.discard(client_id)
+            channel = self._pop(name) if not clients else None
+        self._release(channel)
+
+    def unsubscribe_all(self, client_id: str):
+        """Remove a client from all computed PVs."""
+        with self._lock:
+            empty = []
+            for name, clients in self._subscribers.items():
+                clients.discard(client_id)
+                if not clients:
+                    empty.append(name)
+            released = [self._pop(name) for name in empty]
+        for channel in released:
+            self._release(channel)
+
+    def write_to_pv(self, name: str, value: Any):
+        print(f"[CalcClient]: Computed PV {name} is read-only. Ignoring write.")
+
+    def write_many(self, items: List[Tuple[str, Any]]) -> List[Optional[str]]:
+        return ["Computed PVs are read-only"] * len(items)
+
+    def get_many(self, names: List[str]) -> List[Tuple[Optional[Any], Optional[str]]]:
+        """Current result of already subscribed computed PVs."""
+        with self._lock:
+            return [
+                (self._channels[name], None)
+                if name in self._channels and self._channels[name].ready
+                else (None, "Computed PV not active")
+                for name in names
+            ]
+
+    def close(self):
+        with self._lock:
+            released = [self._pop(name) for name in list(self._channels)]
+        for channel in released:
+            self._release(channel)
+        print("[CalcClient]: Closed all computed PVs.")
@@ -0,0 +1,198 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+import asyncio
+
+from TokenBucket import TokenBucket
+
+# a connection whose socket buffer holds more than this (bytes) is skipped until it drains; its
+# queue keeps coalescing meanwhile. Kept well below the websockets write_limit (32 KiB), above which
+# ws.send() itself waits for the buffer to drain
+MAX_BUFFERED = 16 * 1024
+# how often backpressured connections are polled (s)
+BACKPRESSURE_POLL = 0.05
+
+
+def parse_weights(spec: Optional[str]) -> List[Tuple[str, float]]:
+    """
+    Parse "<address prefix>=<weight>,..." (e.g. "10.0.1.=4,127.0.0.1=2") into a list of
+    (prefix, weight), longest prefix first.
+    """
+    weights: List[Tuple[str, float]] = []
+    for entry in (spec or "").split(","):
+        prefix, sep, weight = entry.strip().partition("=")
+        if not sep:
+            continue
+        try:
+            weights.append((prefix.strip(), max(float(weight), 0.1)))
+        except ValueError:
+            print(f"[ClientSession]: Ignoring invalid weight '{entry}'")
+    return sorted(weights, key=lambda w: len(w[0]), reverse=True)
+
+
+def client_weight(address: str, weights: List[Tuple[str, float]]) -> float:
+    for prefix, weight in weights:
+        if address.startswith(prefix):
+            return weight
+    return 1.0
+
+
+class Frame:
+    """An encoded update (JSON text or binary image frame) waiting to be sent"""
+
+    __slots__ = ("pv", "data", "metadata", "trace", "timestamp")
+
+    def __init__(
+        self, pv: str, data: Union[str, bytes], metadata: bool, trace: Any = None, timestamp=None
+    ):
+        self.pv = pv
+        self.data = data
+        self.metadata = metadata
+        self.trace = trace
+        self.timestamp = timestamp
+
+
+class ClientSession:
+    """
+    State of one websocket connection: subscribed PVs, quotas and the outbound update queue.
+    The queue holds at most one frame per PV; a newer update replaces a pending one in place, so a
+    throttled or slow client receives the latest values at a lower rate instead of a growing
+    backlog.
+    """
+
+    def __init__(
+        self,
+        ws,
+        client_id: str,
+        weight: float = 1.0,
+        max_pvs: int = 0,
+        max_rate: float = 0,
+        max_bps: float = 0,
+    ):
+        """
+        weight: share of the send bandwidth, also scales the rate limits
+        max_pvs: maximum number of subscribed PVs (0: unlimited)
+        max_rate: maximum updates per second (0: unlimited)
+        max_bps: maximum outbound bytes per second (0: unlimited)
+        """
+        self.ws = ws
+        self.client_id = client_id
+        self.weight = weight
+        self.max_pvs = max_pvs
+        self.pvs: Set[str] = set()
+        self.pending: "OrderedDict[str, Frame]" = OrderedDict()
+        self.coalesced = 0
+        self._rate = TokenBucket(max_rate * weight)
+        self._bytes = TokenBucket(max_bps * weight)
+        # task writing the frames of the last scheduler turn to the socket
+        self.writer: Optional[asyncio.Task] = None
+
+    def can_subscribe(self, pv_name: str) -> bool:
+        return not self.max_pvs or pv_name in self.pvs or len(self.pvs) < self.max_pvs
+
+    def enqueue(self, pv_name: str, frame: Frame):
+        if pv_name in self.pending:
+            self.coalesced += 1
+        self.pending[pv_name] = frame
+
+    def discard(self, pv_name: str):
+        self.pvs.discard(pv_name)
+        self.pending.pop(pv_name, None)
+
+    def throttle_delay(self) -> float:
+        """Seconds until the rate limits allow the next frame"""
+        return max(self._rate.delay(), self._bytes.delay())
+
+    def backpressured(self) -> bool:
+        """True while frames are still being written, or while the socket buffer is full"""
+        if self.writer is not None and not self.writer.done():
+            return True
+        transport = getattr(self.ws, "transport", None)
+        return transport is not None and transport.get_write_buffer_size() > MAX_BUFFERED
+
+    def pop(self) -> Tuple[str, Frame]:
+        pv_name, frame = self.pending.popitem(last=False)
+        self._rate.take()
+        self._bytes.take(len(frame.data))
+        return pv_name, frame
+
+
+class SendScheduler:
+    """
+    Sends queued updates for all connections from a single task, in weighted round-robin order:
+    each round a connection may send up to weight * quantum frames, within its rate limits.
+    The frames of a turn are written by a task of the connection, so a slow client waiting for its
+    socket to drain never holds up the others.
+    """
+
+    def __init__(self, quantum: int, on_sent: Callable[[ClientSession, str, Frame], None]):
+        """
+        quantum: frames per round for a connection of weight 1
+        on_sent: callable(session, pv_name, frame) after each successful send
+        """
+        self.quantum = quantum
+        self._on_sent = on_sent
+        # connections with queued frames, in round-robin order
+        self._active: Dict[ClientSession, None] = {}
+        self._wakeup = asyncio.Event()
+
+    def wake(self, session: ClientSession):
+        self._active[session] = None
+        self._wakeup.set()
+
+    def remove(self, session: ClientSession):
+        self._active.pop(session, None)
+        session.pending.clear()
+        if session.writer is not None:
+            session.writer.cancel()
+
+    async def _write(self, session: ClientSession, frames: List[Tuple[str, Frame]]):
+        """Write the frames of one turn of a connection"""
+        for pv_name, frame in frames:
+            try:
+                await session.ws.send(frame.data)
+            except Exception:
+                print(f"[ClientSession]: Error sending update to {session.client_id}")
+                session.pending.clear()
+                return
+            self._on_sent(session, pv_name, frame)
+        if session.pending:
+            self.wake(session)
+
+    def _send_round(self) -> Tuple[bool, Optional[float]]:
+        """One round over the active connections. Returns (sent anything, time until next turn)"""
+        progressed = False
+        next_turn: Optional[float] = None
+        for session in list(self._active):
+            if session.backpressured():
+                delay = BACKPRESSURE_POLL
+            else:
+                budget = max(int(session.weight * self.quantum), 1)
+                frames: List[Tuple[str, Frame]] = []
+                delay = 0
+                while budget and session.pending:
+                    delay = session.throttle_delay()
+                    if delay:
+                        break
+                    frames.append(session.pop())
+                    budget -= 1
+                if frames:
+                    session.writer = asyncio.create_task(self._write(session, frames))
+                    progressed = True
+            if delay and session.pending:
+                next_turn = delay if next_turn is None else min(next_turn, delay)
+            if not session.pending:
+                self._active.pop(session, None)
+        return progressed, next_turn
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            progressed, next_turn = self._send_round()
+            if progressed:
+                # let the writers and the event loop ingest new updates between rounds
+                await asyncio.sleep(0)
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), next_turn)
+            except asyncio.TimeoutError:
+                pass
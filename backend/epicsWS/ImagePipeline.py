@@ -0,0 +1,120 @@
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple
+import json
+import struct
+import zlib
+import numpy as np
+
+from pvParser import PVData
+
+# zlib level for compressed frames: favour speed, image data rarely compresses much further
+COMPRESSION_LEVEL = 1
+MAX_BINNING = 64
+
+_HEADER_LENGTH = struct.Struct("<I")
+
+
+@dataclass(frozen=True)
+class ImageRequest:
+    """What a client wants from an image PV. Frames are computed once per distinct request."""
+
+    roi: Optional[Tuple[int, int, int, int]] = None  # x, y, width, height (full image if None)
+    binning: int = 1
+    max_rate: float = 0  # frames per second, 0: every frame
+    compress: bool = False
+
+
+DEFAULT_IMAGE_REQUEST = ImageRequest()
+
+
+def parse_image_request(spec: Any) -> ImageRequest:
+    """
+    Validate the "image" option of a subscription, e.g.
+    {"roi": [x, y, width, height], "bin": 2, "maxRate": 5, "compress": true}
+    """
+    if spec is None:
+        return DEFAULT_IMAGE_REQUEST
+    if not isinstance(spec, dict):
+        raise ValueError("image must be an object")
+
+    roi = spec.get("roi")
+    if roi is not None:
+        if (
+            not isinstance(roi, (list, tuple))
+            or len(roi) != 4
+            or not all(isinstance(v, int) and v >= 0 for v in roi)
+            or roi[2] == 0
+            or roi[3] == 0
+        ):
+            raise ValueError("image.roi must be [x, y, width, height] (non-negative integers)")
+        roi = tuple(roi)
+
+    binning = spec.get("bin", 1)
+    if not isinstance(binning, int) or not 1 <= binning <= MAX_BINNING:
+        raise ValueError(f"image.bin must be an integer between 1 and {MAX_BINNING}")
+
+    max_rate = spec.get("maxRate", 0)
+    if not isinstance(max_rate, (int, float)) or max_rate < 0:
+        raise ValueError("image.maxRate must be a non-negative number")
+
+    return ImageRequest(roi, binning, float(max_rate), bool(spec.get("compress", False)))
+
+
+def process_image(
+    image: np.ndarray, request: ImageRequest
+) -> Tuple[np.ndarray, Tuple[int, ...], int]:
+    """
+    Crop and bin an image of shape (height, width[, channels]).
+    Returns the result, the region actually used (x, y, width, height), clipped to the image, and
+    the binning applied (1 when the region is smaller than a bin).
+    """
+    height, width = image.shape[:2]
+    x, y, w, h = request.roi or (0, 0, width, height)
+    x, y = min(x, width), min(y, height)
+    w, h = min(w, width - x), min(h, height - y)
+    result = image[y : y + h, x : x + w]
+
+    b = request.binning if h >= request.binning and w >= request.binning else 1
+    if b > 1:
+        # average b x b blocks, dropping the incomplete ones at the edges
+        h, w = h // b * b, w // b * b
+        blocks = result[:h, :w].reshape((h // b, b, w // b, b) + result.shape[2:])
+        binned = blocks.mean(axis=(1, 3))
+        if np.issubdtype(image.dtype, np.integer):
+            binned = np.rint(binned)
+        result = binned.astype(image.dtype)
+    return np.ascontiguousarray(result), (x, y, w, h), b
+
+
+def encode_image(pv_data: PVData, pv_name: str, request: ImageRequest) -> bytes:
+    """
+    Binary websocket frame for an image update:
+    header length (u32, little endian), JSON header, then the raw pixels (little endian, row major,
+    channels interleaved), zlib compressed if requested.
+    """
+    result, roi, binning = process_image(pv_data.array, request)
+    if result.dtype.byteorder == ">":
+        result = result.astype(result.dtype.newbyteorder("<"))
+    payload = result.tobytes()
+    if request.compress:
+        payload = zlib.compress(payload, COMPRESSION_LEVEL)
+
+    info = pv_data.image
+    header = {
+        "type": "image",
+        "pv": pv_name,
+        "width": result.shape[1],
+        "height": result.shape[0],
+        "channels": info.channels,
+        "dtype": result.dtype.name,
+        "compression": "zlib" if request.compress else None,
+        "roi": list(roi),
+        "binning": binning,
+        "fullWidth": info.width,
+        "fullHeight": info.height,
+        "uniqueId": info.uniqueId,
+        "alarm": pv_data.alarm.__dict__ if pv_data.alarm else None,
+        "timeStamp": pv_data.timeStamp.__dict__ if pv_data.timeStamp else None,
+    }
+    encoded = json.dumps({k: v for k, v in header.items() if v is not None}).encode("utf-8")
+    return _HEADER_LENGTH.pack(len(encoded)) + encoded + payload
@@ -0,0 +1,159 @@
+from typing import Dict, List, Optional
+import bisect
+import threading
+import time
+
+# pipeline stages, in order
+STAGES = ("callback", "dequeue", "parsed", "encoded", "sent")
+
+# histogram bucket upper bounds in ms (last bucket is open ended)
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (ms)"""
+
+    __slots__ = ("counts", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms: float):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Upper bound of the bucket holding the p-th percentile"""
+        n = sum(self.counts)
+        if not n:
+            return None
+        rank = p / 100 * n
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        n = sum(self.counts)
+        return {
+            "count": n,
+            "mean": self.total / n if n else None,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max if n else None,
+            "counts": list(self.counts),
+        }
+
+
+class StageHistograms:
+    """
+    Per stage: latency from the PV timestamp to the stage, and time spent since the previous stage
+    """
+
+    def __init__(self):
+        self.since_timestamp = {stage: Histogram() for stage in STAGES}
+        self.since_previous = {stage: Histogram() for stage in STAGES[1:]}
+
+    def to_dict(self) -> dict:
+        return {
+            "sinceTimestamp": {s: h.to_dict() for s, h in self.since_timestamp.items()},
+            "sincePrevious": {s: h.to_dict() for s, h in self.since_previous.items()},
+        }
+
+
+class Trace:
+    """Wall-clock time of each stage reached by one sampled update"""
+
+    __slots__ = ("times",)
+
+    def __init__(self):
+        self.times: Dict[str, float] = {"callback": time.time()}
+
+    def mark(self, stage: str):
+        self.times[stage] = time.time()
+
+
+class LatencyTracer:
+    """
+    Sampled end-to-end latency tracing of PV updates, from the PV timestamp (set by the IOC) through
+    the provider callback, loop dequeue, parsing, encoding and websocket send.
+    One update out of every `every` is traced, so the cost for untraced updates is one counter
+    increment. Results are aggregated into global and per-PV histograms.
+    """
+
+    def __init__(self, sample_rate: float):
+        """sample_rate: fraction of updates to trace (0 disables tracing)"""
+        self.every = round(1 / sample_rate) if sample_rate > 0 else 0
+        self._counter = 0
+        self._global = StageHistograms()
+        self._per_pv: Dict[str, StageHistograms] = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    @property
+    def enabled(self) -> bool:
+        return self.every > 0
+
+    def start(self) -> Optional[Trace]:
+        """Called from the provider callback thread. Returns a trace for sampled updates."""
+        if not self.every:
+            return None
+        self._counter += 1
+        if self._counter % self.every:
+            return None
+        return Trace()
+
+    def finish(self, trace: Trace, pv: str, timestamp: Optional[float]):
+        """
+        Account for a completed trace. timestamp is the PV timestamp in seconds, if known;
+        otherwise latencies are measured from the provider callback.
+        """
+        origin = timestamp if timestamp else trace.times["callback"]
+        with self._lock:
+            targets = [self._global, self._per_pv.setdefault(pv, StageHistograms())]
+            previous: Optional[float] = None
+            for stage in STAGES:
+                t = trace.times.get(stage)
+                if t is None:
+                    continue
+                for histograms in targets:
+                    histograms.since_timestamp[stage].add(max(t - origin, 0.0) * 1000)
+                    if previous is not None:
+                        histograms.since_previous[stage].add(max(t - previous, 0.0) * 1000)
+                previous = t
+
+    def forget(self, pv: str):
+        with self._lock:
+            self._per_pv.pop(pv, None)
+
+    def snapshot(self, pvs: Optional[List[str]] = None) -> dict:
+        """Histograms as a JSON-serializable dict, per PV for the given PVs (all if None)"""
+        with self._lock:
+            if pvs is None:
+                selected = self._per_pv
+            else:
+                selected = {pv: self._per_pv[pv] for pv in pvs if pv in self._per_pv}
+            return {
+                "sampleEvery": self.every,
+                "since": self.started_at,
+                "bucketsMs": list(BUCKETS_MS),
+                "global": self._global.to_dict(),
+                "pvs": {pv: h.to_dict() for pv, h in selected.items()},
+            }
+
+    def report(self) -> str:
+        """One line summary of end-to-end latencies"""
+        with self._lock:
+            sent = self._global.since_timestamp["sent"]
+            callback = self._global.since_timestamp["callback"]
+            return (
+                f"traced={sum(sent.counts)} "
+                f"ioc->callback p50={callback.percentile(50)}ms p99={callback.percentile(99)}ms "
+                f"ioc->sent p50={sent.percentile(50)}ms p99={sent.percentile(99)}ms "
+                f"max={sent.max:.1f}ms"
+            )
@@ -1,7 +1,23 @@
-from typing import Callable, Dict, Set, Any
+from typing import Callable, Dict, Set, Any, List, Tuple, Optional, FrozenSet
 from p4p.client.thread import Context
 from p4p.client.thread import Subscription
 import threading
+from pvParser import merge_fields
+
+# timeout (in seconds) for batched get/put operations
+BATCH_TIMEOUT = 5.0
+# NTNDArray fields needed to decode its value (ignored by servers of other types)
+NDARRAY_FIELDS = {"dimension", "codec", "uniqueId", "attribute"}
+
+
+def pv_request(fields: Optional[FrozenSet[str]]) -> Optional[str]:
+    """Convert a client field mask into a pvRequest field selection (None: whole structure)."""
+    if fields is None:
+        return None
+    nt_fields = {"value" if f == "enumChoices" else f for f in fields}
+    if "value" in nt_fields:
+        nt_fields |= NDARRAY_FIELDS
+    return f"field({','.join(sorted(nt_fields))})"
 
 
 class PVAClient:
@@ -19,6 +35,9 @@ class PVAClient:
         self._ctxt = Context("pva", nt=False)  # nt=False to get unpacked data
         self._lock = threading.Lock()
         self._latest_value: Dict[str, Any] = {}  # pv_name -> last value
+        # pv_name -> {client_id: field mask}, and the mask the current monitor was opened with
+        self._fields: Dict[str, Dict[str, Optional[FrozenSet[str]]]] = {}
+        self._requested: Dict[str, Optional[FrozenSet[str]]] = {}
 
     def _on_update(self, pv_name: str) -> Callable[[Any], None]:
         """Return a callback for monitor updates."""
@@ -30,16 +49,34 @@ class PVAClient:
 
         return callback
 
-    def subscribe(self, client_id: str, pv_name: str):
-        """Subscribe a single client to a PV."""
+    def _open_monitor(self, pv_name: str, fields: Optional[FrozenSet[str]]):
+        """Create the monitor for a PV, requesting only the given fields from the server."""
+        request = pv_request(fields)
+        self._channels[pv_name] = self._ctxt.monitor(
+            pv_name, self._on_update(pv_name), request=request
+        )
+        self._requested[pv_name] = fields
+
+    def subscribe(self, client_id: str, pv_name: str, fields: Optional[FrozenSet[str]] = None):
+        """
+        Subscribe a single client to a PV.
+        The monitor requests the union of the fields of all subscribers. It is reopened (wider)
+        when a new subscriber needs fields the current one does not carry.
+        """
         with self._lock:
+            self._fields.setdefault(pv_name, {})[client_id] = fields
             if pv_name not in self._channels:
-                mon = self._ctxt.monitor(pv_name, self._on_update(pv_name))
-                self._channels[pv_name] = mon
+                self._open_monitor(pv_name, fields)
                 self._subscribers[pv_name] = set()
-            # Send last value if monitor already existed (late subscriber)
             else:
-                if pv_name in self._latest_value:
+                current = self._requested.get(pv_name)
+                merged = merge_fields(self._fields[pv_name].values())
+                if current is not None and (merged is None or not merged <= current):
+                    self._channels.pop(pv_name).close()
+                    self._latest_value.pop(pv_name, None)
+                    self._open_monitor(pv_name, merged)
+                # Send last value if monitor already existed (late subscriber)
+                elif pv_name in self._latest_value:
                     self._handle_update(pv_name, self._latest_value[pv_name])
             self._subscribers[pv_name].add(client_id)
 
@@ -49,10 +86,13 @@ class PVAClient:
             if pv_name not in self._subscribers:
                 return
             self._subscribers[pv_name].discard(client_id)
+            self._fields.get(pv_name, {}).pop(client_id, None)
 
             if not self._subscribers[pv_name]:
                 mon = self._channels.pop(pv_name, None)
                 self._latest_value.pop(pv_name, None)
+                self._fields.pop(pv_name, None)
+                self._requested.pop(pv_name, None)
                 if mon:
                     mon.close()
                 del self._subscribers[pv_name]
@@ -63,12 +103,15 @@ class PVAClient:
             empty_pvs = []
             for pv, clients in self._subscribers.items():
                 clients.discard(client_id)
+                self._fields.get(pv, {}).pop(client_id, None)
                 if not clients:
                     empty_pvs.append(pv)
 
             for pv in empty_pvs:
                 mon = self._channels.pop(pv, None)
                 self._latest_value.pop(pv, None)
+                self._fields.pop(pv, None)
+                self._requested.pop(pv, None)
                 if mon:
                     mon.close()
                 del self._subscribers[pv]
@@ -85,6 +128,55 @@ class PVAClient:
         except Exception as e:
             print(f"[PVAClient]: Write to PV {pv} failed: {e}")
 
+    def write_many(
+        self, items: List[Tuple[str, Any]], timeout: float = BATCH_TIMEOUT
+    ) -> List[Optional[str]]:
+        """
+        Write to several PVs as one batch (puts are issued in parallel by p4p).
+        Like write_to_pv, only subscribed PVs can be written.
+        Returns one error message per item (None on success).
+        """
+        errors: List[Optional[str]] = ["Not subscribed"] * len(items)
+        with self._lock:
+            positions = [i for i, (pv, _) in enumerate(items) if pv in self._channels]
+        for i in positions:
+            errors[i] = None
+        if not positions:
+            return errors
+        names = [items[i][0] for i in positions]
+        values = [items[i][1] for i in positions]
+        try:
+            results = self._ctxt.put(names, values, timeout=timeout, throw=False)
+        except Exception as e:
+            print(f"[PVAClient]: Batch write failed: {e}")
+            results = [e] * len(positions)
+
+        for i, res in zip(positions, results):
+            if isinstance(res, Exception):
+                print(f"[PVAClient]: Write to PV {items[i][0]} failed: {res}")
+                errors[i] = str(res) or type(res).__name__
+        return errors
+
+    def get_many(
+        self, pv_names: List[str], timeout: float = BATCH_TIMEOUT
+    ) -> List[Tuple[Optional[Any], Optional[str]]]:
+        """
+        One-shot read of several PVs as one batch, without creating monitors.
+        Returns (value, error) per PV.
+        """
+        if not pv_names:
+            return []
+        try:
+            values = self._ctxt.get(list(pv_names), timeout=timeout, throw=False)
+        except Exception as e:
+            print(f"[PVAClient]: Batch get failed: {e}")
+            return [(None, str(e))] * len(pv_names)
+
+        return [
+            (None, str(v) or type(v).__name__) if isinstance(v, Exception) else (v, None)
+            for v in values
+        ]
+
     def close(self):
         """Close all subscriptions and context."""
         with self._lock:
@@ -93,4 +185,6 @@ class PVAClient:
             self._channels.clear()
             self._subscribers.clear()
             self._latest_value.clear()
+            self._fields.clear()
+            self._requested.clear()
             self._ctxt.close()
@@ -0,0 +1,198 @@
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+import struct
+import threading
+import time
+import numpy as np
+from p4p.wrapper import Value as p4pValue
+
+from pvParser import PVData
+
+# Recording format (little endian), append-only:
+#   file header: MAGIC
+#   name record:   kind=0 (u8), pv id (u32), name length (u16), name (utf-8)
+#   update record: kind=1 (u8), pv id (u32), receive time (f64), PV timestamp (f64),
+#                  severity (u8), status (u16), value type (u8), payload length (u32), payload
+# Names are written once, the first time a PV is seen; updates refer to them by id.
+# Array payloads are the dtype string length (u8), the dtype string and the raw array bytes.
+MAGIC = b"WEISSPV1"
+NAME_RECORD = 0
+UPDATE_RECORD = 1
+
+TYPE_NONE = 0
+TYPE_FLOAT = 1
+TYPE_INT = 2
+TYPE_STRING = 3
+TYPE_ARRAY = 4
+
+_NAME = struct.Struct("<BIH")
+_UPDATE = struct.Struct("<BIddBHBI")
+_FLOAT = struct.Struct("<d")
+_INT = struct.Struct("<q")
+
+# flush the write buffer at least this often (s)
+FLUSH_INTERVAL = 1.0
+
+
+def normalize_update(pv_obj: Any) -> Tuple[Any, float, int, int]:
+    """
+    Extract (value, timestamp, severity, status) from a raw provider update: a p4p Value, a
+    dict in the CA callback layout, or PVData already parsed by an upstream shard.
+    """
+    if isinstance(pv_obj, PVData):
+        value = pv_obj.array if pv_obj.array is not None else pv_obj.value
+        ts = pv_obj.timeStamp
+        timestamp = ts.secondsPastEpoch + ts.nanoseconds * 1e-9 if ts else 0.0
+        alarm = pv_obj.alarm
+        return value, timestamp, alarm.severity if alarm else 0, alarm.status if alarm else 0
+
+    if isinstance(pv_obj, p4pValue):
+        value = pv_obj.get("value")
+        if isinstance(value, p4pValue) and value.has("index"):
+            value = value.get("index")
+        alarm = pv_obj.get("alarm", {})
+        ts = pv_obj.get("timeStamp", {})
+        timestamp = ts.get("secondsPastEpoch", 0) + ts.get("nanoseconds", 0) * 1e-9
+        return value, timestamp, alarm.get("severity", 0), alarm.get("status", 0)
+
+    status = pv_obj.get("status", 0)
+    return (
+        pv_obj.get("value"),
+        float(pv_obj.get("timestamp") or 0.0),
+        int(pv_obj.get("severity") or 0),
+        int(status) if isinstance(status, (int, np.integer)) else 0,
+    )
+
+
+def encode_value(value: Any) -> Tuple[int, bytes]:
+    """(value type, payload) for a PV value"""
+    if value is None:
+        return TYPE_NONE, b""
+    if isinstance(value, (bool, int, np.integer)):
+        return TYPE_INT, _INT.pack(int(value))
+    if isinstance(value, (float, np.floating)):
+        return TYPE_FLOAT, _FLOAT.pack(float(value))
+    if isinstance(value, str):
+        return TYPE_STRING, value.encode("utf-8")
+    arr = np.asarray(value)
+    if arr.dtype.kind in "biuf":
+        dtype = arr.dtype.str.encode("ascii")
+        return TYPE_ARRAY, bytes([len(dtype)]) + dtype + np.ascontiguousarray(arr).tobytes()
+    return TYPE_STRING, str(value).encode("utf-8")
+
+
+def decode_value(value_type: int, payload: bytes) -> Any:
+    if value_type == TYPE_INT:
+        return _INT.unpack(payload)[0]
+    if value_type == TYPE_FLOAT:
+        return _FLOAT.unpack(payload)[0]
+    if value_type == TYPE_STRING:
+        return payload.decode("utf-8")
+    if value_type == TYPE_ARRAY:
+        dtype_len = payload[0]
+        dtype = payload[1 : 1 + dtype_len].decode("ascii")
+        return np.frombuffer(payload[1 + dtype_len :], dtype=dtype)
+    return None
+
+
+class PVRecorder:
+    """
+    Records raw provider updates to a compact binary log (see format above).
+    record() is called from the provider callback threads.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: BinaryIO = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        print(f"[PVRecorder]: Recording PV updates to {path}")
+
+    def record(self, name: str, pv_obj: Any):
+        """Append one update. name should include the provider, e.g. pva://demo:ai1"""
+        try:
+            value, timestamp, severity, status = normalize_update(pv_obj)
+            value_type, payload = encode_value(value)
+        except Exception as e:
+            print(f"[PVRecorder]: Cannot record update of {name}: {e}")
+            return
+
+        now = time.time()
+        with self._lock:
+            if self._file.closed:
+                return
+            pv_id = self._ids.get(name)
+            if pv_id is None:
+                pv_id = self._ids[name] = len(self._ids)
+                encoded_name = name.encode("utf-8")
+                self._file.write(_NAME.pack(NAME_RECORD, pv_id, len(encoded_name)) + encoded_name)
+            self._file.write(
+                _UPDATE.pack(
+                    UPDATE_RECORD,
+                    pv_id,
+                    now,
+                    timestamp,
+                    min(max(severity, 0), 255),
+                    status & 0xFFFF,
+                    value_type,
+                    len(payload),
+                )
+            )
+            self._file.write(payload)
+            if now - self._last_flush > FLUSH_INTERVAL:
+                self._file.flush()
+                self._last_flush = now
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+        print(f"[PVRecorder]: Closed recording {self.path}")
+
+
+def read_records(path: str) -> Iterator[Tuple[float, str, Any, float, int, int]]:
+    """
+    Iterate over a recording.
+    Yields (receive time, PV name, value, PV timestamp, severity, status) in recording order.
+    A truncated last record (recorder still running or killed) ends the iteration.
+    """
+    names: Dict[int, str] = {}
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a PV recording")
+        while True:
+            kind = f.read(1)
+            if not kind:
+                return
+            if kind[0] == NAME_RECORD:
+                header = kind + f.read(_NAME.size - 1)
+                if len(header) < _NAME.size:
+                    return
+                _, pv_id, length = _NAME.unpack(header)
+                names[pv_id] = f.read(length).decode("utf-8")
+            elif kind[0] == UPDATE_RECORD:
+                header = kind + f.read(_UPDATE.size - 1)
+                if len(header) < _UPDATE.size:
+                    return
+                _, pv_id, recv, timestamp, severity, status, value_type, length = _UPDATE.unpack(
+                    header
+                )
+                payload = f.read(length)
+                if len(payload) < length:
+                    return
+                value = decode_value(value_type, payload)
+                yield recv, names.get(pv_id, str(pv_id)), value, timestamp, severity, status
+            else:
+                raise ValueError(f"Corrupted recording {path}: unknown record kind {kind[0]}")
+
+
+def open_recorder(path: Optional[str]) -> Optional[PVRecorder]:
+    if not path:
+        return None
+    try:
+        return PVRecorder(path)
+    except OSError as e:
+        print(f"[PVRecorder]: Cannot open recording {path}: {e}")
+        return None
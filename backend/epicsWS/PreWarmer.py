@@ -0,0 +1,199 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import json
+import os
+import re
+
+from TokenBucket import TokenBucket
+
+# repository layout of the OPI API (see backend/api/repos/common.py)
+DEPLOYMENTS_REL_FOLDER = "deployments"
+CURRENT_SYMLINK = "current"
+DEPLOYMENT_PVS = "deployment-pvs.json"  # PV index compiled at deploy time
+IGNORED_FILES = {
+    "deployment.json",
+    "repo.json",
+    "deployment-tree.json",
+    "deployment-files.json",
+    DEPLOYMENT_PVS,
+}
+IGNORED_DIRS = {".git", ".hg", ".svn", "__pycache__", ".blobs"}
+
+PREWARM_CLIENT_ID = "__prewarm__"
+
+_MACRO_RE = re.compile(r"\$\(([^)]+)\)")
+
+
+def substitute_macros(pv: str, macros: Dict[str, str]) -> str:
+    """Same substitution as the frontend: keys are the full macro text, e.g. "$(P)"."""
+    return _MACRO_RE.sub(lambda m: macros.get(m.group(0), m.group(0)), pv)
+
+
+def widget_pvs(widgets: Iterable[dict]) -> Iterable[str]:
+    """PV names (before macro substitution) of a widget tree"""
+    for widget in widgets:
+        properties = widget.get("properties") or {}
+        pv_name = properties.get("pvName")
+        if isinstance(pv_name, str) and pv_name:
+            yield pv_name
+        pv_names = properties.get("pvNames")
+        if isinstance(pv_names, dict):
+            pv_names = list(pv_names.values())
+        if isinstance(pv_names, list):
+            yield from (pv for pv in pv_names if isinstance(pv, str) and pv)
+        yield from widget_pvs(widget.get("children") or [])
+
+
+def opi_pvs(widgets: Any) -> Set[str]:
+    """Macro-expanded PV names referenced by an OPI document (list of widgets)"""
+    if not isinstance(widgets, list):
+        return set()
+    macros: Dict[str, str] = {}
+    for widget in widgets:
+        if widget.get("widgetName") == "GridZone":
+            macros = (widget.get("properties") or {}).get("macros") or {}
+    pvs = {substitute_macros(pv, macros) for pv in widget_pvs(widgets)}
+    # PVs with unresolved macros cannot be connected
+    return {pv for pv in pvs if not _MACRO_RE.search(pv)}
+
+
+def current_deployments(repos_path: str) -> Dict[str, str]:
+    """repo id -> path of its currently deployed snapshot"""
+    deployments: Dict[str, str] = {}
+    try:
+        repo_ids = os.listdir(repos_path)
+    except FileNotFoundError:
+        return deployments
+    for repo_id in repo_ids:
+        current = os.path.join(repos_path, repo_id, DEPLOYMENTS_REL_FOLDER, CURRENT_SYMLINK)
+        if os.path.islink(current) and os.path.isdir(current):
+            deployments[repo_id] = os.path.realpath(current)
+    return deployments
+
+
+def indexed_pvs(snapshot_path: str) -> Optional[Set[str]]:
+    """PVs of a deployed snapshot from its deploy-time index, None if there is none"""
+    try:
+        with open(os.path.join(snapshot_path, DEPLOYMENT_PVS), "r", encoding="utf-8") as f:
+            screens = json.load(f)
+        return {pv for screen in screens.values() for pv in screen.get("pvs", [])}
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"[PreWarmer]: Ignoring PV index of {snapshot_path}: {e}")
+        return None
+
+
+def snapshot_pvs(snapshot_path: str) -> Set[str]:
+    """PVs referenced by all OPIs of a deployed snapshot"""
+    pvs = indexed_pvs(snapshot_path)
+    if pvs is not None:
+        return pvs
+    # deployed before PV indexes existed: scan the OPIs
+    pvs = set()
+    for root, dirs, files in os.walk(snapshot_path):
+        dirs[:] = [d for d in dirs if d not in IGNORED_DIRS]
+        for name in files:
+            if not name.lower().endswith(".json") or name in IGNORED_FILES:
+                continue
+            try:
+                with open(os.path.join(root, name), "r", encoding="utf-8") as f:
+                    pvs |= opi_pvs(json.load(f))
+            except (OSError, ValueError, AttributeError) as e:
+                print(f"[PreWarmer]: Skipping {os.path.join(root, name)}: {e}")
+    return pvs
+
+
+class PreWarmer:
+    """
+    Keeps the upstream channels of every PV referenced by the currently deployed OPIs connected,
+    so the first client opening a screen is served from the provider caches.
+    Deployments are polled (the `current` symlinks); new channels are created at a limited rate.
+    """
+
+    def __init__(
+        self,
+        repos_path: str,
+        resolve: Callable[[str], Optional[Tuple[Any, str]]],
+        rate: float,
+        poll_interval: float,
+    ):
+        """
+        repos_path: OPI repositories root of the API (REPOS_BASE_PATH)
+        resolve: callable(pv) -> (provider client, pv_name), or None for PVs not to pre-warm.
+        Called from the event loop, like the subscriptions of the clients.
+        rate: new channels per second
+        poll_interval: seconds between checks for new deployments
+        """
+        self.repos_path = repos_path
+        self._resolve = resolve
+        self._bucket = TokenBucket(rate)
+        self._poll_interval = poll_interval
+        self._deployments: Dict[str, str] = {}
+        # pv -> (client, pv_name) of the channels held
+        self._held: Dict[str, Tuple[Any, str]] = {}
+        # pv_name -> number of held channels with that name (of any provider)
+        self._warm: Dict[str, int] = {}
+
+    def is_warm(self, pv_name: str) -> bool:
+        """True if a channel of this PV is held, so subscribing to it does not create one"""
+        return pv_name in self._warm
+
+    async def _subscribe(self, pvs: List[str]):
+        for pv in pvs:
+            try:
+                resolved = self._resolve(pv)
+            except ValueError as e:
+                print(f"[PreWarmer]: Skipping {pv}: {e}")
+                continue
+            if resolved is None:
+                continue
+            await asyncio.sleep(self._bucket.delay())
+            self._bucket.take()
+            client, pv_name = resolved
+            try:
+                # on the loop: providers check for a first subscriber without holding their lock
+                # while the channel is created, so subscriptions must not run concurrently
+                client.subscribe(PREWARM_CLIENT_ID, pv_name, None)
+            except Exception as e:
+                print(f"[PreWarmer]: Failed to pre-warm {pv}: {e}")
+                continue
+            self._held[pv] = resolved
+            self._warm[pv_name] = self._warm.get(pv_name, 0) + 1
+
+    def _unsubscribe(self, pvs: List[str]):
+        for pv in pvs:
+            held = self._held.pop(pv, None)
+            if held:
+                client, pv_name = held
+                self._warm[pv_name] -= 1
+                if not self._warm[pv_name]:
+                    del self._warm[pv_name]
+                client.unsubscribe(PREWARM_CLIENT_ID, pv_name)
+
+    async def refresh(self):
+        """Re-scan if a deployment changed, and update the set of held channels."""
+        deployments = await asyncio.to_thread(current_deployments, self.repos_path)
+        if deployments == self._deployments:
+            return
+        self._deployments = deployments
+        wanted: Set[str] = set()
+        for snapshot in deployments.values():
+            wanted |= await asyncio.to_thread(snapshot_pvs, snapshot)
+
+        removed = sorted(set(self._held) - wanted)
+        added = sorted(wanted - set(self._held))
+        print(
+            f"[PreWarmer]: {len(deployments)} deployments reference {len(wanted)} PVs "
+            f"(+{len(added)} -{len(removed)})"
+        )
+        self._unsubscribe(removed)
+        await self._subscribe(added)
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"[PreWarmer]: Refresh failed: {e}")
+            await asyncio.sleep(self._poll_interval)
@@ -0,0 +1,135 @@
+from typing import Callable, Dict, Set, Any, List, Tuple, Optional, FrozenSet
+import threading
+import time
+
+from PVRecorder import read_records
+
+
+class ReplayClient:
+    """
+    Replays a PV recording (see PVRecorder) as a provider (replay://<pv>).
+    The recording is played from the first subscription, at the recorded pace divided by `speed`
+    (0: as fast as possible), optionally looping. Updates are delivered in the CA callback layout.
+
+    Recorded names carry their provider (pva://demo:ai1); a subscription to "demo:ai1" matches any
+    recorded provider. With EPICS_DEFAULT_PROTOCOL=replay, existing OPIs run unchanged against the
+    recording.
+    """
+
+    def __init__(
+        self,
+        handle_update: Callable[[str, Any], None],
+        path: Optional[str],
+        speed: float = 1.0,
+        loop: bool = False,
+    ):
+        """
+        handle_update: callable(pv_name: str, raw_data: dict)
+        """
+        self._handle_update = handle_update
+        self._path = path
+        self._speed = speed
+        self._loop = loop
+        self._subscribers: Dict[str, Set[str]] = {}
+        self._latest_value: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _bare_name(name: str) -> str:
+        return name.split("://", 1)[1] if "://" in name else name
+
+    def _start(self):
+        """Start the replay thread. Must be called with the lock held."""
+        if self._running or not self._path:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="ReplayClient", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        print(f"[ReplayClient]: Replaying {self._path} at {self._speed}x")
+        while self._running:
+            start = time.monotonic()
+            first: Optional[float] = None
+            try:
+                for recv, name, value, timestamp, severity, status in read_records(self._path):
+                    if not self._running:
+                        return
+                    first = recv if first is None else first
+                    if self._speed > 0:
+                        delay = (recv - first) / self._speed - (time.monotonic() - start)
+                        if delay > 0:
+                            time.sleep(delay)
+                    self._emit(name, value, timestamp, severity, status)
+            except (OSError, ValueError) as e:
+                print(f"[ReplayClient]: Replay of {self._path} failed: {e}")
+                break
+            if not self._loop:
+                break
+        print(f"[ReplayClient]: Replay of {self._path} finished")
+
+    def _emit(self, name: str, value: Any, timestamp: float, severity: int, status: int):
+        sample = {
+            "pvname": name,
+            "value": value,
+            "timestamp": timestamp,
+            "severity": severity,
+            "status": status,
+        }
+        targets = []
+        with self._lock:
+            # the same update is visible under its full and its bare name
+            for key in (name, self._bare_name(name)):
+                self._latest_value[key] = sample
+                if self._subscribers.get(key):
+                    targets.append(key)
+        for key in targets:
+            self._handle_update(key, sample)
+
+    def subscribe(self, client_id: str, pv_name: str, fields: Optional[FrozenSet[str]] = None):
+        """Subscribe a client to a recorded PV, starting the replay on first use."""
+        with self._lock:
+            self._subscribers.setdefault(pv_name, set()).add(client_id)
+            self._start()
+            if pv_name in self._latest_value:
+                self._handle_update(pv_name, self._latest_value[pv_name])
+
+    def unsubscribe(self, client_id: str, pv_name: str):
+        with self._lock:
+            clients = self._subscribers.get(pv_name)
+            if not clients:
+                return
+            clients.discard(client_id)
+            if not clients:
+                del self._subscribers[pv_name]
+
+    def unsubscribe_all(self, client_id: str):
+        with self._lock:
+            for pv_name in list(self._subscribers):
+                self._subscribers[pv_name].discard(client_id)
+                if not self._subscribers[pv_name]:
+                    del self._subscribers[pv_name]
+
+    def write_to_pv(self, pv_name: str, value: Any):
+        print(f"[ReplayClient]: Replayed PV {pv_name} is read-only. Ignoring write.")
+
+    def write_many(self, items: List[Tuple[str, Any]]) -> List[Optional[str]]:
+        return ["Replayed PVs are read-only"] * len(items)
+
+    def get_many(self, pv_names: List[str]) -> List[Tuple[Optional[dict], Optional[str]]]:
+        with self._lock:
+            return [
+                (self._latest_value[name], None)
+                if name in self._latest_value
+                else (None, "No value replayed yet")
+                for name in pv_names
+            ]
+
+    def close(self):
+        self._running = False
+        with self._lock:
+            self._subscribers.clear()
+            self._latest_value.clear()
+        print("[ReplayClient]: Closed replay.")
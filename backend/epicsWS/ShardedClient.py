@@ -0,0 +1,335 @@
+from typing import Callable, Dict, Any, List, Tuple, Optional, FrozenSet
+from concurrent.futures import Future
+from multiprocessing.connection import Connection
+import itertools
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import zlib
+
+from pvParser import PVParser, PVData, merge_fields
+
+# at most this many updates are pickled into one message from a worker
+MAX_BATCH = 512
+# extra time (s) given to a worker to answer a batched get/put on top of its own timeout
+REPLY_GRACE = 2.0
+BATCH_TIMEOUT = 5.0
+# wait before restarting a worker that exited (s)
+RESTART_DELAY = 1.0
+
+
+def shard_of(pv_name: str, shards: int) -> int:
+    """Stable shard assignment of a PV"""
+    return zlib.crc32(pv_name.encode("utf-8")) % shards
+
+
+class _Shard:
+    """Main process side of one worker process"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[subprocess.Popen] = None
+        self.commands: Optional[Connection] = None
+        self.updates: Optional[Connection] = None
+        self.lock = threading.Lock()
+        # pv_name -> {client_id: field mask}, replayed if the worker has to be restarted
+        self.subscriptions: Dict[str, Dict[str, Optional[FrozenSet[str]]]] = {}
+        self.replies: Dict[int, Future] = {}
+
+
+class ShardedClient:
+    """
+    Spreads the PVs of one provider (CA or PVA) over N worker processes, each with its own
+    upstream context and callback thread. PVs are assigned to workers by hash of their name.
+    Workers decode updates into PVData (with the union of the field masks requested for the PV) and
+    send them back in batches; a reader thread per worker feeds them into the regular ingest path.
+    Implements the same interface as CAClient/PVAClient.
+    """
+
+    def __init__(self, handle_update: Callable[[str, Any], None], provider: str, shards: int):
+        """
+        handle_update: callable(pv_name: str, pv_data: PVData)
+        provider: "ca" or "pva"
+        shards: number of worker processes
+        """
+        self._handle_update = handle_update
+        self._provider = provider
+        self._request_ids = itertools.count()
+        self._closing = False
+        self._shards = [_Shard(i) for i in range(shards)]
+        for shard in self._shards:
+            self._start(shard)
+
+    def _start(self, shard: _Shard):
+        """Start (or restart) the worker process of a shard and its reader thread."""
+        cmd_read, cmd_write = os.pipe()
+        upd_read, upd_write = os.pipe()
+        worker = [sys.executable, os.path.abspath(__file__), self._provider]
+        shard.process = subprocess.Popen(
+            worker + [str(cmd_read), str(upd_write)], pass_fds=(cmd_read, upd_write)
+        )
+        os.close(cmd_read)
+        os.close(upd_write)
+        shard.commands = Connection(cmd_write, readable=False)
+        shard.updates = Connection(upd_read, writable=False)
+        threading.Thread(
+            target=self._read, args=(shard, shard.updates), name=f"shard-{shard.index}", daemon=True
+        ).start()
+        with shard.lock:
+            subscriptions = [
+                (client_id, pv_name, fields)
+                for pv_name, masks in shard.subscriptions.items()
+                for client_id, fields in masks.items()
+            ]
+        for client_id, pv_name, fields in subscriptions:
+            self._send(shard, ("subscribe", client_id, pv_name, fields))
+        print(f"[ShardedClient]: Started {self._provider} shard {shard.index}")
+
+    def _read(self, shard: _Shard, updates: Connection):
+        while True:
+            try:
+                message = updates.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == "updates":
+                for pv_name, pv_data in message[1]:
+                    self._handle_update(pv_name, pv_data)
+            elif message[0] == "reply":
+                with shard.lock:
+                    future = shard.replies.pop(message[1], None)
+                if future:
+                    future.set_result(message[2])
+
+        updates.close()
+        if self._closing:
+            return
+        print(f"[ShardedClient]: {self._provider} shard {shard.index} exited, restarting")
+        with shard.lock:
+            failed, shard.replies = list(shard.replies.values()), {}
+        for future in failed:
+            future.set_exception(RuntimeError("Upstream shard restarted"))
+        shard.commands.close()
+        time.sleep(RESTART_DELAY)
+        self._start(shard)
+
+    def _send(self, shard: _Shard, command: tuple):
+        try:
+            with shard.lock:
+                shard.commands.send(command)
+        except (OSError, ValueError) as e:
+            print(f"[ShardedClient]: Failed to send {command[0]} to shard {shard.index}: {e}")
+
+    def _shard(self, pv_name: str) -> _Shard:
+        return self._shards[shard_of(pv_name, len(self._shards))]
+
+    def subscribe(self, client_id: str, pv_name: str, fields: Optional[FrozenSet[str]] = None):
+        shard = self._shard(pv_name)
+        with shard.lock:
+            shard.subscriptions.setdefault(pv_name, {})[client_id] = fields
+        self._send(shard, ("subscribe", client_id, pv_name, fields))
+
+    def unsubscribe(self, client_id: str, pv_name: str):
+        shard = self._shard(pv_name)
+        with shard.lock:
+            masks = shard.subscriptions.get(pv_name)
+            if masks is None or client_id not in masks:
+                return
+            del masks[client_id]
+            if not masks:
+                del shard.subscriptions[pv_name]
+        self._send(shard, ("unsubscribe", client_id, pv_name))
+
+    def unsubscribe_all(self, client_id: str):
+        for shard in self._shards:
+            with shard.lock:
+                for pv_name in [pv for pv, m in shard.subscriptions.items() if client_id in m]:
+                    del shard.subscriptions[pv_name][client_id]
+                    if not shard.subscriptions[pv_name]:
+                        del shard.subscriptions[pv_name]
+            self._send(shard, ("unsubscribe_all", client_id))
+
+    def write_to_pv(self, pv_name: str, value: Any):
+        self._send(self._shard(pv_name), ("write", pv_name, value))
+
+    def _batch(self, operation: str, items: List[Any], key: Callable[[Any], str], error: Any):
+        """Run a batched operation on every shard concerned, results in the order of items"""
+        results: List[Any] = [None] * len(items)
+        groups: Dict[int, List[int]] = {}
+        for i, item in enumerate(items):
+            groups.setdefault(shard_of(key(item), len(self._shards)), []).append(i)
+
+        futures = []
+        for index, positions in groups.items():
+            shard = self._shards[index]
+            future: Future = Future()
+            request_id = next(self._request_ids)
+            with shard.lock:
+                shard.replies[request_id] = future
+            self._send(shard, (operation, request_id, [items[i] for i in positions]))
+            futures.append((positions, future))
+
+        for positions, future in futures:
+            try:
+                shard_results = future.result(BATCH_TIMEOUT + REPLY_GRACE)
+            except Exception as e:
+                shard_results = [error(str(e) or "Timed out")] * len(positions)
+            for i, result in zip(positions, shard_results):
+                results[i] = result
+        return results
+
+    def write_many(self, items: List[Tuple[str, Any]]) -> List[Optional[str]]:
+        """Like write_to_pv, only subscribed PVs can be written (checked again by the shards)"""
+        errors: List[Optional[str]] = ["Not subscribed"] * len(items)
+        positions = []
+        for i, (pv_name, _) in enumerate(items):
+            shard = self._shard(pv_name)
+            with shard.lock:
+                if pv_name in shard.subscriptions:
+                    positions.append(i)
+        results = self._batch(
+            "write_many", [items[i] for i in positions], lambda item: item[0], lambda e: e
+        )
+        for i, error in zip(positions, results):
+            errors[i] = error
+        return errors
+
+    def get_many(self, pv_names: List[str]) -> List[Tuple[Optional[PVData], Optional[str]]]:
+        """One-shot read, values are returned already parsed (with all fields)"""
+        return self._batch("get_many", pv_names, lambda pv: pv, lambda e: (None, e))
+
+    def close(self):
+        self._closing = True
+        for shard in self._shards:
+            self._send(shard, ("close",))
+        for shard in self._shards:
+            try:
+                shard.process.wait(timeout=BATCH_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                shard.process.kill()
+            shard.commands.close()
+        print(f"[ShardedClient]: Closed all {self._provider} shards.")
+
+
+def run_worker(provider: str, commands: Connection, updates: Connection):
+    """
+    Worker process: runs a regular provider client and forwards parsed updates.
+    Commands are tuples (operation, *args) received on `commands`; updates and replies are sent
+    on `updates` by a single sender thread.
+    """
+    outbox: "queue.SimpleQueue[Optional[tuple]]" = queue.SimpleQueue()
+    # pv_name -> {client_id: field mask}, and the union parsed for each PV
+    masks: Dict[str, Dict[str, Optional[FrozenSet[str]]]] = {}
+    merged: Dict[str, Optional[FrozenSet[str]]] = {}
+    lock = threading.Lock()
+
+    def parse(pv_name: str, pv_obj: Any, fields: Optional[FrozenSet[str]]) -> PVData:
+        if provider == "pva":
+            return PVParser.from_pva(pv_obj, pv_name, fields)
+        return PVParser.from_ca(pv_obj, pv_name, fields)
+
+    def on_update(pv_name: str, pv_obj: Any):
+        with lock:
+            fields = merged.get(pv_name)
+        try:
+            outbox.put(("update", pv_name, parse(pv_name, pv_obj, fields)))
+        except Exception as e:
+            print(f"[ShardedClient]: Failed to parse update of {pv_name}: {e}")
+
+    def send():
+        """Forward updates in batches of whatever is queued (up to MAX_BATCH), and replies"""
+        done = False
+        while not done:
+            items = [outbox.get()]
+            while len(items) < MAX_BATCH and not outbox.empty():
+                items.append(outbox.get())
+            batch = []
+            for item in items:
+                if item is None:
+                    done = True
+                    break
+                if item[0] == "update":
+                    batch.append(item[1:])
+                else:
+                    updates.send(item)
+            if batch:
+                updates.send(("updates", batch))
+
+    def update_mask(pv_name: str, client_id: str, fields: Optional[FrozenSet[str]], remove: bool):
+        with lock:
+            pv_masks = masks.setdefault(pv_name, {})
+            if remove:
+                pv_masks.pop(client_id, None)
+            else:
+                pv_masks[client_id] = fields
+            if pv_masks:
+                merged[pv_name] = merge_fields(pv_masks.values())
+            else:
+                masks.pop(pv_name, None)
+                merged.pop(pv_name, None)
+
+    def reply(request_id: int, operation: Callable[[], Any]):
+        outbox.put(("reply", request_id, operation()))
+
+    if provider == "pva":
+        from PVAClient import PVAClient
+
+        client = PVAClient(on_update)
+    else:
+        from CAClient import CAClient
+
+        client = CAClient(on_update)
+
+    sender = threading.Thread(target=send, daemon=True)
+    sender.start()
+    while True:
+        try:
+            operation, *args = commands.recv()
+        except (EOFError, OSError):
+            break
+        if operation == "subscribe":
+            client_id, pv_name, fields = args
+            update_mask(pv_name, client_id, fields, remove=False)
+            client.subscribe(client_id, pv_name, fields)
+        elif operation == "unsubscribe":
+            client_id, pv_name = args
+            update_mask(pv_name, client_id, None, remove=True)
+            client.unsubscribe(client_id, pv_name)
+        elif operation == "unsubscribe_all":
+            for pv_name in list(masks):
+                update_mask(pv_name, args[0], None, remove=True)
+            client.unsubscribe_all(args[0])
+        elif operation == "write":
+            client.write_to_pv(*args)
+        elif operation == "write_many":
+            request_id, items = args
+            threading.Thread(
+                target=reply, args=(request_id, lambda: client.write_many(items)), daemon=True
+            ).start()
+        elif operation == "get_many":
+            request_id, pv_names = args
+
+            def get_parsed(pv_names=pv_names):
+                return [
+                    (parse(pv_name, pv_obj, None), None) if error is None else (None, error)
+                    for pv_name, (pv_obj, error) in zip(pv_names, client.get_many(pv_names))
+                ]
+
+            threading.Thread(target=reply, args=(request_id, get_parsed), daemon=True).start()
+        elif operation == "close":
+            break
+
+    client.close()
+    outbox.put(None)
+    sender.join()
+    updates.close()
+
+
+if __name__ == "__main__":
+    run_worker(
+        sys.argv[1],
+        Connection(int(sys.argv[2]), writable=False),
+        Connection(int(sys.argv[3]), readable=False),
+    )
@@ -0,0 +1,240 @@
+from typing import Callable, Dict, Set, Any, List, Tuple, Optional, FrozenSet
+from urllib.parse import parse_qsl
+import heapq
+import itertools
+import math
+import threading
+import time
+import zlib
+import numpy as np
+
+# default update rate (Hz) of simulated PVs, overridable per PV with ?rate=
+DEFAULT_RATE = 1.0
+MAX_RATE = 10000.0
+# if the scheduler falls further behind than this (s), ticks are dropped instead of bursting
+MAX_LAG = 1.0
+
+GENERATORS = ("sine", "noise", "ramp", "waveform", "alarm", "const")
+
+
+class SimSignal:
+    """
+    Signal generator for one simulated PV, e.g. "sine?period=5&amplitude=10&rate=50".
+    Values only depend on the tick number (and the seed for noise), so runs are reproducible.
+
+    Parameters (all optional):
+    - rate: updates per second
+    - amplitude, offset, period (s), phase (rad): signal shape
+    - size: number of points (waveform)
+    - seed: noise seed, defaults to a hash of the PV name
+    - value: initial value (const)
+    - units, precision: metadata
+    """
+
+    def __init__(self, name: str):
+        kind, _, query = name.partition("?")
+        if kind not in GENERATORS:
+            raise ValueError(f"Unknown generator '{kind}', use one of {', '.join(GENERATORS)}")
+        params = dict(parse_qsl(query))
+
+        self.name = name
+        self.kind = kind
+        self.rate = min(max(float(params.get("rate", DEFAULT_RATE)), 0.001), MAX_RATE)
+        self.amplitude = float(params.get("amplitude", 1.0))
+        self.offset = float(params.get("offset", 0.0))
+        self.period = max(float(params.get("period", 10.0)), 1e-6)
+        self.phase = float(params.get("phase", 0.0))
+        self.size = max(int(params.get("size", 100)), 1)
+        self.units = params.get("units", "")
+        self.precision = int(params.get("precision", 3))
+        seed = int(params.get("seed", zlib.crc32(name.encode())))
+        self._rng = np.random.default_rng(seed)
+        self._const = float(params.get("value", self.offset))
+        self._x = np.linspace(0, 2 * np.pi, self.size, endpoint=False)
+        self.tick = 0
+
+    def write(self, value: Any):
+        if self.kind != "const":
+            raise ValueError(f"Simulated PV {self.name} is read-only")
+        self._const = float(value)
+
+    def _value(self, t: float) -> Tuple[Any, int]:
+        """(value, severity) at time t (s since start)"""
+        w = 2 * math.pi * t / self.period + self.phase
+        if self.kind == "sine":
+            return self.offset + self.amplitude * math.sin(w), 0
+        if self.kind == "noise":
+            return self.offset + self.amplitude * float(self._rng.standard_normal()), 0
+        if self.kind == "ramp":
+            return self.offset + self.amplitude * ((t % self.period) / self.period), 0
+        if self.kind == "waveform":
+            wave = self.offset + self.amplitude * np.sin(self._x + w)
+            return wave, 0
+        if self.kind == "alarm":
+            # cycles NO_ALARM -> MINOR -> MAJOR -> NO_ALARM ... every half period
+            severity = int(t // (self.period / 2)) % 3
+            return float(severity), severity
+        return self._const, 0
+
+    def sample(self) -> dict:
+        """Next sample, in the same layout as CA callback data"""
+        value, severity = self._value(self.tick / self.rate)
+        self.tick += 1
+        low, high = self.offset - abs(self.amplitude), self.offset + abs(self.amplitude)
+        return {
+            "pvname": self.name,
+            "value": value,
+            "severity": severity,
+            "status": 0 if not severity else 1,
+            "timestamp": time.time(),
+            "units": self.units,
+            "precision": self.precision,
+            "lower_disp_limit": low,
+            "upper_disp_limit": high,
+            "lower_ctrl_limit": low,
+            "upper_ctrl_limit": high,
+        }
+
+
+class SimClient:
+    """
+    In-process simulated PV provider (sim://<generator>?<params>).
+    Implements the same interface as CAClient/PVAClient without any IOC. All signals are driven by
+    a single scheduler thread and updates are delivered in the CA callback layout.
+    """
+
+    def __init__(self, handle_update: Callable[[str, Any], None]):
+        """
+        handle_update: callable(pv_name: str, raw_data: dict)
+        """
+        self._handle_update = handle_update
+        self._signals: Dict[str, SimSignal] = {}
+        self._subscribers: Dict[str, Set[str]] = {}
+        self._latest_value: Dict[str, Any] = {}
+        # heap of (due time, sequence, pv_name, signal), stale entries are dropped when popped
+        self._schedule: List[Tuple[float, int, str, SimSignal]] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="SimClient", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self._running:
+            with self._lock:
+                now = time.monotonic()
+                due: List[str] = []
+                while self._schedule and self._schedule[0][0] <= now:
+                    t, _, pv_name, signal = heapq.heappop(self._schedule)
+                    if self._signals.get(pv_name) is not signal:
+                        continue  # unsubscribed
+                    due.append(pv_name)
+                    self._push(max(t + 1.0 / signal.rate, now - MAX_LAG), pv_name, signal)
+                samples = [(pv_name, self._signals[pv_name].sample()) for pv_name in due]
+                for pv_name, sample in samples:
+                    self._latest_value[pv_name] = sample
+                timeout = self._schedule[0][0] - now if self._schedule else None
+
+            for pv_name, sample in samples:
+                self._handle_update(pv_name, sample)
+
+            if not samples:
+                self._wakeup.wait(timeout)
+                self._wakeup.clear()
+
+    def _push(self, due: float, pv_name: str, signal: SimSignal):
+        """Schedule the next sample of a signal. Must be called with the lock held."""
+        heapq.heappush(self._schedule, (due, next(self._sequence), pv_name, signal))
+
+    def subscribe(self, client_id: str, pv_name: str, fields: Optional[FrozenSet[str]] = None):
+        """Subscribe a client to a simulated PV, starting its generator on first subscription."""
+        with self._lock:
+            if pv_name not in self._signals:
+                try:
+                    signal = SimSignal(pv_name)
+                except ValueError as e:
+                    print(f"[SimClient]: Failed to subscribe to {pv_name}: {e}")
+                    return
+                self._signals[pv_name] = signal
+                self._push(time.monotonic(), pv_name, signal)
+                self._wakeup.set()
+            elif pv_name in self._latest_value:
+                self._handle_update(pv_name, self._latest_value[pv_name])
+            self._subscribers.setdefault(pv_name, set()).add(client_id)
+
+    def _stop(self, pv_name: str):
+        """Stop a generator. Must be called with the lock held."""
+        self._signals.pop(pv_name, None)
+        self._subscribers.pop(pv_name, None)
+        self._latest_value.pop(pv_name, None)
+
+    def unsubscribe(self, client_id: str, pv_name: str):
+        """Unsubscribe a client from a simulated PV."""
+        with self._lock:
+            clients = self._subscribers.get(pv_name)
+            if not clients:
+                return
+            clients.discard(client_id)
+            if not clients:
+                self._stop(pv_name)
+
+    def unsubscribe_all(self, client_id: str):
+        """Remove a client from all simulated PVs."""
+        with self._lock:
+            empty_pvs = []
+            for pv_name, clients in self._subscribers.items():
+                clients.discard(client_id)
+                if not clients:
+                    empty_pvs.append(pv_name)
+            for pv_name in empty_pvs:
+                self._stop(pv_name)
+
+    def _write(self, pv_name: str, value: Any) -> Optional[str]:
+        """Set the value of a const simulated PV and publish it right away. Returns an error."""
+        with self._lock:
+            signal = self._signals.get(pv_name)
+            if not signal:
+                return "Not subscribed"
+            try:
+                signal.write(value)
+            except (TypeError, ValueError) as e:
+                return str(e)
+            sample = signal.sample()
+            self._latest_value[pv_name] = sample
+        self._handle_update(pv_name, sample)
+        return None
+
+    def write_to_pv(self, pv_name: str, value: Any):
+        error = self._write(pv_name, value)
+        if error:
+            print(f"[SimClient]: Write to {pv_name} failed: {error}")
+
+    def write_many(self, items: List[Tuple[str, Any]]) -> List[Optional[str]]:
+        return [self._write(pv_name, value) for pv_name, value in items]
+
+    def get_many(self, pv_names: List[str]) -> List[Tuple[Optional[dict], Optional[str]]]:
+        """Latest sample of subscribed PVs, or a fresh sample of an unsubscribed generator."""
+        results: List[Tuple[Optional[dict], Optional[str]]] = []
+        for pv_name in pv_names:
+            with self._lock:
+                latest = self._latest_value.get(pv_name)
+            if latest is not None:
+                results.append((latest, None))
+                continue
+            try:
+                results.append((SimSignal(pv_name).sample(), None))
+            except ValueError as e:
+                results.append((None, str(e)))
+        return results
+
+    def close(self):
+        """Stop the scheduler and all generators."""
+        self._running = False
+        self._wakeup.set()
+        with self._lock:
+            self._signals.clear()
+            self._subscribers.clear()
+            self._latest_value.clear()
+            self._schedule.clear()
+        print("[SimClient]: Closed all simulated PVs.")
@@ -0,0 +1,39 @@
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter: `rate` tokens per second, up to `burst` tokens.
+    take() may overdraw the bucket so that a single large item (e.g. a frame bigger than the burst)
+    still goes through; the debt is paid back before the next item is allowed.
+    A rate of 0 means unlimited.
+    """
+
+    def __init__(self, rate: float, burst: float = 0):
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """Seconds until the bucket allows the next item (0 if it does now)"""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        if self._tokens > 0:
+            return 0.0
+        return (1e-9 - self._tokens) / self.rate
+
+    def take(self, n: float = 1):
+        if not self.unlimited:
+            self._refill()
+            self._tokens -= n
@@ -1,29 +1,111 @@
 import asyncio
+from contextlib import asynccontextmanager
 import json
 import os
+import signal
+import time
 import websockets
 from websockets.legacy.server import WebSocketServerProtocol
-from typing import Dict, Set, Tuple
+from typing import Callable, Dict, FrozenSet, List, Optional, Set, Tuple
 
-from pvParser import PVParser, PVData
+from pvParser import PVParser, PVData, merge_fields, parse_fields
 from PVAClient import PVAClient
 from CAClient import CAClient
+from AggregateClient import AggregateClient, load_aggregate_definitions
+from CalcClient import CalcClient
+from SimClient import SimClient
+from ReplayClient import ReplayClient
+from ShardedClient import ShardedClient
+from PreWarmer import PreWarmer
+from ImagePipeline import ImageRequest, DEFAULT_IMAGE_REQUEST, encode_image, parse_image_request
+from PVRecorder import open_recorder
+from TokenBucket import TokenBucket
+from LatencyTracer import LatencyTracer, Trace
+from ClientSession import ClientSession, Frame, SendScheduler, client_weight, parse_weights
 
 CA_PROVIDER_KEY = "ca"
 PVA_PROVIDER_KEY = "pva"
+AGG_PROVIDER_KEY = "agg"
+CALC_PROVIDER_KEY = "calc"
+SIM_PROVIDER_KEY = "sim"
+REPLAY_PROVIDER_KEY = "replay"
+# providers whose raw updates are recorded (virtual channels are recomputed on replay)
+RECORDED_PROVIDERS = (CA_PROVIDER_KEY, PVA_PROVIDER_KEY, SIM_PROVIDER_KEY)
 
 # map PV -> set of websocket clients
 subscriptions: Dict[str, Set[WebSocketServerProtocol]] = {}
 
+# connection state (quotas, outbound queue) per websocket client
+sessions: Dict[WebSocketServerProtocol, ClientSession] = {}
+
 # track if metadata has been sent per (ws, pv_name)
 sent_metadata: Dict[Tuple[WebSocketServerProtocol, str], bool] = {}
 
+# field mask requested per (ws, pv_name), None means all fields
+field_masks: Dict[Tuple[WebSocketServerProtocol, str], Optional[FrozenSet[str]]] = {}
+
+# image options per (ws, pv_name) for NTNDArray PVs, and when the last frame was queued
+image_requests: Dict[Tuple[WebSocketServerProtocol, str], ImageRequest] = {}
+image_sent: Dict[Tuple[WebSocketServerProtocol, str], float] = {}
+
+# map PV -> {watcher_id: (callback, field mask, PV name as watched)}, for virtual channels
+# computed from other PVs
+Watcher = Callable[[str, PVData], None]
+watchers: Dict[str, Dict[str, Tuple[Watcher, Optional[FrozenSet[str]], str]]] = {}
+
 # holds one client per backend
-clients = {PVA_PROVIDER_KEY: None, CA_PROVIDER_KEY: None}
+clients = {
+    PVA_PROVIDER_KEY: None,
+    CA_PROVIDER_KEY: None,
+    AGG_PROVIDER_KEY: None,
+    CALC_PROVIDER_KEY: None,
+    SIM_PROVIDER_KEY: None,
+    REPLAY_PROVIDER_KEY: None,
+}
 
 # environment variable fallback
 DEFAULT_PROTOCOL = os.getenv("EPICS_DEFAULT_PROTOCOL", PVA_PROVIDER_KEY).lower()
 
+# number of worker processes (each with its own upstream context) per CA/PVA provider,
+# 1 keeps the provider in process
+UPSTREAM_SHARDS = int(os.getenv("EPICS_UPSTREAM_SHARDS", "1"))
+
+# admission control after restarts: concurrent subscription setups, and new upstream channels
+# per second (0: unlimited)
+MAX_CONCURRENT_SETUPS = int(os.getenv("EPICS_MAX_CONCURRENT_SETUPS", "8"))
+CHANNEL_RATE = float(os.getenv("EPICS_CHANNEL_RATE", "500"))
+setup_slots = asyncio.Semaphore(MAX_CONCURRENT_SETUPS)
+setups_waiting = 0
+channel_bucket = TokenBucket(CHANNEL_RATE)
+
+# pre-warm the PVs of the OPIs deployed under this OPI repositories root (disabled if unset)
+PREWARM_REPOS = os.getenv("EPICS_PREWARM_REPOS")
+PREWARM_RATE = float(os.getenv("EPICS_PREWARM_RATE", "100"))
+PREWARM_POLL_INTERVAL = float(os.getenv("EPICS_PREWARM_POLL_INTERVAL", "10"))
+prewarmer: Optional[PreWarmer] = None  # started by main()
+
+# JSON file with alarm aggregate definitions (see AggregateClient)
+AGGREGATES_FILE = os.getenv("EPICS_AGGREGATES_FILE")
+
+# record raw provider updates to this file (see PVRecorder), and replay settings
+recorder = open_recorder(os.getenv("EPICS_RECORD_FILE"))
+REPLAY_FILE = os.getenv("EPICS_REPLAY_FILE")
+REPLAY_SPEED = float(os.getenv("EPICS_REPLAY_SPEED", "1.0"))
+REPLAY_LOOP = os.getenv("EPICS_REPLAY_LOOP", "false").lower() in ("1", "true", "yes")
+
+# fraction of updates traced end to end (see LatencyTracer), 0 disables tracing
+tracer = LatencyTracer(float(os.getenv("EPICS_TRACE_SAMPLE", "0")))
+TRACE_REPORT_INTERVAL = float(os.getenv("EPICS_TRACE_REPORT_INTERVAL", "60"))
+
+# per-connection quotas (0: unlimited), scaled by the connection weight
+CLIENT_MAX_PVS = int(os.getenv("EPICS_CLIENT_MAX_PVS", "0"))
+CLIENT_MAX_RATE = float(os.getenv("EPICS_CLIENT_MAX_RATE", "0"))
+CLIENT_MAX_BPS = float(os.getenv("EPICS_CLIENT_MAX_BPS", "0"))
+# send weights by remote address prefix, e.g. "10.0.1.=4,127.0.0.1=2" (default weight 1)
+CLIENT_WEIGHTS = parse_weights(os.getenv("EPICS_CLIENT_WEIGHTS"))
+# frames sent per round-robin turn for a connection of weight 1
+SCHEDULER_QUANTUM = int(os.getenv("EPICS_SCHEDULER_QUANTUM", "16"))
+
 
 def parse_protocol(pv_name: str) -> Tuple[str, str]:
     """Decide protocol from PV prefix or default env var.
@@ -32,22 +114,101 @@ def parse_protocol(pv_name: str) -> Tuple[str, str]:
         return PVA_PROVIDER_KEY, pv_name[6:]
     elif pv_name.startswith("ca://"):
         return CA_PROVIDER_KEY, pv_name[5:]
+    elif pv_name.startswith("agg://"):
+        return AGG_PROVIDER_KEY, pv_name[6:]
+    elif pv_name.startswith("calc://"):
+        return CALC_PROVIDER_KEY, pv_name[7:]
+    elif pv_name.startswith("sim://"):
+        return SIM_PROVIDER_KEY, pv_name[6:]
+    elif pv_name.startswith("replay://"):
+        return REPLAY_PROVIDER_KEY, pv_name[9:]
     return DEFAULT_PROTOCOL, pv_name
 
 
-async def send_update(pv_name: str, pv_obj, provider: str):
-    pv_data: PVData = (
-        PVParser.from_pva(pv_obj, pv_name)
-        if provider == PVA_PROVIDER_KEY
-        else PVParser.from_ca(pv_obj, pv_name)
-    )
+def make_callback(provider: str, loop: asyncio.AbstractEventLoop) -> Callable:
+    """Provider callback: hand raw updates over to the event loop"""
+    record = recorder is not None and provider in RECORDED_PROVIDERS
 
-    if provider != DEFAULT_PROTOCOL:
-        pv_name_with_provider = f"{provider}://{pv_name}"
-    else:
-        pv_name_with_provider = pv_name
+    def callback(pv_name, pv_obj):
+        trace = tracer.start()
+        if record:
+            recorder.record(f"{provider}://{pv_name}", pv_obj)
+        asyncio.run_coroutine_threadsafe(send_update(pv_name, pv_obj, provider, trace), loop)
 
-    base_message = {
+    return callback
+
+
+def get_client(protocol: str):
+    """Return the client for a provider, creating it on first use (must run inside the loop)"""
+    if protocol not in clients:
+        raise ValueError(f"[epicsWS]: Unsupported protocol: {protocol}")
+    if clients[protocol] is None:
+        callback = make_callback(protocol, asyncio.get_running_loop())
+        if protocol in (PVA_PROVIDER_KEY, CA_PROVIDER_KEY) and UPSTREAM_SHARDS > 1:
+            clients[protocol] = ShardedClient(callback, protocol, UPSTREAM_SHARDS)
+        elif protocol == PVA_PROVIDER_KEY:
+            clients[protocol] = PVAClient(callback)
+        elif protocol == CA_PROVIDER_KEY:
+            clients[protocol] = CAClient(callback)
+        elif protocol == AGG_PROVIDER_KEY:
+            definitions = load_aggregate_definitions(AGGREGATES_FILE)
+            clients[protocol] = AggregateClient(callback, watch, unwatch, definitions)
+        elif protocol == CALC_PROVIDER_KEY:
+            clients[protocol] = CalcClient(callback, watch, unwatch)
+        elif protocol == SIM_PROVIDER_KEY:
+            clients[protocol] = SimClient(callback)
+        elif protocol == REPLAY_PROVIDER_KEY:
+            clients[protocol] = ReplayClient(callback, REPLAY_FILE, REPLAY_SPEED, REPLAY_LOOP)
+    return clients[protocol]
+
+
+def watch(watcher_id: str, pv: str, callback: Watcher, fields: Optional[FrozenSet[str]] = None):
+    """
+    Subscribe a virtual channel to a PV. The callback receives (pv, pv_data) on every update,
+    parsed with at least the requested fields, from the event loop.
+    """
+    protocol, pv_name = parse_protocol(pv)
+    watchers.setdefault(pv_name, {})[watcher_id] = (callback, fields, pv)
+    get_client(protocol).subscribe(watcher_id, pv_name, fields)
+
+
+def unwatch(watcher_id: str, pv: str):
+    protocol, pv_name = parse_protocol(pv)
+    pv_watchers = watchers.get(pv_name)
+    if pv_watchers is None or watcher_id not in pv_watchers:
+        return
+    del pv_watchers[watcher_id]
+    if not pv_watchers:
+        del watchers[pv_name]
+    get_client(protocol).unsubscribe(watcher_id, pv_name)
+
+
+def provider_pv_name(provider: str, pv_name: str) -> str:
+    """Inverse of parse_protocol: PV name as seen by the clients"""
+    if provider != DEFAULT_PROTOCOL:
+        return f"{provider}://{pv_name}"
+    return pv_name
+
+
+def parse_pv_data(
+    pv_name: str, pv_obj, provider: str, fields: Optional[FrozenSet[str]] = None
+) -> PVData:
+    if isinstance(pv_obj, PVData):
+        # already parsed by an upstream shard
+        return pv_obj
+    if provider == PVA_PROVIDER_KEY:
+        return PVParser.from_pva(pv_obj, pv_name, fields)
+    elif provider == AGG_PROVIDER_KEY:
+        return PVParser.from_aggregate(pv_obj.snapshot(), pv_name)
+    elif provider == CALC_PROVIDER_KEY:
+        return PVParser.from_calc(pv_obj.evaluate(), pv_name)
+    # CA, simulated and replayed PVs share the CA callback layout
+    return PVParser.from_ca(pv_obj, pv_name, fields)
+
+
+def build_message(pv_data: PVData, pv_name_with_provider: str) -> dict:
+    """Base update message (no metadata) for a parsed PV"""
+    return {
         "type": "update",
         "pv": pv_name_with_provider,
         "value": pv_data.value,
@@ -55,51 +216,268 @@ async def send_update(pv_name: str, pv_obj, provider: str):
         "timeStamp": pv_data.timeStamp.__dict__ if pv_data.timeStamp else None,
         "b64arr": pv_data.b64arr,
         "b64dtype": pv_data.b64dtype,
+        "alarmSummary": pv_data.alarmSummary.__dict__ if pv_data.alarmSummary else None,
     }
 
-    for ws in set(subscriptions.get(pv_name, set())):
+
+def build_metadata(pv_data: PVData) -> dict:
+    """Metadata fields, only sent once per (client, PV)"""
+    return {
+        "enumChoices": pv_data.enumChoices,
+        "display": pv_data.display.__dict__ if pv_data.display else None,
+        "control": pv_data.control.__dict__ if pv_data.control else None,
+        "valueAlarm": pv_data.valueAlarm.__dict__ if pv_data.valueAlarm else None,
+    }
+
+
+def strip_none(message: dict) -> dict:
+    return {k: v for k, v in message.items() if v is not None}
+
+
+def select_fields(message: dict, fields: Optional[FrozenSet[str]]) -> dict:
+    """Drop the message entries not covered by a client field mask"""
+    if fields is None:
+        return message
+    return {
+        k: v
+        for k, v in message.items()
+        if k in ("type", "pv")
+        or (k in fields)
+        or (k in ("b64arr", "b64dtype", "alarmSummary") and "value" in fields)
+    }
+
+
+def pv_timestamp(pv_data: PVData) -> Optional[float]:
+    ts = pv_data.timeStamp
+    if ts is None or not ts.secondsPastEpoch:
+        return None
+    return ts.secondsPastEpoch + ts.nanoseconds * 1e-9
+
+
+async def send_update(pv_name: str, pv_obj, provider: str, trace: Optional[Trace] = None):
+    if trace:
+        trace.mark("dequeue")
+    targets = set(subscriptions.get(pv_name, set()))
+    pv_watchers = list(watchers.get(pv_name, {}).values())
+    if not targets and not pv_watchers:
+        return
+
+    # parse only what at least one subscriber asked for
+    fields = merge_fields(
+        [field_masks.get((ws, pv_name)) for ws in targets] + [f for _, f, _ in pv_watchers]
+    )
+    pv_data = parse_pv_data(pv_name, pv_obj, provider, fields)
+    if trace:
+        trace.mark("parsed")
+    for callback, _, watched_pv in pv_watchers:
+        try:
+            callback(watched_pv, pv_data)
+        except Exception as e:
+            print(f"[epicsWS]: Error notifying watcher of {pv_name}: {e}")
+    name = provider_pv_name(provider, pv_name)
+    timestamp = pv_timestamp(pv_data)
+    base_message = build_message(pv_data, name)
+    metadata = None
+    # clients with the same mask share the same encoded frame
+    encoded: Dict[Tuple[Optional[FrozenSet[str]], bool], str] = {}
+    # images are downscaled and encoded once per distinct request
+    images: Dict[ImageRequest, bytes] = {}
+    now = time.monotonic()
+
+    for ws in targets:
+        session = sessions.get(ws)
+        if session is None:
+            continue
         key = (ws, pv_name)
-        message = dict(base_message)
-        if not sent_metadata.get(key):
-            message.update(
-                {
-                    "enumChoices": pv_data.enumChoices,
-                    "display": pv_data.display.__dict__ if pv_data.display else None,
-                    "control": pv_data.control.__dict__ if pv_data.control else None,
-                    "valueAlarm": pv_data.valueAlarm.__dict__ if pv_data.valueAlarm else None,
-                }
-            )
-            sent_metadata[key] = True
-
-        data = json.dumps({k: v for k, v in message.items() if v is not None})
+        if pv_data.image is not None:
+            request = image_requests.get(key, DEFAULT_IMAGE_REQUEST)
+            if request.max_rate and now - image_sent.get(key, 0.0) < 1.0 / request.max_rate:
+                continue
+            image_sent[key] = now
+            if request not in images:
+                images[request] = encode_image(pv_data, name, request)
+            session.enqueue(pv_name, Frame(name, images[request], False, trace, timestamp))
+            scheduler.wake(session)
+            continue
+        with_metadata = not sent_metadata.get(key)
+        mask = field_masks.get(key)
+        data = encoded.get((mask, with_metadata))
+        if data is None:
+            message = dict(base_message)
+            if with_metadata:
+                if metadata is None:
+                    metadata = build_metadata(pv_data)
+                message.update(metadata)
+            data = json.dumps(strip_none(select_fields(message, mask)))
+            encoded[(mask, with_metadata)] = data
+        # metadata is marked as sent by the scheduler, so it survives coalescing
+        session.enqueue(pv_name, Frame(name, data, with_metadata, trace, timestamp))
+        scheduler.wake(session)
+    if trace:
+        trace.mark("encoded")
+
+
+def on_frame_sent(session: ClientSession, pv_name: str, frame: Frame):
+    if frame.metadata and pv_name in session.pvs:
+        sent_metadata[(session.ws, pv_name)] = True
+    trace = frame.trace
+    if trace and "sent" not in trace.times:
+        # latency to the first client receiving the update
+        trace.mark("sent")
+        tracer.finish(trace, frame.pv, frame.timestamp)
+
+
+scheduler = SendScheduler(SCHEDULER_QUANTUM, on_frame_sent)
+
+
+def group_by_protocol(pvs: List[str]) -> Dict[str, List[Tuple[int, str]]]:
+    """Group client PV names by provider, keeping their position in the request"""
+    groups: Dict[str, List[Tuple[int, str]]] = {}
+    for i, pv in enumerate(pvs):
+        protocol, pv_name = parse_protocol(pv)
+        groups.setdefault(protocol, []).append((i, pv_name))
+    return groups
+
+
+async def write_many(writes: List[dict]) -> List[dict]:
+    """Issue a batch of writes, one batched call per provider. Returns per-PV results."""
+    pvs = [w.get("pv") for w in writes]
+    results: List[dict] = [{"pv": pv, "ok": False, "error": "Invalid write"} for pv in pvs]
+    valid = [i for i, w in enumerate(writes) if w.get("pv") and w.get("value") is not None]
+
+    async def run(protocol: str, entries: List[Tuple[int, str]]):
+        try:
+            client = get_client(protocol)
+        except ValueError as e:
+            for i, _ in entries:
+                results[i]["error"] = str(e)
+            return
+        items = [(pv_name, writes[i]["value"]) for i, pv_name in entries]
+        errors = await asyncio.to_thread(client.write_many, items)
+        for (i, _), error in zip(entries, errors):
+            results[i] = {"pv": pvs[i], "ok": error is None, "error": error}
+
+    groups = group_by_protocol([pvs[i] for i in valid])
+    await asyncio.gather(
+        *(
+            run(protocol, [(valid[j], pv_name) for j, pv_name in entries])
+            for protocol, entries in groups.items()
+        )
+    )
+    return [strip_none(r) for r in results]
+
 
+async def get_many(
+    pvs: List[str], fields: Optional[FrozenSet[str]] = None
+) -> List[dict]:
+    """One-shot read of several PVs, one batched call per provider. Returns per-PV results."""
+    results: List[dict] = [{"pv": pv} for pv in pvs]
+
+    async def run(protocol: str, entries: List[Tuple[int, str]]):
         try:
-            await ws.send(data)
-        except Exception:
-            print(f"[epicsWS]: Error sending update to {ws}")
+            client = get_client(protocol)
+        except ValueError as e:
+            for i, _ in entries:
+                results[i]["error"] = str(e)
+            return
+        values = await asyncio.to_thread(client.get_many, [pv_name for _, pv_name in entries])
+        for (i, pv_name), (pv_obj, error) in zip(entries, values):
+            if error is not None:
+                results[i]["error"] = error
+                continue
+            try:
+                pv_data = parse_pv_data(pv_name, pv_obj, protocol, fields)
+            except Exception as e:
+                results[i]["error"] = f"Failed to parse value: {e}"
+                continue
+            message = build_message(pv_data, pvs[i])
+            message.update(build_metadata(pv_data))
+            message.pop("type")
+            results[i] = strip_none(select_fields(message, fields))
+
+    groups = group_by_protocol(pvs)
+    await asyncio.gather(*(run(protocol, entries) for protocol, entries in groups.items()))
+    return results
+
+
+def is_new_channel(pv_name: str) -> bool:
+    """True if subscribing to this PV creates a new upstream channel"""
+    if prewarmer is not None and prewarmer.is_warm(pv_name):
+        return False
+    return pv_name not in subscriptions and pv_name not in watchers
+
+
+@asynccontextmanager
+async def admitted(ws: WebSocketServerProtocol):
+    """
+    Admission control for subscription setups: at most MAX_CONCURRENT_SETUPS run at once, the
+    others wait in line and are told so with a "queued" status message.
+    """
+    global setups_waiting
+    queued = setup_slots.locked()
+    if queued:
+        setups_waiting += 1
+        await ws.send(json.dumps({"type": "status", "status": "queued", "waiting": setups_waiting}))
+    try:
+        async with setup_slots:
+            if queued:
+                setups_waiting -= 1
+                queued = False
+                await ws.send(json.dumps({"type": "status", "status": "admitted"}))
+            yield
+    finally:
+        if queued:
+            setups_waiting -= 1
+
+
+async def subscribe_many(ws: WebSocketServerProtocol, session: ClientSession, msg: dict):
+    """Subscribe a connection to a list of PVs (subscribe message)"""
+    # entries are PV names or {"pv": name, "fields": [...]}; "fields" is the default
+    default_fields = msg.get("fields")
+    for entry in msg.get("pvs", []):
+        if isinstance(entry, dict):
+            pv, fields = entry.get("pv"), entry.get("fields", default_fields)
+        else:
+            pv, fields = entry, default_fields
+        try:
+            mask = parse_fields(fields)
+            image = parse_image_request(entry.get("image") if isinstance(entry, dict) else None)
+        except ValueError as e:
+            await ws.send(json.dumps({"type": "error", "pv": pv, "message": str(e)}))
+            continue
+        protocol, pv_name = parse_protocol(pv)
+        client = get_client(protocol)
+        if not session.can_subscribe(pv_name):
+            message = f"PV quota exceeded ({session.max_pvs} PVs per connection)"
+            await ws.send(json.dumps({"type": "error", "pv": pv, "message": message}))
+            continue
+
+        if protocol in (CA_PROVIDER_KEY, PVA_PROVIDER_KEY) and is_new_channel(pv_name):
+            # creating upstream channels is rate limited, existing ones are shared right away
+            await asyncio.sleep(channel_bucket.delay())
+            channel_bucket.take()
+
+        session.pvs.add(pv_name)
+        if pv_name not in subscriptions:
+            subscriptions[pv_name] = set()
+        subscriptions[pv_name].add(ws)
+        field_masks[(ws, pv_name)] = mask
+        image_requests[(ws, pv_name)] = image
+        client.subscribe(session.client_id, pv_name, mask)
 
 
 async def message_handler(ws: WebSocketServerProtocol):
     client_id = f"{ws.remote_address[0]}:{ws.remote_address[1]}"
     print(f"New connection from {client_id}")
-    loop = asyncio.get_running_loop()
-
-    def ca_callback(pv_name, pv_obj):
-        asyncio.run_coroutine_threadsafe(send_update(pv_name, pv_obj, CA_PROVIDER_KEY), loop)
-
-    def pva_callback(pv_name, pv_obj):
-        asyncio.run_coroutine_threadsafe(send_update(pv_name, pv_obj, PVA_PROVIDER_KEY), loop)
-
-    def get_client(protocol: str):
-        if protocol == PVA_PROVIDER_KEY:
-            if clients[PVA_PROVIDER_KEY] is None:
-                clients[PVA_PROVIDER_KEY] = PVAClient(pva_callback)
-            return clients[PVA_PROVIDER_KEY]
-        elif protocol == CA_PROVIDER_KEY:
-            if clients[CA_PROVIDER_KEY] is None:
-                clients[CA_PROVIDER_KEY] = CAClient(ca_callback)
-            return clients[CA_PROVIDER_KEY]
-        raise ValueError(f"[epicsWS]: Unsupported protocol: {protocol}")
+    session = ClientSession(
+        ws,
+        client_id,
+        client_weight(ws.remote_address[0], CLIENT_WEIGHTS),
+        CLIENT_MAX_PVS,
+        CLIENT_MAX_RATE,
+        CLIENT_MAX_BPS,
+    )
+    sessions[ws] = session
 
     try:
         async for message in ws:
@@ -107,14 +485,8 @@ async def message_handler(ws: WebSocketServerProtocol):
             msg_type = msg.get("type")
 
             if msg_type == "subscribe":
-                for pv in msg.get("pvs", []):
-                    protocol, pv_name = parse_protocol(pv)
-                    client = get_client(protocol)
-
-                    if pv_name not in subscriptions:
-                        subscriptions[pv_name] = set()
-                    subscriptions[pv_name].add(ws)
-                    client.subscribe(client_id, pv_name)
+                async with admitted(ws):
+                    await subscribe_many(ws, session, msg)
 
             elif msg_type == "unsubscribe":
                 for pv in msg.get("pvs", []):
@@ -125,8 +497,13 @@ async def message_handler(ws: WebSocketServerProtocol):
                         subscriptions[pv_name].discard(ws)
                         if not subscriptions[pv_name]:
                             del subscriptions[pv_name]
+                            tracer.forget(provider_pv_name(protocol, pv_name))
                         client.unsubscribe(client_id, pv_name)
+                    session.discard(pv_name)
                     sent_metadata.pop((ws, pv_name), None)
+                    field_masks.pop((ws, pv_name), None)
+                    image_requests.pop((ws, pv_name), None)
+                    image_sent.pop((ws, pv_name), None)
 
             elif msg_type == "write":
                 pv = msg.get("pv")
@@ -136,6 +513,29 @@ async def message_handler(ws: WebSocketServerProtocol):
                     client = get_client(protocol)
                     client.write_to_pv(pv_name, value)
 
+            elif msg_type == "writeMany":
+                results = await write_many(msg.get("writes", []))
+                await ws.send(
+                    json.dumps({"type": "writeManyResult", "id": msg.get("id"), "results": results})
+                )
+
+            elif msg_type == "get":
+                try:
+                    fields = parse_fields(msg.get("fields"))
+                except ValueError as e:
+                    await ws.send(json.dumps({"type": "error", "message": str(e)}))
+                    continue
+                results = await get_many(msg.get("pvs", []), fields)
+                await ws.send(
+                    json.dumps({"type": "getResult", "id": msg.get("id"), "results": results})
+                )
+
+            elif msg_type == "latency":
+                # {"type": "latency", "pvs": [...]} returns the latency histograms (all PVs if
+                # "pvs" is omitted)
+                stats = tracer.snapshot(msg.get("pvs"))
+                await ws.send(json.dumps({"type": "latencyStats", **stats}))
+
             else:
                 await ws.send(json.dumps({"type": "error", "message": "Unknown message type"}))
 
@@ -144,20 +544,55 @@ async def message_handler(ws: WebSocketServerProtocol):
 
     finally:
         print(f"[epicsWS]: Client disconnected: {client_id}")
+        scheduler.remove(session)
+        sessions.pop(ws, None)
         for pv, clients_set in list(subscriptions.items()):
             clients_set.discard(ws)
             if not clients_set:
                 del subscriptions[pv]
             sent_metadata.pop((ws, pv), None)
+            field_masks.pop((ws, pv), None)
+            image_requests.pop((ws, pv), None)
+            image_sent.pop((ws, pv), None)
         for c in clients.values():
             if c:
                 c.unsubscribe_all(client_id)
 
 
+def resolve_prewarm(pv: str):
+    """Provider client and PV name of a PV to pre-warm; only real upstream channels are held"""
+    protocol, pv_name = parse_protocol(pv)
+    if protocol not in (CA_PROVIDER_KEY, PVA_PROVIDER_KEY):
+        return None
+    return get_client(protocol), pv_name
+
+
+async def report_latency():
+    """Periodically print a latency summary while tracing is enabled"""
+    while True:
+        await asyncio.sleep(TRACE_REPORT_INTERVAL)
+        print(f"[LatencyTracer]: {tracer.report()}")
+
+
 async def main():
-    async with websockets.serve(message_handler, "0.0.0.0", 8080):
-        print("[epicsWS]: WebSocket server running on ws://localhost:8080")
-        await asyncio.Future()
+    asyncio.create_task(scheduler.run())
+    global prewarmer
+    if PREWARM_REPOS:
+        prewarmer = PreWarmer(PREWARM_REPOS, resolve_prewarm, PREWARM_RATE, PREWARM_POLL_INTERVAL)
+        asyncio.create_task(prewarmer.run())
+    if tracer.enabled and TRACE_REPORT_INTERVAL > 0:
+        asyncio.create_task(report_latency())
+    # docker stop sends SIGTERM; Ctrl+C cancels main()
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    try:
+        async with websockets.serve(message_handler, "0.0.0.0", 8080):
+            print("[epicsWS]: WebSocket server running on ws://localhost:8080")
+            await stop.wait()
+    finally:
+        if recorder is not None:
+            # flushes the buffered updates, so the recording ends with a complete record
+            recorder.close()
 
 
 if __name__ == "__main__":
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Optional, List, Union, Any
+from typing import Optional, List, Union, Any, FrozenSet, Iterable
 from dataclasses import dataclass
 import math
 import base64
@@ -55,6 +55,27 @@ class ValueAlarm:
     hysteresis: Optional[float] = None
 
 
+@dataclass
+class AlarmSummary:
+    """Summary of an alarm aggregate (not an NT field)"""
+
+    counts: List[int]  # number of members per severity (NO_ALARM, MINOR, MAJOR, INVALID)
+    inAlarm: List[str]
+    members: int
+    connected: int
+
+
+@dataclass
+class ImageInfo:
+    """Geometry of an NTNDArray image (not an NT field)"""
+
+    width: int
+    height: int
+    channels: int  # 1 for mono, 3 for RGB
+    colorMode: int  # areaDetector NDColorMode
+    uniqueId: int = 0
+
+
 @dataclass
 class PVData:
     pv: Optional[str] = None
@@ -67,6 +88,10 @@ class PVData:
     valueAlarm: Optional[ValueAlarm] = None
     b64arr: Optional[str] = None
     b64dtype: Optional[str] = None
+    alarmSummary: Optional[AlarmSummary] = None
+    image: Optional[ImageInfo] = None
+    # numeric array value before encoding, for in-bridge consumers (never sent as is)
+    array: Optional[np.ndarray] = None
 
 
 def encode_base64_array(array: Union[List, np.ndarray], dtype: str) -> str:
@@ -101,6 +126,88 @@ def encode_array(arr: Any) -> tuple[Optional[str], Optional[str]]:
     return None, None
 
 
+# Fields a client can select when subscribing. "value" also covers b64arr/b64dtype.
+ALL_FIELDS: FrozenSet[str] = frozenset(
+    {"value", "enumChoices", "alarm", "timeStamp", "display", "control", "valueAlarm"}
+)
+# Fields only sent on the first update per (client, PV)
+METADATA_FIELDS: FrozenSet[str] = frozenset({"enumChoices", "display", "control", "valueAlarm"})
+
+
+def parse_fields(fields: Optional[Iterable[str]]) -> Optional[FrozenSet[str]]:
+    """Validate a client field mask. None (or empty) means all fields."""
+    if not fields:
+        return None
+    mask = frozenset(fields)
+    unknown = mask - ALL_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return None if mask == ALL_FIELDS else mask
+
+
+def merge_fields(masks: Iterable[Optional[FrozenSet[str]]]) -> Optional[FrozenSet[str]]:
+    """Union of several field masks, None if any of them requests all fields."""
+    merged: FrozenSet[str] = frozenset()
+    for mask in masks:
+        if mask is None:
+            return None
+        merged |= mask
+    return merged
+
+
+def field_wanted(fields: Optional[FrozenSet[str]], field: str) -> bool:
+    return fields is None or field in fields
+
+
+# areaDetector NDColorMode values
+COLOR_MONO = 0
+COLOR_RGB1 = 2  # pixel interleaved, dimensions [3, x, y]
+COLOR_RGB2 = 3  # row interleaved, dimensions [x, 3, y]
+COLOR_RGB3 = 4  # plane interleaved, dimensions [x, y, 3]
+
+
+def is_ndarray(pv_obj) -> bool:
+    return isinstance(pv_obj, p4pValue) and pv_obj.getID().startswith("epics:nt/NTNDArray")
+
+
+def decode_ndarray(pv_obj) -> tuple[Optional[np.ndarray], Optional[ImageInfo]]:
+    """
+    Decode an NTNDArray into an image array of shape (height, width) or (height, width, 3), and
+    its geometry. Returns (None, None) for compressed (codec) or unsupported arrays.
+    """
+    codec = pv_obj.get("codec", {})
+    if codec and codec.get("name"):
+        return None, None
+    data = pv_obj.get("value")
+    sizes = [d.get("size") for d in pv_obj.get("dimension", [])]
+    if not isinstance(data, np.ndarray) or len(sizes) not in (2, 3):
+        return None, None
+
+    color_mode = COLOR_MONO
+    for attribute in pv_obj.get("attribute", []):
+        if attribute.get("name") == "ColorMode":
+            color_mode = int(attribute.get("value") or 0)
+    if len(sizes) == 3 and color_mode not in (COLOR_RGB1, COLOR_RGB2, COLOR_RGB3):
+        # no usable ColorMode attribute: the color dimension is the one of size 3
+        if 3 not in sizes:
+            return None, None
+        color_mode = (COLOR_RGB1, COLOR_RGB2, COLOR_RGB3)[sizes.index(3)]
+    if int(np.prod(sizes)) != data.size:
+        return None, None
+
+    # the first dimension varies fastest
+    image = data.reshape(sizes[::-1])
+    if len(sizes) == 3:
+        if color_mode == COLOR_RGB2:
+            image = image.transpose(0, 2, 1)
+        elif color_mode == COLOR_RGB3:
+            image = image.transpose(1, 2, 0)
+    height, width = image.shape[:2]
+    channels = image.shape[2] if image.ndim == 3 else 1
+    info = ImageInfo(width, height, channels, color_mode, pv_obj.get("uniqueId", 0))
+    return image, info
+
+
 def safe_get_nan(obj, k: str):
     v = obj.get(k)
     return None if isinstance(v, float) and math.isnan(v) else v
@@ -108,74 +215,89 @@ def safe_get_nan(obj, k: str):
 
 class PVParser:
     @staticmethod
-    def from_pva(pv_obj, pv_name: Optional[str] = None) -> PVData:
-        """Converts a p4p NTValue to PVData."""
-        enumChoices = value = b64arr = b64dtype = None
-
-        value_field = pv_obj.get("value")
-
-        if isinstance(value_field, (int, float, str)):
-            value = value_field
-        elif (
-            isinstance(value_field, p4pValue)
-            and value_field.has("index")
-            and value_field.has("choices")
-        ):
-            value = value_field.get("index")
-            enumChoices = value_field.get("choices")
-        elif isinstance(value_field, (list, np.ndarray)):
-            b64arr, b64dtype = encode_array(value_field)
-
-        a = pv_obj.get("alarm", {})
-        alarm = Alarm(
-            severity=a.get("severity", 0),
-            status=a.get("status", 0),
-        )
-
-        ts = pv_obj.get("timeStamp", {})
-        timestamp = TimeStamp(
-            secondsPastEpoch=ts.get("secondsPastEpoch", 0),
-            nanoseconds=ts.get("nanoseconds", 0),
-            userTag=ts.get("userTag", 0),
-        )
-
-        d = pv_obj.get("display", {})
-        display = Display(
-            limitLow=d.get("limitLow"),
-            limitHigh=d.get("limitHigh"),
-            description=d.get("description"),
-            units=d.get("units"),
-            precision=d.get("precision"),
-            form=(d.get("form")).get("index") if d.get("form") else None,
-            choices=(d.get("form")).get("choices") if d.get("form") else None,
-        )
-
-        c = pv_obj.get("control", {})
-        control = Control(
-            limitLow=c.get("limitLow"),
-            limitHigh=c.get("limitHigh"),
-            minStep=c.get("minStep"),
-        )
-
-        va = pv_obj.get("valueAlarm", {})
-
-        value_alarm = ValueAlarm(
-            active=va.get("active"),
-            lowAlarmLimit=safe_get_nan(va, "lowAlarmLimit"),
-            lowWarningLimit=safe_get_nan(va, "lowWarningLimit"),
-            highWarningLimit=safe_get_nan(va, "highWarningLimit"),
-            highAlarmLimit=safe_get_nan(va, "highAlarmLimit"),
-            lowAlarmSeverity=va.get("lowAlarmSeverity"),
-            lowWarningSeverity=va.get("lowWarningSeverity"),
-            highWarningSeverity=va.get("highWarningSeverity"),
-            highAlarmSeverity=va.get("highAlarmSeverity"),
-            hysteresis=va.get("hysteresis"),
-        )
+    def from_pva(
+        pv_obj, pv_name: Optional[str] = None, fields: Optional[FrozenSet[str]] = None
+    ) -> PVData:
+        """Converts a p4p NTValue to PVData. Only the fields in `fields` are parsed (None: all)."""
+        enumChoices = value = b64arr = b64dtype = array = image = None
+        alarm = timestamp = display = control = value_alarm = None
+
+        def wanted(field: str) -> bool:
+            return field_wanted(fields, field)
+
+        if wanted("value") and is_ndarray(pv_obj):
+            # images are sent as binary frames, not base64 (see ImagePipeline)
+            array, image = decode_ndarray(pv_obj)
+        elif wanted("value") or wanted("enumChoices"):
+            value_field = pv_obj.get("value")
+
+            if isinstance(value_field, (int, float, str)):
+                value = value_field
+            elif (
+                isinstance(value_field, p4pValue)
+                and value_field.has("index")
+                and value_field.has("choices")
+            ):
+                value = value_field.get("index")
+                enumChoices = value_field.get("choices")
+            elif isinstance(value_field, (list, np.ndarray)) and wanted("value"):
+                array = np.asarray(value_field)
+                b64arr, b64dtype = encode_array(array)
+
+        if wanted("alarm"):
+            a = pv_obj.get("alarm", {})
+            alarm = Alarm(
+                severity=a.get("severity", 0),
+                status=a.get("status", 0),
+            )
+
+        if wanted("timeStamp"):
+            ts = pv_obj.get("timeStamp", {})
+            timestamp = TimeStamp(
+                secondsPastEpoch=ts.get("secondsPastEpoch", 0),
+                nanoseconds=ts.get("nanoseconds", 0),
+                userTag=ts.get("userTag", 0),
+            )
+
+        if wanted("display"):
+            d = pv_obj.get("display", {})
+            display = Display(
+                limitLow=d.get("limitLow"),
+                limitHigh=d.get("limitHigh"),
+                description=d.get("description"),
+                units=d.get("units"),
+                precision=d.get("precision"),
+                form=(d.get("form")).get("index") if d.get("form") else None,
+                choices=(d.get("form")).get("choices") if d.get("form") else None,
+            )
+
+        if wanted("control"):
+            c = pv_obj.get("control", {})
+            control = Control(
+                limitLow=c.get("limitLow"),
+                limitHigh=c.get("limitHigh"),
+                minStep=c.get("minStep"),
+            )
+
+        if wanted("valueAlarm"):
+            va = pv_obj.get("valueAlarm", {})
+            value_alarm = ValueAlarm(
+                active=va.get("active"),
+                lowAlarmLimit=safe_get_nan(va, "lowAlarmLimit"),
+                lowWarningLimit=safe_get_nan(va, "lowWarningLimit"),
+                highWarningLimit=safe_get_nan(va, "highWarningLimit"),
+                highAlarmLimit=safe_get_nan(va, "highAlarmLimit"),
+                lowAlarmSeverity=va.get("lowAlarmSeverity"),
+                lowWarningSeverity=va.get("lowWarningSeverity"),
+                highWarningSeverity=va.get("highWarningSeverity"),
+                highAlarmSeverity=va.get("highAlarmSeverity"),
+                hysteresis=va.get("hysteresis"),
+            )
 
         return PVData(
             pv=pv_name,
-            value=value,
-            enumChoices=enumChoices,
+            value=value if wanted("value") else None,
+            enumChoices=enumChoices if wanted("enumChoices") else None,
             alarm=alarm,
             timeStamp=timestamp,
             display=display,
@@ -183,11 +305,21 @@ class PVParser:
             valueAlarm=value_alarm,
             b64arr=b64arr,
             b64dtype=b64dtype,
+            image=image,
+            array=array,
         )
 
     @staticmethod
-    def from_ca(pv_obj: dict, pv_name: str) -> PVData:
-        """Converts a dict-based CA response to PVData, ensuring JSON-serializable values."""
+    def from_ca(pv_obj: dict, pv_name: str, fields: Optional[FrozenSet[str]] = None) -> PVData:
+        """
+        Converts a dict-based CA response to PVData, ensuring JSON-serializable values.
+        Only the fields in `fields` are parsed (None: all).
+        """
+        enumChoices = value = b64arr = b64dtype = array = None
+        alarm = timestamp = display = control = value_alarm = None
+
+        def wanted(field: str) -> bool:
+            return field_wanted(fields, field)
 
         def normalize_value(v):
             """Converts numpy types and arrays to JSON-serializable Python types."""
@@ -197,42 +329,51 @@ class PVParser:
                 return v.tolist()
             return v
 
-        value = normalize_value(pv_obj.get("value"))
-
-        b64arr, b64dtype = encode_array(value) if isinstance(value, list) else (None, None)
-
-        enumChoices = pv_obj.get("enum_strs")
-
-        alarm = Alarm(
-            severity=normalize_value(pv_obj.get("severity", 0)),
-            status=normalize_value(pv_obj.get("status", 0)),
-            message=str(pv_obj.get("status", "NO_ALARM")),
-        )
-
-        ts = normalize_value(pv_obj.get("timestamp", 0.0)) or 0.0
-        sec = int(ts)
-        nsec = int((ts - sec) * 1e9)
-        timestamp = TimeStamp(secondsPastEpoch=sec, nanoseconds=nsec)
-
-        display = Display(
-            limitLow=normalize_value(pv_obj.get("lower_disp_limit")),
-            limitHigh=normalize_value(pv_obj.get("upper_disp_limit")),
-            units=pv_obj.get("units"),
-            precision=normalize_value(pv_obj.get("precision")),
-        )
-
-        control = Control(
-            limitLow=normalize_value(pv_obj.get("lower_ctrl_limit")),
-            limitHigh=normalize_value(pv_obj.get("upper_ctrl_limit")),
-        )
-
-        value_alarm = ValueAlarm(
-            lowAlarmLimit=normalize_value(safe_get_nan(pv_obj, "lower_alarm_limit")),
-            highAlarmLimit=normalize_value(safe_get_nan(pv_obj, "upper_alarm_limit")),
-            lowWarningLimit=normalize_value(safe_get_nan(pv_obj, "lower_warning_limit")),
-            highWarningLimit=normalize_value(safe_get_nan(pv_obj, "upper_warning_limit")),
-            hysteresis=normalize_value(safe_get_nan(pv_obj, "hyst")),
-        )
+        if wanted("value"):
+            raw_value = pv_obj.get("value")
+            value = normalize_value(raw_value)
+            b64arr, b64dtype = encode_array(value) if isinstance(value, list) else (None, None)
+            if isinstance(raw_value, np.ndarray):
+                array = raw_value
+
+        if wanted("enumChoices"):
+            enumChoices = pv_obj.get("enum_strs")
+
+        if wanted("alarm"):
+            alarm = Alarm(
+                severity=normalize_value(pv_obj.get("severity", 0)),
+                status=normalize_value(pv_obj.get("status", 0)),
+                message=str(pv_obj.get("status", "NO_ALARM")),
+            )
+
+        if wanted("timeStamp"):
+            ts = normalize_value(pv_obj.get("timestamp", 0.0)) or 0.0
+            sec = int(ts)
+            nsec = int((ts - sec) * 1e9)
+            timestamp = TimeStamp(secondsPastEpoch=sec, nanoseconds=nsec)
+
+        if wanted("display"):
+            display = Display(
+                limitLow=normalize_value(pv_obj.get("lower_disp_limit")),
+                limitHigh=normalize_value(pv_obj.get("upper_disp_limit")),
+                units=pv_obj.get("units"),
+                precision=normalize_value(pv_obj.get("precision")),
+            )
+
+        if wanted("control"):
+            control = Control(
+                limitLow=normalize_value(pv_obj.get("lower_ctrl_limit")),
+                limitHigh=normalize_value(pv_obj.get("upper_ctrl_limit")),
+            )
+
+        if wanted("valueAlarm"):
+            value_alarm = ValueAlarm(
+                lowAlarmLimit=normalize_value(safe_get_nan(pv_obj, "lower_alarm_limit")),
+                highAlarmLimit=normalize_value(safe_get_nan(pv_obj, "upper_alarm_limit")),
+                lowWarningLimit=normalize_value(safe_get_nan(pv_obj, "lower_warning_limit")),
+                highWarningLimit=normalize_value(safe_get_nan(pv_obj, "upper_warning_limit")),
+                hysteresis=normalize_value(safe_get_nan(pv_obj, "hyst")),
+            )
 
         return PVData(
             pv=pv_name,
@@ -245,4 +386,55 @@ class PVParser:
             valueAlarm=value_alarm,
             b64arr=b64arr,
             b64dtype=b64dtype,
+            array=array,
+        )
+
+    @staticmethod
+    def from_aggregate(summary: dict, name: str) -> PVData:
+        """Converts an alarm aggregate snapshot to PVData. The value is the maximum severity."""
+        sec = int(summary["timestamp"])
+        nsec = int((summary["timestamp"] - sec) * 1e9)
+        in_alarm = summary["inAlarm"]
+        return PVData(
+            pv=name,
+            value=summary["maxSeverity"],
+            alarm=Alarm(
+                severity=summary["maxSeverity"],
+                status=0,
+                message=f"{len(in_alarm)} PVs in alarm" if in_alarm else "NO_ALARM",
+            ),
+            timeStamp=TimeStamp(secondsPastEpoch=sec, nanoseconds=nsec),
+            alarmSummary=AlarmSummary(
+                counts=summary["counts"],
+                inAlarm=in_alarm,
+                members=summary["members"],
+                connected=summary["connected"],
+            ),
+        )
+
+    @staticmethod
+    def from_calc(result: dict, name: str) -> PVData:
+        """Converts the result of a computed PV to PVData. Arrays are sent base64 encoded."""
+        value = result["value"]
+        b64arr = b64dtype = array = None
+        if isinstance(value, np.ndarray) and value.ndim > 0:
+            array = value
+            b64arr, b64dtype = encode_array(value)
+            value = None
+        elif isinstance(value, (np.generic, np.ndarray)):
+            value = value.item()
+        if isinstance(value, float) and not math.isfinite(value):
+            value = None
+
+        sec = int(result["timestamp"])
+        nsec = int((result["timestamp"] - sec) * 1e9)
+        message = result["error"] or ("INPUT_ALARM" if result["severity"] else "NO_ALARM")
+        return PVData(
+            pv=name,
+            value=value,
+            alarm=Alarm(severity=result["severity"], status=0, message=message),
+            timeStamp=TimeStamp(secondsPastEpoch=sec, nanoseconds=nsec),
+            b64arr=b64arr,
+            b64dtype=b64dtype,
+            array=array,
         )
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the bridge modules import each other by module name, as when running epicsWS.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,30 @@
+import pytest
+
+from CalcClient import CalcChannel, compile_expression
+from pvParser import PVData
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "{X:PV}+9**9**9",
+        "{X:PV}**{Y:PV}",
+        "{X:PV}**(1+1)",
+        "{X:PV}**100",
+        "{X:PV}+99999999999999999999",
+        "{X:PV}<<3",
+    ],
+)
+def test_unbounded_expressions_are_rejected(expression):
+    with pytest.raises(ValueError):
+        compile_expression(expression)
+
+
+def test_expressions_are_evaluated_in_floats():
+    code, inputs = compile_expression("{X:PV}**2 + 1")
+    channel = CalcChannel("calc", code, inputs)
+    channel.update("X:PV", PVData(value=3))
+    result = channel.evaluate()
+    assert result["value"] == 10.0
+    assert isinstance(result["value"], float)
+    assert result["error"] is None
@@ -0,0 +1,27 @@
+import json
+import struct
+
+import numpy as np
+
+from ImagePipeline import ImageRequest, encode_image, process_image
+from pvParser import ImageInfo, PVData
+
+
+def frame_header(frame: bytes) -> dict:
+    (length,) = struct.unpack_from("<I", frame)
+    return json.loads(frame[4 : 4 + length])
+
+
+def test_binning_averages_blocks():
+    image = np.arange(16, dtype=np.uint16).reshape(4, 4)
+    result, roi, binning = process_image(image, ImageRequest(binning=2))
+    assert result.tolist() == [[2, 4], [10, 12]]
+    assert (roi, binning) == ((0, 0, 4, 4), 2)
+
+
+def test_header_reports_skipped_binning():
+    image = np.arange(16, dtype=np.uint16).reshape(4, 4)
+    request = ImageRequest(roi=(1, 1, 2, 3), binning=4)
+    pv_data = PVData(value=None, array=image, image=ImageInfo(4, 4, 1, 0, 7))
+    header = frame_header(encode_image(pv_data, "test:image", request))
+    assert (header["width"], header["height"], header["binning"]) == (2, 3, 1)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from p4p.client.thread import Context
+from p4p.nt import NTNDArray, NTScalar
+from p4p.server import Server
+from p4p.server.thread import SharedPV
+
+from PVAClient import pv_request
+from pvParser import decode_ndarray
+
+
+@pytest.fixture(scope="module")
+def ctxt():
+    """Client context of an isolated server with an NTNDArray and an NTScalar PV"""
+    providers = {
+        "test:image": SharedPV(
+            nt=NTNDArray(), initial=np.arange(12, dtype=np.uint8).reshape(3, 4)
+        ),
+        "test:ai": SharedPV(nt=NTScalar("d"), initial=1.5),
+    }
+    with Server(providers=[providers], isolate=True) as server:
+        with Context("pva", conf=server.conf(), useenv=False, nt=False) as context:
+            yield context
+
+
+def test_value_mask_keeps_ndarray_decodable(ctxt):
+    value = ctxt.get("test:image", request=pv_request(frozenset({"value"})))
+    image, info = decode_ndarray(value)
+    assert image.tolist() == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11]]
+    assert (info.width, info.height, info.channels) == (4, 3, 1)
+
+
+def test_value_mask_on_scalar(ctxt):
+    value = ctxt.get("test:ai", request=pv_request(frozenset({"value"})))
+    assert value["value"] == 1.5